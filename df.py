@@ -3,8 +3,15 @@
 __author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
 
 
+import sys
+import json
 import argparse
+from functools import partial
 from dfbase import DFbase
+from dfbatch import list_container_ids, read_container_ids, run_batch
+from dfoffline import DOCKER_ROOT, inspect_offline_containers
+from dfoutput import OUTPUT_ARCHIVE, ARCHIVE_PATH, ARCHIVE_STDOUT, COMPRESSION_GZIP, COMPRESSION_ZSTD, \
+                     RECORDS_NDJSON, convert_ndjson_to_json
 from dflogging import *
 
 banner = """ 
@@ -13,21 +20,135 @@ banner = """
 (____/ \__/  \___)(__\_)(____)(__\_)  (__)  \__/(__\_)(____)\_)__)(____/(__)\___)(____/        
  """
 
+def get_archive_path(args):
+    """ ARCHIVE_PATH in effect, from --archive or OUTPUT in config.json
+
+    Returns:
+        str: the path, None if no archive is written
+    """
+    try:
+        with open('config.json') as f:
+            output = json.load(f).get('OUTPUT', {})
+    except (OSError, ValueError):
+        output = {}
+    if args.archive is None and output.get('FORMAT') != OUTPUT_ARCHIVE:
+        return None
+    return args.archive or output.get('ARCHIVE_PATH') or ARCHIVE_PATH
+
+
+def is_archive_on_stdout(args):
+    """ True if the archive is streamed to stdout (--archive - or OUTPUT in config.json) """
+    return get_archive_path(args) == ARCHIVE_STDOUT
+
+
+def check_archive_path(parser, args, several):
+    """ Every container collected needs its own archive, stdout takes only one """
+    archive_path = get_archive_path(args)
+    if several and archive_path is not None and '{}' not in archive_path:
+        parser.error('ARCHIVE_PATH has to contain {} for the container id, and cannot '
+                     'be - (stdout), when several containers are collected')
+
+
 def main():
     """
         After creating an object from the class defined in the DFbase module,
         collect it by calling the object method for collecting the artifact.
     """
 
-    print(banner)
-
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', '--container_id',
-                            required=True, action='store',
+                            action='append', default=[],
                             help='Please specifiy container id you want \
-                            to collect artifacts.')
+                            to collect artifacts. Can be repeated.')
+    parser.add_argument('--all', action='store_true',
+                            help='Collect artifacts of all running containers')
+    parser.add_argument('--label', action='append', default=[],
+                            help='Collect artifacts of running containers \
+                            matching the label filter (key or key=value)')
+    parser.add_argument('--from-file', dest='from_file', action='store',
+                            help='File listing container ids, one per line')
+    parser.add_argument('-w', '--workers', type=int, default=4,
+                            help='Number of containers collected concurrently')
+    parser.add_argument('--archive', nargs='?', const='', default=None,
+                            metavar='ARCHIVE_PATH',
+                            help='Stream artifacts into a compressed tar archive \
+                            instead of loose files. ARCHIVE_PATH may contain {} \
+                            for the container id, or be - for stdout.')
+    parser.add_argument('--compression', choices=[COMPRESSION_GZIP, COMPRESSION_ZSTD],
+                            help='Compression of the archive (default: gzip)')
+    parser.add_argument('--ndjson', action='store_true',
+                            help='Stream list artifacts (whiteout, hidden directory, \
+                            diff, network session) as JSON Lines')
+    parser.add_argument('--incremental', action='store_true',
+                            help='Re-hash and re-copy only entries changed since the \
+                            last collection and write a delta report')
+    parser.add_argument('--offline', nargs='?', const=DOCKER_ROOT, default=None,
+                            metavar='DOCKER_ROOT',
+                            help='Collect filesystem artifacts of every container (or \
+                            those given with -i/--from-file) from a docker data root, \
+                            e.g. of a mounted disk image, without the daemon')
+    parser.add_argument('--since', dest='log_since', metavar='TIME',
+                            help='Extract the json-file log from TIME on (unix time, \
+                            RFC 3339 or relative like 2h) instead of copying it')
+    parser.add_argument('--until', dest='log_until', metavar='TIME',
+                            help='Extract the json-file log up to TIME')
+    parser.add_argument('--tail', dest='log_tail', type=int, metavar='LINES',
+                            help='Extract only the last LINES lines of the json-file log')
+    parser.add_argument('--watch', nargs='?', type=int, const=0, default=None, metavar='SECONDS',
+                            help='Record changes of the writable layer as they happen \
+                            (for SECONDS, or until Ctrl-C) and preserve new executables')
+    parser.add_argument('--memory', action='store_true',
+                            help='Acquire the memory of the container processes')
+    parser.add_argument('--progress', action='store_true',
+                            help='Print collector progress on stderr')
+    parser.add_argument('--convert', action='append', default=[], metavar='NDJSON_FILE',
+                            help='Convert a JSON Lines artifact back to a JSON array and exit')
     args = parser.parse_args()
 
+    # the archive is written to sys.__stdout__, keep messages on stderr then
+    if is_archive_on_stdout(args):
+        sys.stdout = sys.stderr
+
+    print(banner)
+
+    if args.convert:
+        for ndjson_file in args.convert:
+            print('{}[*]{} {}: {} records'.format(DFbase.LOG_DEBUG_COLOR,
+                    DFbase.LOG_INFO_COLOR, ndjson_file, convert_ndjson_to_json(ndjson_file)))
+        exit(0)
+
+    output_options = {}
+    if args.archive is not None:
+        output_options['output_format'] = OUTPUT_ARCHIVE
+        if args.archive:
+            output_options['archive_path'] = args.archive
+    if args.compression:
+        output_options['compression'] = args.compression
+    if args.ndjson:
+        output_options['record_format'] = RECORDS_NDJSON
+    if args.incremental:
+        output_options['incremental'] = True
+    if args.progress:
+        output_options['progress'] = True
+    if args.memory:
+        output_options['memory'] = True
+    for key in ('log_since', 'log_until', 'log_tail'):
+        if getattr(args, key) is not None:
+            output_options[key] = getattr(args, key)
+    if args.offline:
+        output_options['offline'] = True
+        output_options['docker_root'] = args.offline
+
+    container_ids = list(args.container_id)
+    if args.from_file:
+        container_ids += read_container_ids(args.from_file)
+    if (args.all or args.label) and not args.offline:
+        container_ids += list_container_ids(args.label)
+    container_ids = list(dict.fromkeys(container_ids))
+
+    if not container_ids and not args.offline:
+        parser.error('at least one of -i, --all, --label or --from-file is required')
+
     df = DFbase()
 
     if not df.check_privilege():
@@ -39,23 +160,34 @@ def main():
                     'This script should be run with root privilege'))
         exit(0)
 
-    if not df.get_details_using_inspect_command(args.container_id):
+    if args.offline:
+        check_archive_path(parser, args, len(container_ids) != 1)
+        run_batch(container_ids, args.workers, output_options,
+                    partial(inspect_offline_containers, args.offline))
         exit(0)
 
+    if args.watch is not None and (args.offline or len(container_ids) != 1):
+        parser.error('--watch takes a single running container')
+
+    if len(container_ids) > 1 or args.all or args.label or args.from_file:
+        check_archive_path(parser, args, True)
+        run_batch(container_ids, args.workers, output_options)
+        exit(0)
+
+    if not df.get_details_using_inspect_command(container_ids[0]):
+        exit(0)
+
+    for key, value in output_options.items():
+        setattr(df, key, value)
+
     if not df.setup_config():
         exit(0)
 
-    df.save_inspect_for_container()
-    df.get_processes_list_within_container()
-    df.get_timeinfo()
-    df.get_uptime()
-    df.search_whiteout_files()
-    df.copy_files_relatedto_container()
-    df.get_log_on_journald_service()
-    df.search_hidden_directory()
-    df.get_changed_history_using_diff_command()
-    df.get_network_session_list()
-    df.get_passwd_file()
+    if args.watch is not None:
+        df.watch_upper_layer(args.watch)
+        exit(0)
+
+    df.collect_all()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,245 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import json
+import queue
+import socket
+import struct
+import threading
+import http.client
+from urllib.parse import quote, urlencode
+from dflogging import *
+
+
+DOCKER_SOCKET = "/var/run/docker.sock"
+DOCKER_API_TIMEOUT = 120
+DOCKER_API_POOL_SIZE = 8
+
+# Kind of an entry of GET /containers/{id}/changes, as docker diff prints it
+CHANGE_KINDS = {0: 'C', 1: 'A', 2: 'D'}
+
+STREAM_HEADER = struct.Struct('>BxxxL')
+
+
+class DockerAPIError(Exception):
+    """ The Engine API answered with an error status """
+
+    def __init__(self, status, message):
+        super().__init__('{} {}'.format(status, message))
+        self.status = status
+        self.message = message
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """ HTTP connection over a Unix domain socket """
+
+    def __init__(self, socket_path, timeout=DOCKER_API_TIMEOUT):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+def demux_stream(data):
+    """ stdout and stderr of a non-tty exec/attach stream
+
+    Every frame starts with an 8 byte header: stream type (1 stdout,
+    2 stderr), three zero bytes and the payload size. Data without such
+    headers (tty streams) is returned as stdout.
+    Returns:
+        tuple: (stdout, stderr) as bytes
+    """
+    out = {1: [], 2: []}
+    offset = 0
+    while offset + STREAM_HEADER.size <= len(data):
+        stream, size = STREAM_HEADER.unpack_from(data, offset)
+        if stream not in (0, 1, 2) or data[offset + 1:offset + 4] != b'\x00\x00\x00':
+            return data, b''
+        offset += STREAM_HEADER.size
+        out[2 if stream == 2 else 1].append(data[offset:offset + size])
+        offset += size
+    if offset != len(data):
+        return data, b''
+    return b''.join(out[1]), b''.join(out[2])
+
+
+class DockerClient():
+    """ Minimal Docker Engine API client over the Unix socket
+
+    Keep-alive connections are pooled and reused by every collector and,
+    in batch mode, by every container, which avoids a shell and a docker
+    CLI process per request.
+
+    Args:
+        socket_path (str): Unix socket of the docker daemon
+        timeout (int): socket timeout in seconds
+        pool_size (int): idle connections kept for reuse
+    """
+
+    def __init__(self, socket_path=DOCKER_SOCKET, timeout=DOCKER_API_TIMEOUT,
+                    pool_size=DOCKER_API_POOL_SIZE):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.pool = queue.LifoQueue(maxsize=max(1, pool_size))
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+    def get_connection(self):
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                self.connections += 1
+            return UnixHTTPConnection(self.socket_path, self.timeout)
+
+    def put_connection(self, conn):
+        try:
+            self.pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(self, method, path, params=None, body=None):
+        """ Send a request and read the whole response
+
+        A pooled connection the daemon closed in the meantime is replaced
+        once before giving up, for GET only: a POST (exec create, exec
+        start) may have reached the daemon and is never sent twice.
+        Returns:
+            tuple: (status, response body as bytes)
+        """
+        if params:
+            path += '?' + urlencode(params)
+        headers = {'Host': 'docker'}
+        if body is not None:
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+
+        for retry in ((True, False) if method == 'GET' else (False,)):
+            conn = self.get_connection()
+            try:
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if retry:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+
+            with self.lock:
+                self.requests += 1
+            if response.will_close:
+                conn.close()
+            else:
+                self.put_connection(conn)
+            return response.status, data
+
+    def get_json(self, method, path, params=None, body=None):
+        status, data = self.request(method, path, params, body)
+        if status >= 400:
+            try:
+                message = json.loads(data.decode('utf-8')).get('message', '')
+            except ValueError:
+                message = data.decode('utf-8', 'replace')
+            raise DockerAPIError(status, message)
+        return json.loads(data.decode('utf-8')) if data else None
+
+    def ping(self):
+        status, data = self.request('GET', '/_ping')
+        return status == 200
+
+    def containers(self, labels=None):
+        """ Ids of running containers, optionally filtered by labels """
+        params = {}
+        if labels:
+            params['filters'] = json.dumps({'label': list(labels)})
+        return [x['Id'] for x in self.get_json('GET', '/containers/json', params)]
+
+    def inspect(self, container_id):
+        return self.get_json('GET', '/containers/{}/json'.format(quote(container_id, safe='')))
+
+    def top(self, container_id, ps_args):
+        """ Returns:
+                dict: 'Titles' and 'Processes' as docker top prints them
+        """
+        return self.get_json('GET', '/containers/{}/top'.format(quote(container_id, safe='')),
+                                {'ps_args': ps_args})
+
+    def changes(self, container_id):
+        """ Returns:
+                list: 'A /path' lines as docker diff prints them
+        """
+        changes = self.get_json('GET', '/containers/{}/changes'.format(quote(container_id, safe='')))
+        return ['{} {}'.format(CHANGE_KINDS.get(x['Kind'], '?'), x['Path']) for x in changes or []]
+
+    def exec(self, container_id, cmd):
+        """ Run cmd inside the container and wait for it
+
+        Args:
+            cmd (list): command and its arguments
+        Returns:
+            tuple: (stdout, stderr) as bytes
+        """
+        created = self.get_json('POST', '/containers/{}/exec'.format(quote(container_id, safe='')),
+                                body={'AttachStdout': True, 'AttachStderr': True,
+                                      'Tty': False, 'Cmd': cmd})
+        status, data = self.request('POST', '/exec/{}/start'.format(created['Id']),
+                                body={'Detach': False, 'Tty': False})
+        if status >= 400:
+            raise DockerAPIError(status, data.decode('utf-8', 'replace'))
+        return demux_stream(data)
+
+    def get_stats(self):
+        with self.lock:
+            return {'socket': self.socket_path, 'requests': self.requests,
+                    'connections': self.connections}
+
+
+_docker_clients = {}
+_docker_clients_lock = threading.Lock()
+
+
+def get_docker_socket():
+    """ Socket path from DOCKER_HOST (unix:// only), default otherwise """
+    docker_host = os.environ.get('DOCKER_HOST', '')
+    if docker_host.startswith('unix://'):
+        return docker_host[len('unix://'):]
+    return DOCKER_SOCKET
+
+
+def get_docker_client(socket_path=None, timeout=DOCKER_API_TIMEOUT):
+    """ Shared client for socket_path, None if the daemon is not reachable
+
+    Collectors fall back to the docker CLI when None is returned. Only a
+    reachable daemon's client is kept, so a later call tries again.
+    """
+    socket_path = socket_path or get_docker_socket()
+    with _docker_clients_lock:
+        if socket_path in _docker_clients:
+            return _docker_clients[socket_path]
+        client = DockerClient(socket_path, timeout)
+        try:
+            if not client.ping():
+                client = None
+        except Exception as e:
+            log.debug('[*] Docker Engine API on {} is not available, using docker CLI: {}'
+                        .format(socket_path, e))
+            client = None
+        if client is not None:
+            _docker_clients[socket_path] = client
+        return client
@@ -9,28 +9,57 @@ import sys
 import stat
 import time
 import json
-import hashlib
-import re
-from subprocess import Popen, PIPE
+import shlex
+import signal
+import threading
+from subprocess import Popen, PIPE, DEVNULL, TimeoutExpired
 from dflogging import *
+from dfscan import build_layer_scanner, list_regular_files, SCAN_WORKERS, CHANGED_INDEX_MEMORY
+from dfsched import Scheduler, COLLECTORS, STATUS_OK
+from dfproc import collect_processes
+from dfnet import collect_network_sessions
+from dfprobe import probe_proc, build_exec_script, parse_exec_output, new_boundary, \
+                    get_probe_name, PROBE_FILES, PROBE_MODE_PROC, PROBE_MODE_EXEC
+from dfstore import get_artifact_store
+from dfpolicy import AcquisitionPolicy
+from dfjsonlog import list_json_logs, extract_json_log, read_first_time, parse_time_option, JSON_LOG_INDEX_INTERVAL, \
+                      CONTAINER_LOGS_DIR, CONTAINER_LOGS_MANIFEST
+from dfwatch import LayerWatcher, WATCH_BUFFER_SIZE
+from dfbaseline import get_image_baseline, BASELINE_PATH, KNOWN_GOOD
+from dfmemory import dump_processes, MEMORY_DIR, MEMORY_SUMMARY
+from dfjournal import get_journal_cache, get_container_lifetime, JOURNAL_CACHE_PATH, JOURNAL_EXPORT_NAME
+from dfcopy import copy_file
+from dfhash import hash_bytes, HASH_ALGORITHMS, HASH_WORKERS
+from dfoutput import DirectoryOutput, ArchiveOutput, OUTPUT_DIRECTORY, OUTPUT_ARCHIVE, \
+                     COMPRESSION_GZIP, ARCHIVE_PATH, ARCHIVE_STDOUT, get_archive_compression, \
+                     get_archive_extension, RecordWriter, RECORDS_JSON, RECORDS_NDJSON
+from dfapi import get_docker_client
+from dfmetrics import RunMetrics, METRICS_FILE
+from dfoffline import DOCKER_ROOT
+from dfdiff import LowerLayers, LayerDiff, DIFF_ENGINE_NATIVE, DIFF_ENGINE_DOCKER
+from dfindex import SnapshotIndex, INDEX_PATH, CHANGE_ADDED, CHANGE_MODIFIED, CHANGE_DELETED
 
 
 DOCKER_INSPECT_CMD = "docker inspect {}"
 DOCKER_TOP_CMD = "docker top {} -eo user,pid,ppid,stime,command"
 DOCKER_DIFF_CMD = "docker diff {}"
-DOCKER_DATE_CMD = "docker exec -it {} date"
-DOCKER_UPTIME_CMD = "docker exec -it {} uptime"
-DOCKER_CP_FROM_CONTAINER_TO_HOST_CMD = "docker cp {}:{} {}"
+DOCKER_EXEC_SH_CMD = "docker exec {} sh -c {}"
+DOCKER_TOP_PS_ARGS = "-eo user,pid,ppid,stime,command"
 NSENTER_CMD = "nsenter -t {} -n lsof -i"
-READLINK_CMD = "readlink  {}"
 
-LOG_JOURNALD = "journalctl -u docker -o json > {}/jouranld_docker.json"
+TOP_FIELDS = ['USER', 'PID', 'PPID', 'STIME', 'CMD']
+
 
 AUFS_IMAGE_BASE_PATH = "/var/lib/docker/aufs/"
 AUFS_IMAGE_LAYERDB_PATH = "/var/lib/docker/image/aufs/layerdb/mounts/"
-AUFS_WHITEOUT_PREFIX = ".wh."
 
-HIDDEN_DIR_REGX = "^[.\s].*$"
+OBJECTS_PATH = "./artifacts/objects/"
+
+COMMAND_TIMEOUT = 120
+SCHEDULER_WORKERS = 8
+DIFF_CHUNK_SIZE = 1024
+COLLECTOR_TIMEOUT = 600
+
 
 class DFbase():
     LOG_ERROR_COLOR ='\x1b[31;1m'
@@ -46,9 +75,51 @@ class DFbase():
         self.IS_OVERLAYFS = False
         self.IS_AUFSFS = False
         self.overlay_merged_path = ""
+        self.overlay_lowerdir_paths = []
         self.aufs_mnt_path = ""
         self.aufs_container_branch_path = ""
         self.aufs_container_layerdb_path = ""
+        self.layer_scanners = {}
+        self.layer_scanners_lock = threading.Lock()
+        self.command_timeout = COMMAND_TIMEOUT
+        self.scheduler_workers = SCHEDULER_WORKERS
+        self.scan_workers = SCAN_WORKERS
+        self.scan_index_memory = CHANGED_INDEX_MEMORY
+        self.collector_timeout = COLLECTOR_TIMEOUT
+        self.object_refs = {}
+        self.archive_links = {}
+        self.object_refs_lock = threading.Lock()
+        self.output_format = None
+        self.archive_path = None
+        self.compression = None
+        self.record_format = None
+        self.incremental = None
+        self.snapshot = None
+        self.use_docker_api = True
+        self.diff_engine = None
+        self.offline = False
+        self.probe_mode = PROBE_MODE_PROC
+        self.progress = False
+        self.metrics = RunMetrics()
+        self.probe_files = PROBE_FILES
+        self.acquisition_policy = AcquisitionPolicy()
+        self.journal_cache_path = JOURNAL_CACHE_PATH
+        self.log_since = None
+        self.log_until = None
+        self.log_tail = None
+        self.log_index_interval = JSON_LOG_INDEX_INTERVAL
+        self.watch_buffer_size = WATCH_BUFFER_SIZE
+        self.use_baseline = False
+        self.baseline_path = BASELINE_PATH
+        self.baseline_skip_known = True
+        self.baseline = None
+        self.baseline_lock = threading.Lock()
+        self.memory = None
+        self.memory_config = {}
+        self.processes = []
+        self.acquired_executables = {}
+        self.docker_root = DOCKER_ROOT
+        self.docker_socket = None
 
         df_log_initialize()
 
@@ -56,6 +127,106 @@ class DFbase():
         log.debug('{}[*]{} run with GETUID:{}'.format(DFbase.LOG_DEBUG_COLOR, DFbase.LOG_INFO_COLOR, os.getuid()))
         return True if (os.getuid() == 0) else False
 
+    def run_command(self, cmd):
+        """ Run a shell command and wait for it with a timeout
+
+        The command runs in its own session so that a hanging child
+        (e.g. docker exec) is killed together with the shell.
+        Args:
+            cmd (str): shell command line
+        Returns:
+            tuple: (stdout, stderr) as bytes
+        Raises:
+            TimeoutExpired: the command did not finish in time
+        """
+        with self.metrics.timed('subprocesses'):
+            p = Popen(cmd, shell=True, stdout=PIPE, stderr=PIPE, start_new_session=True)
+            try:
+                return p.communicate(timeout=self.command_timeout)
+            except TimeoutExpired:
+                self.kill_command(p)
+                p.communicate()
+                raise
+
+    def stream_command(self, cmd):
+        """ Run a shell command and yield its stdout lines as they arrive
+
+        The command is killed once it has kept the reader waiting for
+        COMMAND_TIMEOUT without a line; the time the consumer spends on
+        each line does not count.
+        Args:
+            cmd (str): shell command line
+        Yields:
+            str: a line of stdout without the trailing newline
+        Raises:
+            TimeoutExpired: the command stalled
+        """
+        with self.metrics.timed('subprocesses'):
+            p = Popen(cmd, shell=True, stdout=PIPE, stderr=DEVNULL, start_new_session=True)
+            # when the reader started waiting for the next line, None while the consumer runs
+            waiting = {'since': time.monotonic()}
+            done = threading.Event()
+
+            def watchdog():
+                while not done.wait(min(1, self.command_timeout)):
+                    since = waiting['since']
+                    if since is not None and time.monotonic() - since > self.command_timeout:
+                        self.kill_command(p)
+                        return
+
+            thread = threading.Thread(target=watchdog, daemon=True)
+            thread.start()
+            try:
+                for line in p.stdout:
+                    waiting['since'] = None
+                    yield line.decode('utf-8', 'replace').rstrip('\n')
+                    waiting['since'] = time.monotonic()
+            finally:
+                done.set()
+                thread.join()
+                p.stdout.close()
+                p.wait()
+        if p.returncode == -signal.SIGKILL:
+            raise TimeoutExpired(cmd, self.command_timeout)
+
+    def kill_command(self, p):
+        try:
+            os.killpg(p.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def get_docker_path(self, path):
+        """ path under /var/lib/docker relocated to docker_root
+
+        In offline mode docker_root is the data root of a mounted image.
+        """
+        if path.startswith(DOCKER_ROOT):
+            return self.docker_root.rstrip('/') + path[len(DOCKER_ROOT):]
+        return path
+
+    def call_docker_api(self, method, *args):
+        """ Call a DockerClient method if the Engine API is usable
+
+        Returns:
+            result of the call, None when the docker CLI has to be used
+        """
+        if self.offline or not self.use_docker_api:
+            return None
+        docker = get_docker_client(self.docker_socket, self.command_timeout)
+        if docker is None:
+            return None
+        try:
+            with self.metrics.timed('api_requests'):
+                return getattr(docker, method)(*args)
+        except Exception as e:
+            log.debug('{}[*]{} Engine API {} failed, using docker CLI: {}'.format(DFbase.LOG_WARNING_COLOR,
+                        DFbase.LOG_INFO_COLOR, method, e))
+            return None
+
+    def open_records(self, name, always=False):
+        """ RecordWriter streaming a list artifact in the configured format """
+        return RecordWriter(self.output, name, self.record_format == RECORDS_NDJSON, always)
+
     def get_details_using_inspect_command(self, container_id):
         """ To get detailed information about container using inspect command
 
@@ -67,9 +238,12 @@ class DFbase():
             bool: True if successful, False otherwise.
         """
 
+        inspect_item = self.call_docker_api('inspect', container_id)
+        if inspect_item is not None:
+            return self.set_inspect_data(inspect_item)
+
         try:
-            p = Popen(DOCKER_INSPECT_CMD.format(container_id), shell=True, stdout=PIPE, stderr=PIPE)
-            data_dump, stderr_data = p.communicate()
+            data_dump, stderr_data = self.run_command(DOCKER_INSPECT_CMD.format(container_id))
             log.debug('{}[*]{} Inspect result:{}'.format(DFbase.LOG_DEBUG_COLOR,
                         DFbase.LOG_INFO_COLOR, 
                         json.dumps(json.loads(data_dump)),indent=4))
@@ -87,6 +261,20 @@ class DFbase():
                         'Please check if container id is valid'))
             return False
 
+        return self.set_inspect_data(self.data[0])
+
+    def set_inspect_data(self, inspect_item):
+        """ Setup container details from a single item of docker inspect output
+
+        Batch collection runs one `docker inspect id1 id2 ...` for every
+        container and hands each item over to its own DFbase object.
+
+        Args:
+            inspect_item (dict): an element of the docker inspect array
+        Returns
+            bool: True if successful, False otherwise.
+        """
+        self.data = [inspect_item]
         self.storage_driver = self.data[0]['Driver']
         self.pid = self.data[0]['State']['Pid']
         self.container_id = self.data[0]['Id']
@@ -97,9 +285,11 @@ class DFbase():
             self.IS_OVERLAYFS = True
             self.overlay_upperdir_path = self.data[0]['GraphDriver']['Data']['UpperDir']
             self.overlay_merged_path = self.data[0]['GraphDriver']['Data']['MergedDir']
+            lowerdir = self.data[0]['GraphDriver']['Data'].get('LowerDir')
+            self.overlay_lowerdir_paths = lowerdir.split(':') if lowerdir else []
         elif self.storage_driver == 'aufs':
             self.IS_AUFSFS = True
-            self.aufs_container_layerdb_path = AUFS_IMAGE_LAYERDB_PATH + self.data[0]['Id']
+            self.aufs_container_layerdb_path = self.get_docker_path(AUFS_IMAGE_LAYERDB_PATH) + self.data[0]['Id']
         else:
             log.debug('{}[*]{} {}'.format(DFbase.LOG_DEBUG_COLOR,
                         DFbase.LOG_INFO_COLOR,
@@ -132,14 +322,84 @@ class DFbase():
                         DFbase.LOG_INFO_COLOR, e))
             return False
 
+        df_log_configure(config)
+
         self.artifacts_path = config['ARTIFACTS']['BASE_PATH'].format(self.container_id)
         self.executable_path = config['ARTIFACTS']['EXECUTABLE_PATH']
         self.executable_path = self.executable_path.replace('BASE_PATH', self.artifacts_path)
         self.diff_files_path = config['ARTIFACTS']['DIFF_FILES_PATH']
         self.diff_files_path = self.diff_files_path.replace('BASE_PATH', self.artifacts_path)
+        self.objects_path = config['ARTIFACTS'].get('OBJECTS_PATH', OBJECTS_PATH)
         self.log_journald = (True if config['ARTIFACTS']['LOG_JOURNALD_SERVICE'] == "TRUE" else False)
+        self.journal_cache_path = config['ARTIFACTS'].get('JOURNAL_CACHE_PATH', JOURNAL_CACHE_PATH)
+
+        container_log = config.get('CONTAINER_LOG', {})
+        if self.log_since is None:
+            self.log_since = container_log.get('SINCE') or None
+        if self.log_until is None:
+            self.log_until = container_log.get('UNTIL') or None
+        if self.log_tail is None:
+            self.log_tail = container_log.get('TAIL') or None
+        self.log_index_interval = container_log.get('INDEX_INTERVAL', JSON_LOG_INDEX_INTERVAL)
+        self.watch_buffer_size = config.get('WATCH', {}).get('BUFFER_SIZE', WATCH_BUFFER_SIZE)
+        baseline = config.get('BASELINE', {})
+        self.use_baseline = (True if baseline.get('ENABLE') == "TRUE" else False)
+        self.baseline_path = baseline.get('PATH', BASELINE_PATH)
+        self.baseline_skip_known = (False if baseline.get('SKIP_KNOWN') == "FALSE" else True)
+        self.memory_config = config.get('MEMORY', {})
+        if self.memory is None:
+            self.memory = (True if self.memory_config.get('ENABLE') == "TRUE" else False)
+        try:
+            if self.log_since is not None:
+                self.log_since = parse_time_option(self.log_since)
+            if self.log_until is not None:
+                self.log_until = parse_time_option(self.log_until)
+        except ValueError as e:
+            print('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR,
+                    DFbase.LOG_INFO_COLOR, e))
+            return False
+        if self.diff_engine is None:
+            self.diff_engine = config['ARTIFACTS'].get('DIFF_ENGINE', DIFF_ENGINE_NATIVE)
+
+        scheduler = config.get('SCHEDULER', {})
+        self.scheduler_workers = scheduler.get('WORKERS', SCHEDULER_WORKERS)
+        self.collector_timeout = scheduler.get('COLLECTOR_TIMEOUT', COLLECTOR_TIMEOUT)
+        self.command_timeout = scheduler.get('COMMAND_TIMEOUT', COMMAND_TIMEOUT)
+        scan = config.get('SCAN', {})
+        self.scan_workers = scan.get('WORKERS', SCAN_WORKERS)
+        self.scan_index_memory = scan.get('INDEX_MEMORY', CHANGED_INDEX_MEMORY)
+
+        probe = config.get('PROBE', {})
+        self.probe_mode = probe.get('MODE', PROBE_MODE_PROC)
+        self.probe_files = probe.get('FILES', PROBE_FILES)
+
+        self.acquisition_policy = AcquisitionPolicy(config.get('ACQUISITION', {}))
+
+        docker = config.get('DOCKER', {})
+        self.use_docker_api = (False if docker.get('API') == "FALSE" else True)
+        self.docker_socket = docker.get('SOCKET', self.docker_socket)
+
+        output = config.get('OUTPUT', {})
+        if self.output_format is None:
+            self.output_format = output.get('FORMAT', OUTPUT_DIRECTORY)
+        if self.compression is None:
+            self.compression = output.get('COMPRESSION', COMPRESSION_GZIP)
+        if self.output_format == OUTPUT_ARCHIVE:
+            self.compression = get_archive_compression(self.compression)
+        if self.record_format is None:
+            self.record_format = output.get('RECORDS', RECORDS_JSON)
+        if self.archive_path is None:
+            self.archive_path = (output.get('ARCHIVE_PATH') or
+                                 ARCHIVE_PATH + get_archive_extension(self.compression))
+        if self.archive_path != ARCHIVE_STDOUT:
+            self.archive_path = self.archive_path.format(self.container_id)
+
+        if self.output_format == OUTPUT_ARCHIVE:
+            create_paths = []
+        else:
+            create_paths = [self.artifacts_path, self.executable_path, self.diff_files_path, self.objects_path]
 
-        for x_path in [self.artifacts_path, self.executable_path, self.diff_files_path]:
+        for x_path in create_paths:
             if not os.path.exists(x_path):
                 try:
                     os.makedirs(x_path, mode=0o700)
@@ -151,14 +411,178 @@ class DFbase():
                             'Failed when creating directory', x_path))
                     return False
 
+        hash_config = config.get('HASH', {})
+        self.store = get_artifact_store(self.objects_path,
+                        hash_config.get('ALGORITHMS', HASH_ALGORITHMS),
+                        hash_config.get('WORKERS', HASH_WORKERS))
+
+        if self.incremental is None:
+            self.incremental = (True if config['ARTIFACTS'].get('INCREMENTAL') == "TRUE" else False)
+        if self.incremental:
+            self.index_path = config['ARTIFACTS'].get('INDEX_PATH', INDEX_PATH).format(self.container_id)
+            try:
+                self.snapshot = SnapshotIndex(self.index_path)
+                self.snapshot.load()
+            except Exception as e:
+                log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR,
+                            DFbase.LOG_INFO_COLOR, e))
+                return False
+
+        if self.output_format == OUTPUT_ARCHIVE:
+            try:
+                self.output = ArchiveOutput(self.archive_path, self.compression, self.container_id)
+            except Exception as e:
+                log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR,
+                            DFbase.LOG_INFO_COLOR, e))
+                return False
+        else:
+            self.output = DirectoryOutput(self.artifacts_path)
+
+        return True
+
+
+    def collect_all(self):
+        """ Run every collector against the container
+
+        Collectors in dfsched.COLLECTORS run concurrently as soon as the
+        collectors they depend on have finished; the status of each one is
+        saved to collector_status.json and their timing and resource use
+        to run_metrics.json. The output is closed at the end.
+        """
+        self.metrics.progress = self.progress
+        self.metrics.total = len(COLLECTORS)
+        self.metrics.label = self.container_id[:12]
+        self.metrics.start_ticker()
+        scheduler = Scheduler(self, COLLECTORS, self.scheduler_workers, self.collector_timeout,
+                                self.offline, self.metrics)
+        status = scheduler.run()
+        scheduler.join()
+
+        self.save_object_refs()
+        # a partial or failed scan would make the next run report everything it missed as deleted
+        if self.snapshot is not None:
+            if status.get('scan_writable_layer', {}).get('status') == STATUS_OK:
+                self.snapshot.save()
+            else:
+                log.debug('{}[*]{} scan did not complete, snapshot index not saved'.format(
+                            DFbase.LOG_ERROR_COLOR, DFbase.LOG_INFO_COLOR))
+        self.output.write_json('collector_status.json', status)
+        self.save_run_metrics(status)
+        self.output.close()
+        for scanner in self.layer_scanners.values():
+            scanner.close()
+
+        return status
+
+
+    def watch_upper_layer(self, duration=0, stop=None):
+        """ Record changes of the writable layer as they happen
+
+        Create, modify, delete, move and (with fanotify) exec events are
+        kept in a ring buffer and written to watch_events.json with the
+        counts in watch_summary.json. Files matching the ACQUISITION types
+        are acquired into watch_files/ on the hash pool as soon as they
+        are written, moved in or executed, before they can be deleted.
+        Args:
+            duration (int): seconds to watch, 0 until interrupted
+            stop (threading.Event): ends the watch when set
+        Returns:
+            bool: True if successful, False otherwise.
+        """
+        if self.IS_OVERLAYFS:
+            path = self.get_overlay_upperlayer_path()
+        elif self.IS_AUFSFS:
+            path = self.get_aufs_container_branch_path()
+        else:
+            return False
+
+        watch_path = self.artifacts_path + '/watch_files/'
+        if self.output_format != OUTPUT_ARCHIVE:
+            os.makedirs(watch_path, mode=0o700, exist_ok=True)
+        preserved = []
+        seen = set()
+
+        def preserve(filepath, relpath):
+            # opened on the event thread, the pool reads this very file even if it is gone by then
+            try:
+                fd = os.open(filepath, os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK | os.O_CLOEXEC)
+            except OSError:
+                return
+            try:
+                st = os.fstat(fd)
+                key = (relpath, st.st_ino, st.st_mtime_ns, st.st_size)
+                if key in seen or not stat.S_ISREG(st.st_mode):
+                    return
+                seen.add(key)
+                fd_path = '/proc/self/fd/{}'.format(fd)
+                file_type = self.acquisition_policy.get_type(fd_path, st)
+                if file_type is None or not self.acquisition_policy.match_path(relpath):
+                    return
+                future = self.store.engine.executor.submit(self.metrics.wrap(acquire),
+                            filepath, fd, relpath, st)
+                fd = None
+                preserved.append((relpath, file_type, time.time(), future))
+            finally:
+                if fd is not None:
+                    os.close(fd)
+
+        def acquire(filepath, fd, relpath, st):
+            try:
+                return self.acquire_file(filepath, watch_path, 'watch', relpath, st,
+                                            '/proc/self/fd/{}'.format(fd))
+            finally:
+                os.close(fd)
+
+        try:
+            watcher = LayerWatcher(path, preserve, self.watch_buffer_size).start()
+        except OSError as e:
+            log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR,
+                        DFbase.LOG_INFO_COLOR, e))
+            return False
+
+        print('{}[*]{} watching {} ({} directories), Ctrl-C to stop'.format(DFbase.LOG_DEBUG_COLOR,
+                DFbase.LOG_INFO_COLOR, watcher.root, len(watcher.watches)))
+        try:
+            watcher.run(duration, stop)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+
+        writer = self.open_records('watch_events')
+        for event_time, kind, relpath in watcher.events:
+            writer.write({'time': time.ctime(event_time), 'timestamp': event_time,
+                            'event': kind, 'path': relpath})
+        writer.close()
+
+        summary = watcher.get_summary()
+        summary['preserved'] = []
+        for relpath, file_type, preserved_time, future in preserved:
+            item = {'path': relpath, 'file_type': file_type, 'time': time.ctime(preserved_time)}
+            item.update(future.result())
+            summary['preserved'].append(item)
+        self.output.write_json('watch_summary.json', summary)
+        self.save_object_refs()
+        self.output.close()
+
         return True
 
+    def save_run_metrics(self, status):
+        report = self.metrics.get_report()
+        report['container_id'] = self.container_id
+        for name, entry in report['collectors'].items():
+            entry['status'] = status.get(name, {}).get('status', '')
+        # the hash engine is shared by the containers using the same store
+        report['process']['hash'] = self.store.engine.get_stats()
+        self.output.write_json(METRICS_FILE, report)
+        log.debug('{}[*]{} run metrics: {}s wall, {}s cpu, {} subprocesses'.format(DFbase.LOG_DEBUG_COLOR,
+                    DFbase.LOG_INFO_COLOR, report['wall_seconds'], report['cpu_seconds'],
+                    report['counters'].get('subprocesses', 0)))
+
 
     def save_inspect_for_container(self):
-        inspect_output = self.artifacts_path + '/' + 'inspect_command.json'
         try:
-            with open(inspect_output, 'w') as f:
-                json.dump(self.data, f, indent=4)
+            self.output.write_json('inspect_command.json', self.data)
         except Exception as e:
                 log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR,
                             DFbase.LOG_INFO_COLOR, e))
@@ -168,20 +592,98 @@ class DFbase():
 
     def get_processes_list_within_container(self):
         """ Get process list within container
+
+        Processes are read natively from /proc for every pid in the
+        container's cgroup; docker top is used only if the cgroup cannot
+        be resolved.
             Retruns
                 bool: True if successful, False otherwise.
         """
+        items_list = collect_processes(self.pid)
+        if items_list:
+            log.debug('{}[*]{} {} processes collected from /proc'.format(DFbase.LOG_DEBUG_COLOR,
+                        DFbase.LOG_INFO_COLOR, len(items_list)))
+        else:
+            items_list = self.get_processes_using_top_command()
+            if items_list is None:
+                return False
+
+        self.output.write_json('top_command.json', [{x: proc[x] for x in TOP_FIELDS} for proc in items_list])
+        self.processes = items_list
+
+        self.copy_executable(items_list)
+
+        return True
+
+
+    def dump_process_memory(self):
+        """ Acquire the memory of the container's processes (MEMORY in config.json)
+
+        Selected regions of /proc/<pid>/mem are written to
+        memory/<pid>.mem.gz, processes in parallel, with the sizes capped
+        per process and for the run; memory.json lists the regions read
+        and skipped for every process.
+            Returns
+                bool: True if successful, False otherwise.
+        """
+        if not self.memory:
+            log.debug('{}[*]{} {}'.format(DFbase.LOG_DEBUG_COLOR,
+                        DFbase.LOG_INFO_COLOR, 'Memory acquisition is disabled'))
+            return True
+
+        pids = []
+        for proc in self.processes:
+            try:
+                pids.append(int(proc.get('PID')))
+            except (TypeError, ValueError):
+                continue
+
+        get_name = lambda pid: '{}/{}.mem.gz'.format(MEMORY_DIR, pid)
+        results = dump_processes(pids, lambda x: self.output.get_command_path(get_name(x)),
+                        self.store.engine.algorithms, self.memory_config, acquired=self.acquired_executables)
+
+        writer = self.open_records('memory')
+        summary = {'processes': len(results), 'failed': 0, 'truncated': 0, 'read_bytes': 0, 'stored_bytes': 0}
+        for item in results:
+            if 'error' in item:
+                summary['failed'] += 1
+            else:
+                item['name'] = get_name(item['pid'])
+                self.output.commit_command_file(item['name'])
+            if 'truncated' in item:
+                summary['truncated'] += 1
+            summary['read_bytes'] += item['read_bytes']
+            summary['stored_bytes'] += item['stored_bytes']
+            writer.write(item)
+        writer.close()
+
+        self.metrics.count('memory_bytes_read', summary['read_bytes'])
+        self.metrics.count('memory_bytes_stored', summary['stored_bytes'])
+        self.output.write_json(MEMORY_SUMMARY, summary)
+        return True
+
+
+    def get_processes_using_top_command(self):
+        """ Get process list within container using docker top command
+            Retruns
+                list: process items, None if docker top failed
+        """
         items_list = []
         proc_item = []
         procs_dict = {}
 
+        top = self.call_docker_api('top', self.container_id, DOCKER_TOP_PS_ARGS)
+        if top is not None:
+            for x in top.get('Processes') or []:
+                items_list.append(dict(zip(TOP_FIELDS, x)))
+            return items_list
+
         try:
-            p = Popen(DOCKER_TOP_CMD.format(self.container_id), shell=True, stdout=PIPE, stderr=PIPE)
-            stdout_dump, stderr_data = p.communicate()
+            stdout_dump, stderr_data = self.run_command(DOCKER_TOP_CMD.format(self.container_id))
         except Exception as e:
             log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR,
                         DFbase.LOG_INFO_COLOR,e))
-            return False
+            return None
 
         procs_lines = stdout_dump.decode('utf-8')
         procs_lines = procs_lines.split("\n")
@@ -194,8 +696,8 @@ class DFbase():
 
         for item in proc_item:
             x = item.split(None, 4)
-            log.debug('{}[*]{} PID:{}, {}, {}, {}, {}'.format(DFbase.LOG_DEBUG_COLOR, 
-                        DFbase.LOG_INFO_COLOR, x[0], x[1],x[2],x[3],x[4]))
+            log.log(TRACE, '%s[*]%s PID:%s, %s, %s, %s, %s', DFbase.LOG_DEBUG_COLOR,
+                        DFbase.LOG_INFO_COLOR, x[0], x[1],x[2],x[3],x[4])
             procs_dict['USER'] = x[0]
             procs_dict['PID'] = x[1]
             procs_dict['PPID'] = x[2]
@@ -204,90 +706,218 @@ class DFbase():
 
             items_list.append(procs_dict.copy())
 
-        procs_path = self.artifacts_path + '/' + 'top_command.json'
-        with open(procs_path, 'w') as f:
-            json.dump(items_list, f, indent=4)
-
-        self.copy_executable(items_list)
-
-        return True
+        return items_list
 
 
     def copy_executable(self, procs_list):
         proc_list = []
-        md5sum = ""
-        for proc in procs_list:
-            proc_path = '/proc/' + proc.get('PID') + '/exe'
-            try:
-                p = Popen(READLINK_CMD.format(proc_path), shell=True, stdout=PIPE, stderr=PIPE)
-                stdout_dump, stderr_data = p.communicate()
-            except Excpetion as e:
-                log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR, 
-                            DFbase.LOG_INFO_COLOR, e))
-                continue
 
-            exe_path = stdout_dump.decode('utf-8')
-
-            if exe_path and self.IS_OVERLAYFS:
-                if os.path.isfile('{}{}'.format(self.overlay_merged_path, exe_path.strip('\n'))):
-                    md5sum = self.get_md5sum('{}{}'.format(self.overlay_merged_path, exe_path.strip('\n')))
-                    log.debug('{}[*]{} md5sum:{}'.format(DFbase.LOG_DEBUG_COLOR, 
-                                DFbase.LOG_INFO_COLOR, md5sum))
-                    COPY_CMD = 'cp -f {}{} {}{}_{}'.format(self.overlay_merged_path, exe_path.strip('\n'), self.executable_path,exe_path.rsplit('/', 1)[1].strip('\n'), md5sum)
-                    log.debug('{}[*]{} PID:{}, CMD:{}'.format(DFbase.LOG_DEBUG_COLOR, 
-                                DFbase.LOG_INFO_COLOR, proc.get('PID'), COPY_CMD))
-                    os.system(COPY_CMD)
-                    proc['EXECUTABLE'] = '{}{}'.format(self.overlay_merged_path, exe_path.strip('\n'))
-                else:
-                    proc['EXECUTABLE'] = 'NOT FOUND - {}{}'.format(self.overlay_merged_path, exe_path.strip('\n'))
-
-            elif exe_path and self.IS_AUFSFS:
-                self.aufs_mnt_path = self.get_aufs_container_mnt_path()
-                if os.path.isfile('{}{}'.format(self.aufs_mnt_path, exe_path.strip('\n'))):
-                    self.aufs_mnt_path = self.get_aufs_container_mnt_path()
-                    md5sum = self.get_md5sum('{}{}'.format(self.aufs_mnt_path,  exe_path.strip('\n')))
-                    log.debug('{}[*]{} md5sum:{}'.format(DFbase.LOG_DEBUG_COLOR, 
-                                DFbase.LOG_INFO_COLOR, md5sum))
-                    COPY_CMD = 'cp -f {}{} {}{}_{}'.format(self.aufs_mnt_path, exe_path.strip('\n'), self.executable_path, exe_path.rsplit('/', 1)[1].strip('\n'), md5sum)
-                    log.debug('{}[*]{} PID:{}, CMD:{}'.format(DFbase.LOG_DEBUG_COLOR, 
-                                DFbase.LOG_INFO_COLOR, proc.get('PID'), COPY_CMD))
-                    os.system(COPY_CMD)
-                    proc['EXECUTABLE'] = '{}{}'.format(self.aufs_mnt_path, exe_path.strip('\n'))
-                else:
-                    proc['EXECUTABLE'] = 'NOT FOUND - {}{}'.format(self.aufs_mnt_path, exe_path.strip('\n'))
+        if self.IS_OVERLAYFS:
+            root_path = self.overlay_merged_path
+        elif self.IS_AUFSFS:
+            self.aufs_mnt_path = self.get_aufs_container_mnt_path()
+            root_path = self.aufs_mnt_path
 
-            proc['MD5'] = md5sum
+        for proc in procs_list:
+            if 'EXE' in proc:
+                exe_path = proc['EXE']
+            else:
+                proc_path = '/proc/' + proc.get('PID') + '/exe'
+                try:
+                    exe_path = os.readlink(proc_path)
+                except Exception as e:
+                    log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR, 
+                                DFbase.LOG_INFO_COLOR, e))
+                    continue
+
+            exe_path = exe_path.strip('\n')
+            proc['MD5'] = ""
+            if exe_path and (self.IS_OVERLAYFS or self.IS_AUFSFS):
+                fullpath = '{}{}'.format(root_path, exe_path)
+                if os.path.isfile(fullpath):
+                    proc['EXECUTABLE'] = fullpath
+                else:
+                    proc['EXECUTABLE'] = 'NOT FOUND - {}'.format(fullpath)
             proc_list.append(proc.copy())
 
-        procs_path = self.artifacts_path + '/' + 'process.json'
-        with open(procs_path, 'w') as f:
-            json.dump(proc_list, f, indent=4)
+        # executables are hashed and stored concurrently on the hash pool
+        acquire_list = [x for x in proc_list if x.get('EXECUTABLE', '').startswith('/')]
+        baseline = self.load_image_baseline()
+        results = self.store.engine.map(self.metrics.wrap(lambda x: self.acquire_unless_known(baseline,
+                        x['EXECUTABLE'], x['EXECUTABLE'][len(root_path):], self.executable_path,
+                        'process', x.get('PID'))), acquire_list)
+        for proc, (status, digests) in zip(acquire_list, results):
+            log.log(TRACE, '%s[*]%s PID:%s, digests:%s', DFbase.LOG_DEBUG_COLOR,
+                        DFbase.LOG_INFO_COLOR, proc.get('PID'), digests)
+            if status is not None:
+                proc['BASELINE'] = status
+            if 'error' in digests:
+                proc['ERROR'] = digests['error']
+            else:
+                if not (self.baseline_skip_known and status in KNOWN_GOOD):
+                    # stored, so dump_process_memory leaves its mappings out
+                    try:
+                        self.acquired_executables[int(proc.get('PID'))] = {proc['EXECUTABLE'][len(root_path):]}
+                    except (TypeError, ValueError):
+                        pass
+                proc['MD5'] = digests['md5']
+                proc['SHA1'] = digests.get('sha1', '')
+                proc['SHA256'] = digests.get('sha256', '')
+                if 'digest_source' in digests:
+                    proc['DIGEST_SOURCE'] = digests['digest_source']
+
+        self.output.write_json('process.json', proc_list)
 
         return True
 
 
-    def get_aufs_container_mnt_path(self):
-        mountid_file = self.aufs_container_layerdb_path + '/mount-id'
-        with open(mountid_file, 'r') as fd:
-            line = fd.readline()
-        return AUFS_IMAGE_BASE_PATH + 'mnt/' + line
+    def acquire_file(self, filepath, link_path, ref_type, ref, st=None, read_path=None):
+        """ Store a file in the content-addressed artifact store
 
-    def get_md5sum(self, filepath):
-        log.debug('{}[*]{} md5sum target file:{}'.format(DFbase.LOG_DEBUG_COLOR, 
-                    DFbase.LOG_INFO_COLOR, filepath))
-        md5sum = hashlib.md5()
+        The file is hashed and copied only once per inode and once per
+        digest; link_path gets a <name>_<md5> hard link to the object and
+        the reference is recorded in objects.json.
+        Args:
+            filepath (str): file to acquire
+            link_path (str): executable_path or diff_files_path
+            ref_type (str): 'process' or 'diff'
+            ref (str): pid or container path referring to the file
+            st (os.stat_result): stat of filepath if already known
+            read_path (str): where the content is read from instead of
+                             filepath, e.g. /proc/self/fd/<fd> of an open file
+        Returns:
+            dict: digests by algorithm name, {'error': reason} on failure
+        """
+        read_path = read_path or filepath
         try:
-            with open(filepath, 'rb') as f:
-                while True:
-                    data = f.read(4096)
-                    if not data:
-                        break
-                    md5sum.update(data)
+            if st is None:
+                st = os.stat(read_path)
+            if self.snapshot is not None:
+                unchanged = self.snapshot.get_unchanged_digests(filepath, st)
+                if unchanged is not None:
+                    self.store.seed(st, unchanged)
+            if self.output_format == OUTPUT_ARCHIVE:
+                digests, object_path = self.acquire_file_into_archive(filepath, link_path, st, read_path)
+            else:
+                digests, object_path = self.store.put(read_path, st)
         except Exception as e:
-            print(e)
-            return False
+            log.debug('{}[*]{} {}: {}'.format(DFbase.LOG_ERROR_COLOR,
+                        DFbase.LOG_INFO_COLOR, filepath, e))
+            return {'error': str(e)}
+
+        if self.snapshot is not None:
+            self.snapshot.set_digests(filepath, st, digests)
+        self.metrics.count('files_acquired')
+        self.metrics.count('bytes_acquired', digests.get('size', 0))
+
+        md5sum = digests['md5']
+        if self.output_format != OUTPUT_ARCHIVE:
+            link_name = '{}{}_{}'.format(link_path, filepath.rsplit('/', 1)[1], md5sum)
+            if os.path.exists(link_name) and not os.path.samefile(link_name, object_path):
+                # same name and md5, different content: never shadow it
+                link_name = '{}_{}'.format(link_name, digests['sha256'])
+            if not os.path.exists(link_name):
+                try:
+                    os.link(object_path, link_name)
+                except FileExistsError:
+                    pass
+                except OSError:
+                    # object store on another filesystem
+                    copy_file(object_path, link_name)
+
+        with self.object_refs_lock:
+            refs = self.object_refs.setdefault(digests['sha256'], dict(digests, object=object_path, refs=[]))
+            refs['refs'].append({'type': ref_type, 'ref': ref, 'source': filepath})
 
-        return md5sum.hexdigest()
+        return digests
+
+
+    def load_image_baseline(self):
+        """ ImageBaseline of the container's lower layers, None if disabled
+
+        Layers are indexed on first use (see dfbaseline.LayerBaseline), so
+        this is called before files are handed to the hash pool.
+        """
+        with self.baseline_lock:
+            if self.baseline is None and self.use_baseline and (self.IS_OVERLAYFS or self.IS_AUFSFS):
+                try:
+                    if self.IS_OVERLAYFS:
+                        upper = self.get_overlay_upperlayer_path()
+                    else:
+                        upper = self.get_aufs_container_branch_path()
+                    with self.metrics.timed('baseline'):
+                        self.baseline = get_image_baseline(upper, self.get_lower_layer_paths(), self.IS_AUFSFS,
+                                            self.baseline_path, self.acquisition_policy, self.store.engine,
+                                            self.scan_workers)
+                except Exception as e:
+                    log.debug('{}[*]{} image baseline is not available: {}'.format(DFbase.LOG_WARNING_COLOR,
+                                DFbase.LOG_INFO_COLOR, e))
+                    self.use_baseline = False
+            return self.baseline
+
+    def acquire_unless_known(self, baseline, filepath, relpath, link_path, ref_type, ref, st=None):
+        """ acquire_file, unless the image baseline shows the file is the image's
+
+        With SKIP_KNOWN, files served from the image, unchanged from it or
+        identical to another image file are only hashed (or not read at
+        all if served from an indexed layer).
+        Returns:
+            tuple: (baseline status or None, dict of digests)
+        """
+        if baseline is None:
+            return None, self.acquire_file(filepath, link_path, ref_type, ref, st)
+        try:
+            if st is None:
+                st = os.stat(filepath)
+            status, digests = baseline.triage(relpath, filepath, st, self.store.hash)
+        except Exception as e:
+            log.debug('{}[*]{} {}: {}'.format(DFbase.LOG_ERROR_COLOR,
+                        DFbase.LOG_INFO_COLOR, filepath, e))
+            return None, self.acquire_file(filepath, link_path, ref_type, ref, st)
+
+        self.metrics.count('baseline_' + status)
+        if self.baseline_skip_known and status in KNOWN_GOOD:
+            return status, digests
+        return status, self.acquire_file(filepath, link_path, ref_type, ref, st)
+
+
+    def acquire_file_into_archive(self, filepath, link_path, st=None, read_path=None):
+        """ Stream a file into the archive once per digest
+
+        The digest names the member, so the file is hashed (once per inode
+        by the store) before it is streamed into the archive.
+        Returns:
+            tuple: (dict of digests, member name of the object)
+        """
+        read_path = read_path or filepath
+        digests = self.store.hash(read_path, st)
+        object_name = 'objects/{}'.format(digests['sha256'])
+        self.output.add_file_once(read_path, object_name)
+        link_name = '{}/{}_{}'.format(os.path.relpath(link_path, self.artifacts_path),
+                        filepath.rsplit('/', 1)[1], digests['md5'])
+        with self.object_refs_lock:
+            if self.archive_links.setdefault(link_name, object_name) != object_name:
+                # same name and md5, different content: never shadow it
+                link_name = '{}_{}'.format(link_name, digests['sha256'])
+        self.output.add_link(object_name, link_name)
+        return digests, object_name
+
+
+    def save_object_refs(self):
+        with self.object_refs_lock:
+            self.output.write_json('objects.json', self.object_refs)
+
+        stats = self.store.engine.get_stats()
+        log.debug('{}[*]{} hash throughput:{}'.format(DFbase.LOG_DEBUG_COLOR,
+                    DFbase.LOG_INFO_COLOR, stats))
+        self.output.write_json('hash_stats.json', stats)
+
+
+    def get_aufs_container_mnt_path(self):
+        mountid_file = self.aufs_container_layerdb_path + '/mount-id'
+        with open(mountid_file, 'r') as fd:
+            line = fd.readline()
+        return self.get_docker_path(AUFS_IMAGE_BASE_PATH) + 'mnt/' + line
 
     def search_whiteout_files(self):
         if self.IS_OVERLAYFS:
@@ -304,75 +934,256 @@ class DFbase():
         mountid_file = self.aufs_container_layerdb_path + '/mount-id'
         with open(mountid_file, 'r') as fd:
             line = fd.readline()
-        return AUFS_IMAGE_BASE_PATH + 'diff/' + line
+        return self.get_docker_path(AUFS_IMAGE_BASE_PATH) + 'diff/' + line
+
+    def get_lower_layer_paths(self):
+        """ Read-only layers of the container, topmost first
+
+        Overlay lists them in LowerDir of docker inspect, AUFS in
+        /var/lib/docker/aufs/layers/<mount-id>.
+        """
+        if self.IS_OVERLAYFS:
+            return self.overlay_lowerdir_paths
+        mountid_file = self.aufs_container_layerdb_path + '/mount-id'
+        with open(mountid_file, 'r') as fd:
+            mount_id = fd.readline().strip()
+        aufs_path = self.get_docker_path(AUFS_IMAGE_BASE_PATH)
+        with open(aufs_path + 'layers/' + mount_id, 'r') as fd:
+            return [aufs_path + 'diff/' + x.strip() for x in fd if x.strip()]
+
+    def get_native_diff(self, scanner):
+        """ docker diff lines derived from the layers, without the daemon """
+        lower = LowerLayers(self.get_lower_layer_paths(), aufs=self.IS_AUFSFS)
+        return LayerDiff(scanner, lower, aufs=self.IS_AUFSFS).changes()
+
+    def scan_upper_layer(self, arg_path):
+        """ Walk the writable layer once and cache the result
+
+        Whiteout, opaque/hidden directory and diff metadata collectors all
+        share the same LayerScanner, so each inode is stat'ed only once.
+        Args:
+            arg_path (str): UpperDir of overlay or diff branch of AUFS
+        Returns:
+            LayerScanner: scanner holding the results of every detector
+        """
+        with self.layer_scanners_lock:
+            if arg_path not in self.layer_scanners:
+                scanner = build_layer_scanner(arg_path, aufs=self.IS_AUFSFS, workers=self.scan_workers,
+                                                max_memory=self.scan_index_memory)
+                scanner.scan()
+                self.metrics.count('files_visited', scanner.visited)
+                log.debug('{}[*]{} Scanned {} entries on {}'.format(DFbase.LOG_DEBUG_COLOR,
+                            DFbase.LOG_INFO_COLOR, scanner.visited, arg_path))
+                self.layer_scanners[arg_path] = scanner
+        return self.layer_scanners[arg_path]
+
+    def scan_writable_layer(self):
+        """ Collector wrapper of scan_upper_layer for the container's layer """
+        if self.IS_OVERLAYFS:
+            path = self.get_overlay_upperlayer_path()
+        elif self.IS_AUFSFS:
+            path = self.get_aufs_container_branch_path()
+        else:
+            return False
+        scanner = self.scan_upper_layer(path)
+        if self.snapshot is not None:
+            self.save_delta_since_last_run(scanner)
+        return True
+
+    def save_delta_since_last_run(self, scanner):
+        """ Write what changed on the writable layer since the last collection
+
+        Every entry of the scan is compared with the snapshot index of the
+        previous run; added, modified and deleted entries are written to
+        delta.json and the counts to delta_summary.json.
+        """
+        root = scanner.root.rstrip('/')
+        entries = ((root + relpath, st) for relpath, st in scanner.get('changed').items())
+        delta_info = {}
+        writer = self.open_records('delta')
+        for change, path, st in self.snapshot.compare(entries):
+            delta_info['change'] = change
+            delta_info['fullpath'] = path
+            delta_info['mtime'] = time.ctime(st.st_mtime) if st else "Null"
+            delta_info['size'] = st.st_size if st else "Null"
+            writer.write(delta_info)
+        writer.close()
+
+        self.output.write_json('delta_summary.json', {
+            'previous_run': self.snapshot.previous_run,
+            'added': self.snapshot.delta[CHANGE_ADDED],
+            'modified': self.snapshot.delta[CHANGE_MODIFIED],
+            'deleted': self.snapshot.delta[CHANGE_DELETED],
+        })
 
     def search_files_with_character_device(self, arg_path):
-        overlay_wh_list = []
         overlay_whiteout = {}
-        for dirpath, dirs, files in os.walk(arg_path):
-            for filename in files:
-                fname = os.path.join(dirpath, filename)
-                mode = os.stat(fname).st_mode
-                if stat.S_ISCHR(mode):
-                    log.debug('[Found] Character device file: {}, mtime:{}, size:{}'.format(fname, time.ctime(
-                        os.stat(fname).st_mtime), os.stat(fname).st_size))
-                    overlay_whiteout['file_type'] = 'CHARDEV'
-                    overlay_whiteout['fname'] = fname
-                    overlay_whiteout['mtime'] = time.ctime(os.stat(fname).st_mtime)
-                    overlay_whiteout['size'] = os.stat(fname).st_size
-                    overlay_wh_list.append(overlay_whiteout.copy())
-
-        overlay_wh_path = self.artifacts_path + '/' + 'whiteout.json'
-        if len(overlay_wh_list):
-            with open(overlay_wh_path, 'w') as f:
-                json.dump(overlay_wh_list, f, indent=4)
+        writer = self.open_records('whiteout')
+        scanner = self.scan_upper_layer(arg_path)
+        for entry in scanner.get('whiteout').results:
+            log.log(TRACE, '[Found] Character device file: %s, mtime:%s, size:%s', entry.path,
+                        entry.st.st_mtime, entry.st.st_size)
+            overlay_whiteout['file_type'] = 'CHARDEV'
+            overlay_whiteout['fname'] = entry.path
+            overlay_whiteout['mtime'] = time.ctime(entry.st.st_mtime)
+            overlay_whiteout['size'] = entry.st.st_size
+            writer.write(overlay_whiteout)
+        writer.close()
+
+        self.save_opaque_directory(scanner)
 
     def search_files_with_wh_prefix(self, arg_path):
-        aufs_wh_list = []
         aufs_whiteout = {}
-        for dirpath, dirs, files in os.walk(arg_path):
-            for filename in files:
-                if filename.startswith(AUFS_WHITEOUT_PREFIX):
-                    fname = os.path.join(dirpath, filename)
-                    log.debug('[Found] WhiteOut(.wh.*) files: {}, mtime:{}, size:{}'.format(fname, time.ctime(
-                        os.stat(fname).st_mtime), os.stat(fname).st_size))
-                    aufs_whiteout['file_type'] = 'FILE'
-                    aufs_whiteout['fname'] = fname
-                    aufs_whiteout['mtime'] = time.ctime(os.stat(fname).st_mtime)
-                    aufs_whiteout['size'] = os.stat(fname).st_size
-                    aufs_wh_list.append(aufs_whiteout.copy())
-
-            for dir in dirs:
-                if dir.startswith(AUFS_WHITEOUT_PREFIX):
-                    dirname = os.path.join(dirpath, dir)
-                    print('[Found] WhiteOut(.wh.*) Directories: {}, mtime:{}, size:{}'.format(dirname, time.ctime(
-                        os.stat(dirname).st_mtime), os.stat(dirname).st_size))
-                    aufs_whiteout['file_type'] = 'DIRECTORY'
-                    aufs_whiteout['fname'] = dirname
-                    aufs_whiteout['mtime'] = time.ctime(os.stat(dirname).st_mtime)
-                    aufs_whiteout['size'] = os.stat(dirname).st_size
-                    aufs_wh_list.append(aufs_whiteout.copy())
-
-        aufs_wh_path = self.artifacts_path + '/' + 'whiteout.json'
-        if len(aufs_wh_list):
-            with open(aufs_wh_path, 'w') as f:
-                json.dump(aufs_wh_list, f, indent=4)
+        writer = self.open_records('whiteout')
+        scanner = self.scan_upper_layer(arg_path)
+        for entry in scanner.get('whiteout').results:
+            if entry.is_dir:
+                print('[Found] WhiteOut(.wh.*) Directories: {}, mtime:{}, size:{}'.format(entry.path, time.ctime(
+                    entry.st.st_mtime), entry.st.st_size))
+                aufs_whiteout['file_type'] = 'DIRECTORY'
+            else:
+                log.log(TRACE, '[Found] WhiteOut(.wh.*) files: %s, mtime:%s, size:%s', entry.path,
+                            entry.st.st_mtime, entry.st.st_size)
+                aufs_whiteout['file_type'] = 'FILE'
+            aufs_whiteout['fname'] = entry.path
+            aufs_whiteout['mtime'] = time.ctime(entry.st.st_mtime)
+            aufs_whiteout['size'] = entry.st.st_size
+            writer.write(aufs_whiteout)
+        writer.close()
+
+        self.save_opaque_directory(scanner)
+
+    def save_opaque_directory(self, scanner):
+        opaque_info = {}
+        writer = self.open_records('opaque_directory')
+        for entry in scanner.get('opaque').results:
+            dirname = os.path.dirname(entry.path) if self.IS_AUFSFS else entry.path
+            log.log(TRACE, '[Found] Opaque Directory: %s, mtime:%s', dirname, entry.st.st_mtime)
+            opaque_info['directory'] = dirname
+            opaque_info['mtime'] = time.ctime(entry.st.st_mtime)
+            writer.write(opaque_info)
+        writer.close()
 
 
     def copy_files_relatedto_container(self):
-        container_path = "/var/lib/docker/containers/{}".format(self.container_id)
+        """ Copy config, log and runtime files of the container
 
-        for dirpath, dirs, files in os.walk(container_path):
-            for file in files:
-                log.debug("{}[*]{} dirpath:{}, dirs:{}, files:{}"
-                            .format(DFbase.LOG_DEBUG_COLOR,
-                            DFbase.LOG_INFO_COLOR,
-                            dirpath, dirs, files))
-                COPY_CMD = 'cp -f {}/{} {}'.format(dirpath, file, self.artifacts_path)
-                os.system(COPY_CMD)
+        Files are copied in-process (or streamed into the archive) on the
+        hash pool, hashed from the same read, and listed with their digests or copy errors in
+        container_files.json. With a log window (--since, --until, --tail)
+        the json-file log and its rotations are extracted instead of
+        copied, see extract_container_logs.
+        """
+        container_path = self.get_docker_path("/var/lib/docker/containers/{}".format(self.container_id))
+        copy_list = []
+
+        json_logs = []
+        if self.log_since is not None or self.log_until is not None or self.log_tail:
+            json_logs = list_json_logs(container_path, self.container_id)
+        json_log_paths = set(x[0] for x in json_logs)
+
+        for entry in list_regular_files(container_path, self.scan_workers):
+            log.log(TRACE, '%s[*]%s file:%s', DFbase.LOG_DEBUG_COLOR,
+                        DFbase.LOG_INFO_COLOR, entry.path)
+            if entry.path not in json_log_paths:
+                copy_list.append((entry.path, entry.name))
+
+        manifest = self.store.engine.map(self.metrics.wrap(self.copy_file_with_manifest), copy_list)
+
+        self.output.write_json('container_files.json', manifest)
+
+        if json_logs:
+            self.extract_container_logs(json_logs)
+
+        return True
+
+    def extract_container_logs(self, json_logs):
+        """ Extract the log window from the json-file log and its rotations
+
+        Only the lines within --since/--until (and the last --tail lines of
+        them across all files) are read and written to container_logs/;
+        rotations older than a file starting before --since are skipped;
+        container_logs.json lists the byte range taken from every file,
+        the digests of the extract and those of the original up to the
+        size it had when it was extracted, hashed on the pool from the
+        file opened for the extraction.
+        Args:
+            json_logs (list): (path, compressed) newest first
+        """
+        remaining = self.log_tail
+        manifest = []
+
+        def hash_original(fd, size):
+            # the pool gets its own descriptor of the same open file, the future is resolved below
+            return self.store.engine.executor.submit(self.metrics.wrap(self.hash_original_fd),
+                                os.dup(fd), size)
+        for path, compressed in json_logs:
+            if remaining is not None and remaining <= 0:
+                break
+            if manifest and self.log_since is not None:
+                # every line of older rotations precedes the newer file's first line
+                newer_first = read_first_time(manifest[-1]['source'], manifest[-1].get('compressed', False))
+                if newer_first is not None and newer_first < self.log_since:
+                    break
+            name = os.path.basename(path)
+            name = '{}/{}'.format(CONTAINER_LOGS_DIR, name[:-3] if compressed else name)
+            try:
+                item = extract_json_log(path, self.output.get_command_path(name), self.store.engine.algorithms,
+                            self.log_since, self.log_until, remaining, compressed, self.log_index_interval,
+                            hash_original)
+                self.output.commit_command_file(name)
+                item['destination'] = name
+                item['compressed'] = compressed
+                item['status'] = 'OK'
+                if remaining is not None:
+                    remaining -= item['lines']
+                self.metrics.count('files_copied')
+                self.metrics.count('bytes_copied', item['size'])
+            except Exception as e:
+                log.debug('{}[*]{} {}: {}'.format(DFbase.LOG_ERROR_COLOR,
+                            DFbase.LOG_INFO_COLOR, path, e))
+                item = {'source': path, 'status': 'FAILED', 'error': str(e)}
+            manifest.append(item)
+
+        for item in manifest:
+            if 'original' in item:
+                item['original'] = item['original'].result()
+
+        self.output.write_json(CONTAINER_LOGS_MANIFEST, manifest)
+
+    def hash_original_fd(self, fd, size):
+        try:
+            return self.store.engine.hash_fd(fd, size)
+        except OSError as e:
+            return {'error': str(e)}
+        finally:
+            os.close(fd)
+
+
+    def copy_file_with_manifest(self, copy_item):
+        src, name = copy_item
+        item = {'source': src, 'destination': name}
+        try:
+            item.update(self.output.add_file(src, name, self.store.engine.algorithms))
+            item['status'] = 'OK'
+            self.metrics.count('files_copied')
+            self.metrics.count('bytes_copied', item.get('size', 0))
+        except Exception as e:
+            log.debug('{}[*]{} {}: {}'.format(DFbase.LOG_ERROR_COLOR,
+                        DFbase.LOG_INFO_COLOR, src, e))
+            item['status'] = 'FAILED'
+            item['error'] = str(e)
+        return item
 
 
     def get_log_on_journald_service(self):
+        """ Docker daemon journal entries about the container
+
+        The docker unit journal is exported once per host into a cache and
+        kept up to date with a cursor (see dfjournal.JournalCache); only
+        the entries of the container's lifetime that mention its id are
+        written, gzip compressed, to journald_docker.json.gz.
+        """
         if self.log_journald is False:
             log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR, 
                         DFbase.LOG_INFO_COLOR,
@@ -380,8 +1191,14 @@ class DFbase():
             return False
 
         try:
-            p = Popen(LOG_JOURNALD.format(self.artifacts_path), shell=True, stdout=PIPE, stderr=PIPE)
-            stdout_dump, stderr_data = p.communicate()
+            since, until = get_container_lifetime(self.data[0])
+            cache = get_journal_cache(self.journal_cache_path)
+            state = cache.update(since, self.stream_command)
+            journald_path = self.output.get_command_path(JOURNAL_EXPORT_NAME)
+            count = cache.write_export(journald_path, state, self.container_id, since, until)
+            self.output.commit_command_file(JOURNAL_EXPORT_NAME)
+            log.debug('{}[*]{} {} journal entries of the container'.format(DFbase.LOG_DEBUG_COLOR,
+                        DFbase.LOG_INFO_COLOR, count))
         except Exception as e:
             log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR, 
                         DFbase.LOG_INFO_COLOR, e))
@@ -392,96 +1209,145 @@ class DFbase():
 
     def search_hidden_directory(self):
         hidden_dirs_info = {}
-        hidden_dirs_list = []
+        writer = self.open_records('hidden_directory')
 
         if self.IS_OVERLAYFS:
             path = self.get_overlay_upperlayer_path()
         elif self.IS_AUFSFS:
             path = self.get_aufs_container_branch_path()
 
-        p = re.compile(HIDDEN_DIR_REGX)
-        for dirpath, dir_entities, files in os.walk(path):
-            for dir_entity in dir_entities:
-                s = p.search(dir_entity)
-                if s is not None:
-                    dirname = os.path.join(dirpath, dir_entity)
-                    print('[Found] Hidden Directory: {}, mtime:{}, size:{}'.format(dirname, time.ctime(
-                        os.stat(dirname).st_mtime), os.stat(dirname).st_size))
-                    hidden_dirs_info['directory'] = dirname
-                    hidden_dirs_info['mtime'] = time.ctime(os.stat(dirname).st_mtime)
-                    hidden_dirs_info['size'] = os.stat(dirname).st_size
-                    hidden_dirs_list.append(hidden_dirs_info.copy())
-
-        hidden_path = self.artifacts_path + '/' + 'hidden_directory.json'
-        if len(hidden_dirs_list):
-            with open(hidden_path, 'w') as f:
-                json.dump(hidden_dirs_list, f, indent=4)
+        scanner = self.scan_upper_layer(path)
+        for entry in scanner.get('hidden').results:
+            print('[Found] Hidden Directory: {}, mtime:{}, size:{}'.format(entry.path, time.ctime(
+                entry.st.st_mtime), entry.st.st_size))
+            hidden_dirs_info['directory'] = entry.path
+            hidden_dirs_info['mtime'] = time.ctime(entry.st.st_mtime)
+            hidden_dirs_info['size'] = entry.st.st_size
+            writer.write(hidden_dirs_info)
+        writer.close()
 
         return True
 
 
     def get_changed_history_using_diff_command(self):
-        diff_list = []
+        """ Record changed files of the writable layer and acquire executables
+
+        The changes are derived natively from the writable and lower layers
+        (DIFF_ENGINE "native"), so a hung daemon or a dead container does
+        not matter; DIFF_ENGINE "docker" asks the daemon instead.
+
+        Diff entries are streamed and handled in chunks of
+        DIFF_CHUNK_SIZE entries, so memory does not grow with the number of
+        changed files; files of a chunk are acquired concurrently. Which
+        files are acquired is decided up front from the layer scan by the
+        ACQUISITION policy (types, globs, size and total byte limits, mtime
+        priority), summarized in acquisition_summary.json.
+        """
+        diff_chunk = []
+        writer = self.open_records('diff')
 
         if self.IS_OVERLAYFS:
             path = self.get_overlay_upperlayer_path()
         elif self.IS_AUFSFS:
             path = self.get_aufs_container_branch_path()
 
+        scanner = self.scan_upper_layer(path)
+        changed = scanner.get('changed')
+        selection = self.acquisition_policy.select(path, changed.items())
+        self.save_acquisition_summary(selection, changed)
+
+        diff_entities = None
+        if self.diff_engine != DIFF_ENGINE_DOCKER:
+            try:
+                diff_entities = self.get_native_diff(scanner)
+            except Exception as e:
+                log.debug('{}[*]{} native diff failed, using docker diff: {}'.format(DFbase.LOG_WARNING_COLOR,
+                            DFbase.LOG_INFO_COLOR, e))
+        if diff_entities is None and self.offline:
+            writer.close()
+            return False
+        if diff_entities is None:
+            diff_entities = self.call_docker_api('changes', self.container_id)
+        if diff_entities is None:
+            diff_entities = self.stream_command(DOCKER_DIFF_CMD.format(self.container_id))
+
         try:
-            p = Popen(DOCKER_DIFF_CMD.format(self.container_id), shell=True, stdout=PIPE, stderr=PIPE)
-            diff_dump, stderr_data = p.communicate()
+            for diff_entity in diff_entities:
+                if not len(diff_entity):
+                    continue
+                diff_chunk.append(diff_entity)
+                if len(diff_chunk) >= DIFF_CHUNK_SIZE:
+                    self.save_diff_chunk(diff_chunk, path, changed, selection, writer)
+                    diff_chunk = []
+            self.save_diff_chunk(diff_chunk, path, changed, selection, writer)
         except Exception as e:
             log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR, 
                         DFbase.LOG_INFO_COLOR, e))
+            writer.close()
             return False
 
-        changed_entities = diff_dump.decode('utf-8')
-        changed_entities = changed_entities.split("\n")
+        writer.close()
 
-        for diff_entity in changed_entities:
-            diff_info = {}
-            if not len(diff_entity):
-                continue
+        return True
+
+
+    def save_acquisition_summary(self, selection, changed):
+        selected, skipped = selection
+        reasons = {}
+        for reason in skipped.values():
+            reasons[reason] = reasons.get(reason, 0) + 1
+        self.output.write_json('acquisition_summary.json', {
+            'selected': len(selected),
+            'selected_bytes': sum(changed.lookup(x).st_size for x in selected),
+            'skipped': len(skipped),
+            'skipped_bytes': sum(changed.lookup(x).st_size for x in skipped),
+            'skipped_reasons': reasons,
+        })
+
+    def save_diff_chunk(self, diff_chunk, path, changed, selection, writer):
+        selected, skipped = selection
+        diff_list = []
+        acquire_list = []
 
+        for diff_entity in diff_chunk:
+            diff_info = {}
             category, entity = diff_entity.split(maxsplit=1)
 
             diff_info[category] = entity
             absolute_path = '{}{}'.format(path,entity)
+            st = changed.lookup(entity)
             diff_info['fullpath'] = absolute_path
-            diff_info['exist'] = "YES" if os.path.exists(absolute_path) else "No"
-            diff_info['mtime'] = time.ctime(os.stat(absolute_path).st_mtime) if os.path.exists(absolute_path) else "Null"
-            diff_info['size'] = os.stat(absolute_path).st_size if os.path.exists(absolute_path) else "Null"
-            diff_list.append(diff_info.copy())
-
-        diff_path = self.artifacts_path + '/' + 'diff.json'
-        if len(diff_list):
-            with open(diff_path, 'w') as f:
-                json.dump(diff_list, f, indent=4)
-        
-        for diff_entity in diff_list:
-            if diff_entity['fullpath'] and self.IS_OVERLAYFS:
-                log.debug('{}[*]{} DIFF_Overlay:{}'
-                            .format(DFbase.LOG_DEBUG_COLOR,
-                            DFbase.LOG_INFO_COLOR,
-                            diff_entity['fullpath']))
-                if os.path.isfile(diff_entity['fullpath']) and os.access(diff_entity['fullpath'], os.X_OK):
-                    md5sum = self.get_md5sum('{}'.format(diff_entity['fullpath']))
-                    log.debug('md5sum:{}'.format(md5sum))
-                    COPY_CMD = 'cp -f {} {}{}_{}'.format(diff_entity['fullpath'], self.diff_files_path, diff_entity['fullpath'].rsplit('/', 1)[1], md5sum)
-                    log.debug('DIFF CMD:{}'.format(COPY_CMD))
-                    os.system(COPY_CMD)
-
-            elif diff_entity['fullpath']  and self.IS_AUFSFS:
-                log.debug('DIFF_Aufs:{}'.format(diff_entity['fullpath']))
-                if os.path.isfile(diff_entity['fullpath']) and os.access(diff_entity['fullpath'], os.X_OK): 
-                    md5sum = self.get_md5sum('{}'.format(diff_entity['fullpath']))
-                    log.debug('md5sum:{}'.format(md5sum))
-                    COPY_CMD = 'cp -f {} {}{}_{}'.format(diff_entity['fullpath'], self.diff_files_path, diff_entity['fullpath'].rsplit('/', 1)[1], md5sum)
-                    log.debug('DIFF CMD:{}'.format(COPY_CMD))
-                    os.system(COPY_CMD)
-
-        return True
+            diff_info['exist'] = "YES" if st else "No"
+            diff_info['mtime'] = time.ctime(st.st_mtime) if st else "Null"
+            diff_info['size'] = st.st_size if st else "Null"
+
+            diff_list.append(diff_info)
+
+            if st and entity in selected:
+                log.log(TRACE, '%s[*]%s DIFF:%s', DFbase.LOG_DEBUG_COLOR,
+                            DFbase.LOG_INFO_COLOR, absolute_path)
+                diff_info['file_type'] = selected[entity]
+                acquire_list.append((diff_info, entity, st))
+            elif st and entity in skipped:
+                diff_info['skipped'] = skipped[entity]
+
+        baseline = self.load_image_baseline()
+        results = self.store.engine.map(self.metrics.wrap(lambda x: self.acquire_unless_known(baseline,
+                        x[0]['fullpath'], x[1], self.diff_files_path, 'diff', x[1], x[2])), acquire_list)
+        for (diff_info, entity, st), (status, digests) in zip(acquire_list, results):
+            if status is not None:
+                diff_info['baseline'] = status
+            if 'error' in digests:
+                diff_info['error'] = digests['error']
+            else:
+                diff_info['md5'] = digests['md5']
+                diff_info['sha1'] = digests.get('sha1', '')
+                diff_info['sha256'] = digests.get('sha256', '')
+                if 'digest_source' in digests:
+                    diff_info['digest_source'] = digests['digest_source']
+
+        for diff_info in diff_list:
+            writer.write(diff_info)
 
     
     def get_network_session_list(self):
@@ -494,114 +1360,146 @@ class DFbase():
             anotherdo 22149     root    2u  IPv4 578171      0t0  TCP *:8000 (LISTEN)
             anotherdo 22149     root    4u  IPv4 578172      0t0  TCP victim:8000->_gateway:54802 (ESTABLISHED)
 
+            Sockets are read natively from /proc/<pid>/net and mapped to the
+            container processes; nsenter and lsof are used only if the
+            tables cannot be read.
         '''
-        items_list = []
-        network_item = []
         network_dict = {}
+        writer = self.open_records('network_session', always=True)
+
+        sessions = collect_network_sessions(self.pid)
+        if sessions is not None:
+            for network_dict in sessions:
+                writer.write(network_dict)
+            log.debug('{}[*]{} {} sockets collected from /proc'.format(DFbase.LOG_DEBUG_COLOR,
+                        DFbase.LOG_INFO_COLOR, len(sessions)))
+            writer.close()
+            return True
 
         try:
-            p = Popen(NSENTER_CMD.format(self.pid), shell=True, stdout=PIPE, stderr=PIPE)
-            network_dump, stderr_data = p.communicate()
+            for network_line in self.stream_command(NSENTER_CMD.format(self.pid)):
+                if 'COMMAND' in network_line or not len(network_line):
+                    continue
+
+                x = network_line.split(maxsplit=8)
+                log.log(TRACE, '%s[*]%s NETWORK:%s', DFbase.LOG_DEBUG_COLOR,
+                            DFbase.LOG_INFO_COLOR, x)
+                network_dict['COMMAND'] = x[0]
+                network_dict['PID'] = x[1]
+                network_dict['USER'] = x[2]
+                network_dict['FD'] = x[3]
+                network_dict['TYPE'] = x[4]
+                network_dict['DEVICE'] = x[5]
+                network_dict['SIZEOFF'] = x[6]
+                network_dict['NODE'] = x[7]
+                network_dict['NAME'] = x[8]
+
+                writer.write(network_dict)
         except Exception as e:
             log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR, 
                         DFbase.LOG_INFO_COLOR, e))
+            writer.close()
             return False 
 
-        network_lines = network_dump.decode('utf-8')
-        network_lines = network_lines.split("\n")
-
-        for network_line in network_lines:
-            if 'COMMAND' in network_line:
-                continue
-            elif len(network_line):
-                network_item.append(network_line)
-
-        for item in network_item:
-            x = item.split(maxsplit=8)
-            log.debug('{}[*]{} NETWORK:{}, {}, {}, {}, {}, {}, {},{},{}'
-                        .format(DFbase.LOG_DEBUG_COLOR,DFbase.LOG_INFO_COLOR,
-                        x[0], x[1],x[2],x[3],x[4], x[5],x[6],x[7],x[8]))
-            network_dict['COMMAND'] = x[0]
-            network_dict['PID'] = x[1]
-            network_dict['USER'] = x[2]
-            network_dict['FD'] = x[3]
-            network_dict['TYPE'] = x[4]
-            network_dict['DEVICE'] = x[5]
-            network_dict['SIZEOFF'] = x[6]
-            network_dict['NODE'] = x[7]
-            network_dict['NAME'] = x[8]
-
-            items_list.append(network_dict.copy())
-
-        network_path = self.artifacts_path + '/' + 'network_session.json'
-        with open(network_path, 'w') as f:
-            json.dump(items_list, f, indent=4)
+        writer.close()
 
         return True
     
 
-    def get_timeinfo(self):
-
-        items_list = []
-        date_dict = {}
-
-        try:
-            p = Popen(DOCKER_DATE_CMD.format(self.container_id), shell=True, stdout=PIPE, stderr=PIPE)
-            date_dump, stderr_data = p.communicate()
-        except Exception as e:
-            log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR, 
-                        DFbase.LOG_INFO_COLOR, e))
-            return False
-
-        date_info = date_dump.decode('utf-8')
-        date_info = date_info.strip("\r\n")
-        date_dict['TIME'] = date_info
+    def run_container_probes(self):
+        """ Gather date, uptime and the PROBE.FILES of the container at once
 
-        items_list.append(date_dict)
-        log.debug('{}[*]{} timeinfo:{}'.format(DFbase.LOG_DEBUG_COLOR,
-                    DFbase.LOG_INFO_COLOR, items_list))
-
-        date_path = self.artifacts_path + '/' + 'datetime.json'
-        with open(date_path, 'w') as f:
-            json.dump(items_list, f, indent=4)
+        In "proc" mode everything is read through /proc/<pid>/root without
+        entering the container; otherwise, or if that fails, a single sh
+        script runs in one exec round-trip. Offline, the files are read
+        from the layers. Results go to datetime.json, uptime.json, the
+        pulled files and probe.json listing them with their digests.
+        datetime.json has the container's `date` as TIME when it ran
+        inside, and the host clock as HOST_TIME in proc mode.
+        """
+        manifest = []
+        if self.offline:
+            for path in self.probe_files:
+                status = self.copy_file_from_layers(path, get_probe_name(path))
+                manifest.append({'path': path, 'name': get_probe_name(path), 'source': 'layers',
+                                 'status': 'OK' if status else 'FAILED'})
+            self.output.write_json('probe.json', manifest)
+            return True
+
+        result = None
+        if self.probe_mode != PROBE_MODE_EXEC and self.pid:
+            try:
+                result = probe_proc(self.pid, self.probe_files)
+                for path, host_path in result['files']:
+                    item = {'path': path, 'name': get_probe_name(path), 'source': PROBE_MODE_PROC}
+                    try:
+                        item.update(self.output.add_file(host_path, item['name'], self.store.engine.algorithms))
+                        item['status'] = 'OK'
+                    except Exception as e:
+                        item['status'] = 'FAILED'
+                        item['error'] = str(e)
+                    manifest.append(item)
+            except Exception as e:
+                log.debug('{}[*]{} probe through /proc failed, using exec: {}'.format(DFbase.LOG_WARNING_COLOR,
+                            DFbase.LOG_INFO_COLOR, e))
+                result = None
+                manifest = []
 
+        if result is None:
+            boundary = new_boundary()
+            script = build_exec_script(self.probe_files, boundary)
+            exec_result = self.call_docker_api('exec', self.container_id, ['sh', '-c', script])
+            try:
+                if exec_result is None:
+                    exec_result = self.run_command(DOCKER_EXEC_SH_CMD.format(self.container_id, shlex.quote(script)))
+            except Exception as e:
+                log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR,
+                            DFbase.LOG_INFO_COLOR, e))
+                return False
+            result = parse_exec_output(exec_result[0], boundary, self.probe_files)
+            for path, data in result['files'].items():
+                item = {'path': path, 'name': get_probe_name(path), 'source': PROBE_MODE_EXEC}
+                self.output.write_bytes(item['name'], data)
+                item.update(hash_bytes(data, self.store.engine.algorithms))
+                item['status'] = 'OK'
+                manifest.append(item)
+
+        if 'host_time' in result:
+            timeinfo = {'HOST_TIME': result['host_time']}
+        else:
+            timeinfo = {'TIME': result['date']}
+        log.debug('{}[*]{} timeinfo:{}, uptime:{}, {} files'.format(DFbase.LOG_DEBUG_COLOR,
+                    DFbase.LOG_INFO_COLOR, timeinfo, result['uptime'], len(manifest)))
+        self.output.write_json('datetime.json', [timeinfo])
+        self.output.write_json('uptime.json', [{'TIME': result['uptime']}])
+        self.output.write_json('probe.json', manifest)
         return True
 
 
-    def get_uptime(self):
-
-        items_list = []
-        uptime_dict = {}
+    def copy_file_from_layers(self, container_path, name):
+        """ Copy a file of the container filesystem without the daemon
 
-        try:
-            p = Popen(DOCKER_UPTIME_CMD.format(self.container_id), shell=True, stdout=PIPE, stderr=PIPE)
-            uptime_dump, stderr_data = p.communicate()
-        except Exception as e:
-            log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR, 
-                        DFbase.LOG_INFO_COLOR, e))
+        The file is resolved on the writable layer first, then on the lower
+        layers honoring whiteouts and opaque directories.
+        """
+        if self.IS_OVERLAYFS:
+            upper = self.get_overlay_upperlayer_path()
+        elif self.IS_AUFSFS:
+            upper = self.get_aufs_container_branch_path()
+        else:
             return False
 
-        uptime_info = uptime_dump.decode('utf-8')
-        uptime_info = uptime_info.strip("\r\n")
-        uptime_dict['TIME'] = uptime_info
-
-        items_list.append(uptime_dict)
-        log.debug('{}[*]{} uptime:{}'.format(DFbase.LOG_DEBUG_COLOR,
-                    DFbase.LOG_INFO_COLOR, items_list))
-
-        uptime_path = self.artifacts_path + '/' + 'uptime.json'
-        with open(uptime_path, 'w') as f:
-            json.dump(items_list, f, indent=4)
-
-        return True
-
-
-    def get_passwd_file(self):
         try:
-            p = Popen(DOCKER_CP_FROM_CONTAINER_TO_HOST_CMD.format(self.container_id, '/etc/passwd', self.artifacts_path), shell=True, stdout=PIPE, stderr=PIPE)
-            dump, stderr_data = p.communicate()
+            layers = LowerLayers([upper] + list(self.get_lower_layer_paths()), aufs=self.IS_AUFSFS)
+            found = layers.resolve(container_path)
+            # symlinks would be followed on the host, not in the container
+            if found is None or not stat.S_ISREG(found[1].st_mode):
+                log.debug('{}[*]{} {} is not a regular file on the layers'.format(DFbase.LOG_ERROR_COLOR,
+                            DFbase.LOG_INFO_COLOR, container_path))
+                return False
+            self.output.add_file(found[0], name, self.store.engine.algorithms)
         except Exception as e:
-            log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR, 
+            log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR,
                         DFbase.LOG_INFO_COLOR, e))
             return False
-        return True
\ No newline at end of file
+        return True
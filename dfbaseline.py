@@ -0,0 +1,322 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import math
+import time
+import struct
+import hashlib
+import sqlite3
+import threading
+from dfscan import list_regular_files, SCAN_WORKERS
+from dfdiff import LowerLayers
+from dflogging import *
+
+
+BASELINE_PATH = "./artifacts/baseline/"
+BASELINE_VERSION = "2"
+BLOOM_ERROR_RATE = 0.01
+
+# served from a lower layer, the file is the image's
+STATUS_IMAGE = "image"
+# on the writable layer with the digest of the image file at that path
+STATUS_UNCHANGED = "unchanged"
+# digest of an image file at another path
+STATUS_KNOWN = "known"
+# differs from the image file at that path
+STATUS_MODIFIED = "modified"
+# neither the path nor the digest is in the image
+STATUS_ABSENT = "absent"
+
+KNOWN_GOOD = (STATUS_IMAGE, STATUS_UNCHANGED, STATUS_KNOWN)
+
+# digest_source of digests taken from a verified baseline row instead of reading the file
+DIGEST_SOURCE_BASELINE = "baseline"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    ctime_ns INTEGER,
+    ino INTEGER,
+    md5 TEXT,
+    sha1 TEXT,
+    sha256 TEXT,
+    digest TEXT
+);
+CREATE INDEX IF NOT EXISTS files_digest ON files (digest);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value BLOB
+);
+"""
+
+layer_baselines = {}
+layer_baselines_lock = threading.Lock()
+
+
+class BloomFilter():
+    """ Bit array answering 'maybe present' or 'surely absent'
+
+    Args:
+        capacity (int): expected number of keys
+        error_rate (float): false positive rate at capacity
+    """
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        capacity = max(1, capacity)
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, key):
+        # double hashing over two 64 bit halves of one digest
+        a, b = struct.unpack('<QQ', hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest())
+        return [(a + i * b) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[x >> 3] & (1 << (x & 7)) for x in self.positions(key))
+
+    def to_bytes(self):
+        return struct.pack('<QI', self.size, self.hashes) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        bloom = cls.__new__(cls)
+        bloom.size, bloom.hashes = struct.unpack_from('<QI', data)
+        bloom.bits = bytearray(data[12:])
+        return bloom
+
+
+def get_key_algorithm(algorithms):
+    """ Digest files are compared by, sha256 unless only md5 is computed """
+    return 'sha256' if 'sha256' in algorithms else 'md5'
+
+
+def get_layer_id(layer_path):
+    """ Directory name identifying a layer: overlay2 <id>/diff, overlay <id>/root, aufs diff/<id> """
+    layer_path = layer_path.rstrip('/')
+    name = os.path.basename(layer_path)
+    if name in ('diff', 'root'):
+        name = os.path.basename(os.path.dirname(layer_path))
+    return name
+
+
+class LayerBaseline():
+    """ Persisted digests of the executables of one read-only layer
+
+    Layers never change once created, so a layer is indexed once and the
+    SQLite file is shared by every container (and image) using the layer.
+    Paths and key digests (see get_key_algorithm) are added to a Bloom filter kept in the same
+    file, so most lookups of files that are not in the layer end without
+    a query. Every row keeps the size, mtime, ctime and inode the file was
+    hashed with; a row is only trusted while the file still has them.
+
+    Args:
+        layer_path (str): host path of the layer
+        db_path (str): SQLite file of the layer
+    """
+
+    def __init__(self, layer_path, db_path):
+        self.layer_path = layer_path.rstrip('/')
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = None
+        self.bloom = None
+        self.files = 0
+        self.algorithm = None
+
+    def open(self, algorithm):
+        """ Returns:
+                bool: True if a complete index of the layer was loaded
+        """
+        if not os.path.exists(self.db_path):
+            return False
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        meta = dict(conn.execute('SELECT key, value FROM meta'))
+        if (meta.get('version') != BASELINE_VERSION or meta.get('algorithm') != algorithm or
+                'bloom' not in meta):
+            conn.close()
+            return False
+        self.conn = conn
+        self.bloom = BloomFilter.from_bytes(meta['bloom'])
+        self.files = int(meta.get('files', 0))
+        self.algorithm = algorithm
+        return True
+
+    def build(self, policy, engine, workers=SCAN_WORKERS):
+        """ Hash every file of the layer the acquisition policy would acquire
+
+        The index is written to a temporary file and renamed, so an
+        interrupted build is never taken for a complete one.
+        """
+        start = time.time()
+        algorithm = get_key_algorithm(engine.algorithms)
+        candidates = []
+        for entry in list_regular_files(self.layer_path, workers):
+            if policy.get_type(entry.path, entry.st) is not None:
+                candidates.append(entry)
+        results = engine.map(lambda x: self.hash_entry(engine, x), candidates)
+
+        bloom = BloomFilter(2 * len(candidates))
+        rows = []
+        for entry, digests in zip(candidates, results):
+            if digests is None:
+                continue
+            rows.append((entry.relpath, digests['size'], entry.st.st_mtime_ns, entry.st.st_ctime_ns,
+                            entry.st.st_ino, digests.get('md5'), digests.get('sha1'),
+                            digests.get('sha256'), digests[algorithm]))
+            bloom.add('p:' + entry.relpath)
+            bloom.add('d:' + digests[algorithm])
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), mode=0o700, exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(self.db_path, os.getpid())
+        with sqlite3.connect(tmp_path) as conn:
+            conn.executescript(SCHEMA)
+            conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            conn.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', [
+                ('version', BASELINE_VERSION),
+                ('algorithm', algorithm),
+                ('layer', self.layer_path),
+                ('files', str(len(rows))),
+                ('created', str(time.time())),
+                ('bloom', bloom.to_bytes()),
+            ])
+        conn.close()
+        os.replace(tmp_path, self.db_path)
+        log.debug('[*] baseline of {}: {} files in {:.3f}s'.format(self.layer_path, len(rows),
+                    time.time() - start))
+        return self.open(algorithm)
+
+    def hash_entry(self, engine, entry):
+        try:
+            return engine.hash_file(entry.path)
+        except OSError as e:
+            log.debug('[*] {}: {}'.format(entry.path, e))
+            return None
+
+    def lookup_path(self, relpath, st):
+        """ Digests of the layer's file at relpath
+
+        Args:
+            st (os.stat_result): lstat of the layer's file now
+        Returns:
+            tuple: (digests or None if not indexed, True if st still has the
+                    size, mtime, ctime and inode the row was hashed with)
+        """
+        if 'p:' + relpath not in self.bloom:
+            return None, False
+        with self.lock:
+            row = self.conn.execute('SELECT size, mtime_ns, ctime_ns, ino, md5, sha1, sha256 FROM files '
+                                    'WHERE path = ?', (relpath,)).fetchone()
+        if row is None:
+            return None, False
+        verified = row[:4] == (st.st_size, st.st_mtime_ns, st.st_ctime_ns, st.st_ino)
+        if not verified:
+            log.debug('[*] baseline row of {}{} no longer matches the file'.format(self.layer_path, relpath))
+        digests = {'size': row[0], 'md5': row[4], 'sha1': row[5], 'sha256': row[6]}
+        return {x: y for x, y in digests.items() if y is not None}, verified
+
+    def has_digest(self, digest):
+        """ True if a file of the layer still has digest, see lookup_path """
+        if 'd:' + digest not in self.bloom:
+            return False
+        with self.lock:
+            rows = self.conn.execute('SELECT path, size, mtime_ns, ctime_ns, ino FROM files '
+                                    'WHERE digest = ?', (digest,)).fetchall()
+        for row in rows:
+            try:
+                st = os.lstat(self.layer_path + row[0])
+            except OSError:
+                continue
+            if row[1:] == (st.st_size, st.st_mtime_ns, st.st_ctime_ns, st.st_ino):
+                return True
+        if rows:
+            log.debug('[*] baseline rows of {} with digest {} no longer match their files'.format(
+                        self.layer_path, digest))
+        return False
+
+
+def get_layer_baseline(layer_path, base_path, policy, engine, workers=SCAN_WORKERS):
+    """ LayerBaseline of a layer, built on first use and shared in the process """
+    db_path = os.path.join(base_path, get_layer_id(layer_path) + '.db')
+    with layer_baselines_lock:
+        baseline = layer_baselines.get(db_path)
+        if baseline is None:
+            baseline = layer_baselines[db_path] = LayerBaseline(layer_path, db_path)
+    with baseline.lock:
+        if baseline.conn is None and not baseline.open(get_key_algorithm(engine.algorithms)):
+            baseline.build(policy, engine, workers)
+    return baseline
+
+
+class ImageBaseline():
+    """ Baseline of the image a container runs, from its lower layers
+
+    Args:
+        upper (str): writable layer of the container
+        lower_paths (list): lower layers, topmost first
+        aufs (bool): AUFS whiteout naming instead of overlay's
+        layers (list): LayerBaseline of every lower layer, same order
+    """
+
+    def __init__(self, upper, lower_paths, aufs, layers):
+        self.upper = upper.rstrip('\n').rstrip('/')
+        self.lower = LowerLayers(lower_paths, aufs=aufs)
+        self.layers = layers
+        self.algorithm = layers[0].algorithm if layers else 'md5'
+
+    def lookup_path(self, relpath):
+        """ Returns:
+                tuple: ((host path, lstat) on a lower layer or None, digests
+                        or None if not indexed, True if the row was verified)
+        """
+        found = self.lower.resolve(relpath)
+        if found is None:
+            return None, None, False
+        for path, layer in zip(self.lower.paths, self.layers):
+            if found[0] == path + relpath:
+                return (found,) + layer.lookup_path(relpath, found[1])
+        return found, None, False
+
+    def has_digest(self, digest):
+        return any(x.has_digest(digest) for x in self.layers)
+
+    def triage(self, relpath, filepath, st, hash_fn):
+        """ Compare a file of the container with the image
+
+        Files served from a lower layer whose baseline row is verified are
+        not read, their digests are the row's and carry digest_source
+        "baseline"; every other file is hashed with hash_fn(filepath, st).
+        A lower file no longer matching its row is hashed to compare with.
+        Returns:
+            tuple: (status, digests)
+        """
+        found, base, verified = self.lookup_path(relpath)
+        if found is not None and not os.path.lexists(self.upper + relpath):
+            if verified:
+                return STATUS_IMAGE, dict(base, digest_source=DIGEST_SOURCE_BASELINE)
+            return STATUS_IMAGE, hash_fn(filepath, st)
+
+        digests = hash_fn(filepath, st)
+        digest = digests.get(self.algorithm)
+        if base is not None and not verified:
+            base = hash_fn(*found)
+        if base is not None and base.get(self.algorithm) == digest:
+            return STATUS_UNCHANGED, digests
+        if digest and self.has_digest(digest):
+            return STATUS_KNOWN, digests
+        return (STATUS_MODIFIED if found is not None else STATUS_ABSENT), digests
+
+
+def get_image_baseline(upper, lower_paths, aufs, base_path, policy, engine, workers=SCAN_WORKERS):
+    """ ImageBaseline of a container, indexing the layers not indexed yet """
+    layers = [get_layer_baseline(x, base_path, policy, engine, workers) for x in lower_paths if x]
+    return ImageBaseline(upper, [x for x in lower_paths if x], aufs, layers)
@@ -0,0 +1,225 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import json
+import time
+import shlex
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import Popen, PIPE
+from dfbase import DFbase
+from dfoutput import OUTPUT_ARCHIVE
+from dfapi import get_docker_client
+from dflogging import *
+
+
+DOCKER_PS_CMD = "docker ps -q --no-trunc"
+DOCKER_PS_LABEL_OPT = " --filter label={}"
+DOCKER_INSPECT_MANY_CMD = "docker inspect {}"
+
+BATCH_SUMMARY_DIR = "batch"
+BATCH_SUMMARY_FILE = "batch_summary.json"
+
+
+def list_container_ids(labels=None):
+    """ Running container ids, optionally filtered by labels
+
+    Args:
+        labels (list): label filters such as "app=web" (ANDed by docker)
+    Returns:
+        list: full container ids
+    """
+    docker = get_docker_client()
+    if docker is not None:
+        try:
+            return docker.containers(labels)
+        except Exception as e:
+            log.debug('{}[*]{} Engine API failed, using docker CLI: {}'.format(DFbase.LOG_WARNING_COLOR,
+                        DFbase.LOG_INFO_COLOR, e))
+
+    cmd = DOCKER_PS_CMD
+    for label in labels or []:
+        cmd += DOCKER_PS_LABEL_OPT.format(shlex.quote(label))
+
+    try:
+        p = Popen(cmd, shell=True, stdout=PIPE, stderr=PIPE)
+        ps_dump, stderr_data = p.communicate()
+    except Exception as e:
+        log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR,
+                    DFbase.LOG_INFO_COLOR, e))
+        return []
+
+    return [x for x in ps_dump.decode('utf-8').split('\n') if len(x)]
+
+
+def read_container_ids(filepath):
+    """ Container ids listed one per line, '#' starts a comment """
+    ids = []
+    with open(filepath, 'r') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if len(line):
+                ids.append(line)
+    return ids
+
+
+def inspect_containers(container_ids):
+    """ Inspect every container with a single docker inspect call
+
+    With the Engine API the containers are inspected one by one over the
+    pooled connections instead.
+    Returns:
+        tuple: (dict of requested id -> inspect item, list of unknown ids)
+    """
+    if not container_ids:
+        return {}, []
+
+    docker = get_docker_client()
+    if docker is not None:
+        inspected = {}
+        unknown = []
+        for container_id in container_ids:
+            try:
+                inspected[container_id] = docker.inspect(container_id)
+            except Exception as e:
+                log.debug('{}[*]{} {}: {}'.format(DFbase.LOG_ERROR_COLOR,
+                            DFbase.LOG_INFO_COLOR, container_id, e))
+                unknown.append(container_id)
+        return inspected, unknown
+
+    try:
+        p = Popen(DOCKER_INSPECT_MANY_CMD.format(' '.join(shlex.quote(x) for x in container_ids)),
+                    shell=True, stdout=PIPE, stderr=PIPE)
+        data_dump, stderr_data = p.communicate()
+        data = json.loads(data_dump.decode('utf-8') or '[]')
+    except Exception as e:
+        log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR,
+                    DFbase.LOG_INFO_COLOR, e))
+        return {}, list(container_ids)
+
+    inspected = {}
+    unknown = []
+    for container_id in container_ids:
+        for item in data:
+            if item['Id'].startswith(container_id) or item.get('Name') == '/' + container_id:
+                inspected[container_id] = item
+                break
+        else:
+            unknown.append(container_id)
+
+    return inspected, unknown
+
+
+def unique_containers(inspected):
+    """ Drop requested ids resolving to a container already requested
+
+    A container given both by short id and by name, or by -i and by
+    --label, would otherwise be collected twice into the same artifacts
+    directory at the same time.
+    Args:
+        inspected (dict): requested id -> inspect item
+    Returns:
+        dict: requested id -> inspect item, one per full container id
+    """
+    unique = {}
+    seen = set()
+    for container_id, item in inspected.items():
+        if item.get('Id') in seen:
+            log.debug('[*] {} is {} requested already, skipping'.format(container_id, item.get('Id')))
+            continue
+        seen.add(item.get('Id'))
+        unique[container_id] = item
+    return unique
+
+
+def collect_container(inspect_item, output_options=None):
+    """ Run the DFbase pipeline for one container
+
+    Args:
+        inspect_item (dict): an element of the docker inspect array
+        output_options (dict): DFbase output attributes (output_format,
+                               archive_path, compression) to override
+    Returns:
+        dict: per-container summary entry
+    """
+    result = {'container_id': inspect_item.get('Id'), 'status': 'OK', 'error': ''}
+    start = time.time()
+    try:
+        df = DFbase()
+        for key, value in (output_options or {}).items():
+            setattr(df, key, value)
+        if not df.set_inspect_data(inspect_item):
+            result['status'] = 'FAILED'
+            result['error'] = 'Unsupported inspect data'
+        elif not df.setup_config():
+            result['status'] = 'FAILED'
+            result['error'] = 'Failed to setup config'
+        else:
+            df.collect_all()
+            result['artifacts_path'] = df.archive_path if df.output_format == OUTPUT_ARCHIVE else df.artifacts_path
+    except Exception as e:
+        log.debug('{}[*]{} {}: {}'.format(DFbase.LOG_ERROR_COLOR,
+                    DFbase.LOG_INFO_COLOR, inspect_item.get('Id'), e))
+        result['status'] = 'FAILED'
+        result['error'] = repr(e)
+    result['elapsed'] = round(time.time() - start, 3)
+    return result
+
+
+def run_batch(container_ids, workers=4, output_options=None, inspect=inspect_containers):
+    """ Collect artifacts for many containers on a bounded thread pool
+
+    Every container gets its own artifact directory (BASE_PATH in
+    config.json), and a summary of timing and failures is written to
+    BASE_PATH/batch/batch_summary.json.
+
+    Args:
+        container_ids (list): container ids or names
+        workers (int): size of the worker pool
+        output_options (dict): DFbase output attributes for every container
+        inspect (function): resolves container_ids to inspect items, like
+                            inspect_containers
+    Returns:
+        list: summary entries, one per requested container
+    """
+    start = time.time()
+    inspected, unknown = inspect(container_ids)
+    inspected = unique_containers(inspected)
+
+    summary = []
+    for container_id in unknown:
+        summary.append({'container_id': container_id, 'status': 'FAILED',
+                        'error': 'No such container', 'elapsed': 0})
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for result in executor.map(partial(collect_container, output_options=output_options),
+                                    inspected.values()):
+            print('{}[*]{} {} {} ({}s)'.format(DFbase.LOG_DEBUG_COLOR,
+                    DFbase.LOG_INFO_COLOR, result['container_id'],
+                    result['status'], result['elapsed']))
+            summary.append(result)
+
+    save_batch_summary(summary, time.time() - start)
+    return summary
+
+
+def save_batch_summary(summary, elapsed):
+    try:
+        with open('config.json') as f:
+            config = json.load(f)
+        summary_path = config['ARTIFACTS']['BASE_PATH'].format(BATCH_SUMMARY_DIR)
+        if not os.path.exists(summary_path):
+            os.makedirs(summary_path, mode=0o700)
+        with open(summary_path + '/' + BATCH_SUMMARY_FILE, 'w') as f:
+            json.dump({'elapsed': round(elapsed, 3),
+                       'total': len(summary),
+                       'failed': len([x for x in summary if x['status'] != 'OK']),
+                       'containers': summary}, f, indent=4)
+    except Exception as e:
+        log.debug('{}[*]{} {}'.format(DFbase.LOG_ERROR_COLOR,
+                    DFbase.LOG_INFO_COLOR, e))
+        return False
+    return True
@@ -0,0 +1,378 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import json
+import stat
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import threading
+import multiprocessing
+import socketserver
+from http.server import BaseHTTPRequestHandler
+from dfbase import DFbase
+from dfoffline import build_inspect_item
+from dfdiff import DIFF_ENGINE_NATIVE, DIFF_ENGINE_DOCKER
+from dfscan import AUFS_WHITEOUT_PREFIX
+from dflogging import *
+
+
+BENCH_CONTAINER_ID = "bench0000000000000000000000000000000000000000000000000000000000000"
+BENCH_MOUNT_ID = "benchmount"
+BENCH_BASE_LAYER = "benchbase"
+
+FAKE_DOCKER_CLI = """#!/bin/sh
+# docker stand-in of dfbench: only diff is supported
+if [ "$1" = "diff" ]; then
+    cat {}
+    exit 0
+fi
+echo "dfbench fake docker: $*" >&2
+exit 1
+"""
+
+BENCH_CONFIG = {
+    "ARTIFACTS": {
+        "BASE_PATH": "./artifacts/{}",
+        "EXECUTABLE_PATH": "BASE_PATH/executables/",
+        "DIFF_FILES_PATH": "BASE_PATH/diff_files/",
+        "OBJECTS_PATH": "./artifacts/objects/",
+        "LOG_JOURNALD_SERVICE": "FALSE"
+    },
+    "DOCKER": {"API": "FALSE"}
+}
+
+
+class LayerFixture():
+    """ Synthetic docker data root with one container for the benchmarks
+
+    The writable layer holds `files` regular files spread over `depth`
+    levels of directories, `whiteouts` whiteouts (0:0 character devices
+    for overlay2, .wh. files for AUFS), `hidden` hidden directories and
+    `executables` executables. About half of the files also exist on the
+    single lower layer, so the diff has A, C and D entries.
+
+    Args:
+        root (str): directory the docker data root is created in
+        aufs (bool): AUFS layout instead of overlay2
+    """
+
+    def __init__(self, root, files=10000, depth=3, width=10, whiteouts=100, hidden=10,
+                    executables=20, exec_size=64 * 1024, aufs=False):
+        self.root = root
+        self.files = files
+        self.depth = depth
+        self.width = width
+        self.whiteouts = whiteouts
+        self.hidden = hidden
+        self.executables = executables
+        self.exec_size = exec_size
+        self.aufs = aufs
+        self.driver = 'aufs' if aufs else 'overlay2'
+        self.diff_lines = []
+        self.exe_paths = []
+        self.created = {'files': 0, 'whiteouts': 0, 'hidden': 0, 'executables': 0}
+
+    def get_dir(self, i):
+        return ''.join('/d{}'.format((i // self.width ** (k + 1)) % self.width)
+                        for k in range(self.depth))
+
+    def create(self):
+        if self.aufs:
+            self.upper = os.path.join(self.root, 'aufs', 'diff', BENCH_MOUNT_ID)
+            self.lower = os.path.join(self.root, 'aufs', 'diff', BENCH_BASE_LAYER)
+            os.makedirs(os.path.join(self.root, 'aufs', 'layers'))
+            with open(os.path.join(self.root, 'aufs', 'layers', BENCH_MOUNT_ID), 'w') as f:
+                f.write(BENCH_BASE_LAYER + '\n')
+            os.makedirs(os.path.join(self.root, 'aufs', 'mnt'))
+            merged = os.path.join(self.root, 'aufs', 'mnt', BENCH_MOUNT_ID)
+        else:
+            layer_path = os.path.join(self.root, 'overlay2', BENCH_MOUNT_ID)
+            self.upper = os.path.join(layer_path, 'diff')
+            self.lower = os.path.join(self.root, 'overlay2', BENCH_BASE_LAYER, 'diff')
+            os.makedirs(os.path.join(self.root, 'overlay2', 'l'))
+            os.symlink('../{}/diff'.format(BENCH_BASE_LAYER), os.path.join(self.root, 'overlay2', 'l', 'BASE'))
+            os.makedirs(layer_path)
+            with open(os.path.join(layer_path, 'lower'), 'w') as f:
+                f.write('l/BASE')
+            merged = os.path.join(layer_path, 'merged')
+        os.makedirs(self.upper)
+        os.makedirs(self.lower)
+        # nothing is mounted, the writable layer stands in for the merged view
+        os.symlink(self.upper, merged)
+
+        container_path = os.path.join(self.root, 'containers', BENCH_CONTAINER_ID)
+        os.makedirs(container_path)
+        with open(os.path.join(container_path, 'config.v2.json'), 'w') as f:
+            json.dump({'ID': BENCH_CONTAINER_ID, 'Name': '/dfbench', 'Driver': self.driver,
+                        'State': {'Running': True, 'Pid': 0}, 'Config': {}}, f)
+        mounts_path = os.path.join(self.root, 'image', self.driver, 'layerdb', 'mounts', BENCH_CONTAINER_ID)
+        os.makedirs(mounts_path)
+        with open(os.path.join(mounts_path, 'mount-id'), 'w') as f:
+            f.write(BENCH_MOUNT_ID)
+
+        self.create_files()
+        self.create_whiteouts()
+        self.create_hidden()
+        self.create_executables()
+        self.save_diff()
+        return self
+
+    def create_files(self):
+        for i in range(self.files):
+            dirname = self.get_dir(i)
+            os.makedirs(self.upper + dirname, exist_ok=True)
+            with open('{}{}/f{}'.format(self.upper, dirname, i), 'w') as f:
+                f.write('upper {}\n'.format(i))
+            if i % 2 == 0:
+                os.makedirs(self.lower + dirname, exist_ok=True)
+                with open('{}{}/f{}'.format(self.lower, dirname, i), 'w') as f:
+                    f.write('lower {}\n'.format(i))
+        self.created['files'] = self.files
+
+    def create_whiteouts(self):
+        for i in range(self.whiteouts):
+            dirname = self.get_dir(i)
+            os.makedirs(self.upper + dirname, exist_ok=True)
+            os.makedirs(self.lower + dirname, exist_ok=True)
+            open('{}{}/gone{}'.format(self.lower, dirname, i), 'w').close()
+            if self.aufs:
+                open('{}{}/{}gone{}'.format(self.upper, dirname, AUFS_WHITEOUT_PREFIX, i), 'w').close()
+            else:
+                try:
+                    os.mknod('{}{}/gone{}'.format(self.upper, dirname, i), 0o600 | stat.S_IFCHR, 0)
+                except PermissionError:
+                    log.debug('[*] overlay whiteouts need root (mknod), none created')
+                    return
+            self.created['whiteouts'] += 1
+
+    def create_hidden(self):
+        for i in range(self.hidden):
+            dirname = '{}/.hidden{}'.format(self.get_dir(i), i)
+            os.makedirs(self.upper + dirname)
+            open(self.upper + dirname + '/payload', 'w').close()
+            self.created['hidden'] += 1
+
+    def create_executables(self):
+        os.makedirs(self.upper + '/usr/local/bin', exist_ok=True)
+        for i in range(self.executables):
+            exe_path = '/usr/local/bin/exe{}'.format(i)
+            with open(self.upper + exe_path, 'wb') as f:
+                f.write(os.urandom(self.exec_size))
+            os.chmod(self.upper + exe_path, 0o755)
+            self.exe_paths.append(exe_path)
+            self.created['executables'] += 1
+
+    def save_diff(self):
+        """ Expected docker diff output, served by the fake CLI and socket """
+        for dirpath, dirs, names in os.walk(self.upper):
+            for name in dirs + names:
+                path = os.path.join(dirpath, name)
+                relpath = path[len(self.upper):]
+                if self.aufs and name.startswith(AUFS_WHITEOUT_PREFIX):
+                    self.diff_lines.append('D {}/{}'.format(os.path.dirname(relpath),
+                                            name[len(AUFS_WHITEOUT_PREFIX):]))
+                elif stat.S_ISCHR(os.lstat(path).st_mode):
+                    self.diff_lines.append('D ' + relpath)
+                else:
+                    self.diff_lines.append(('C ' if os.path.lexists(self.lower + relpath) else 'A ') + relpath)
+        self.diff_lines.sort(key=lambda x: x[2:])
+        self.diff_path = os.path.join(self.root, 'diff.txt')
+        with open(self.diff_path, 'w') as f:
+            f.write('\n'.join(self.diff_lines) + '\n')
+
+    def install_fake_cli(self):
+        """ Put a fake docker executable first on PATH """
+        bin_path = os.path.join(self.root, 'bin')
+        os.makedirs(bin_path, exist_ok=True)
+        docker_path = os.path.join(bin_path, 'docker')
+        with open(docker_path, 'w') as f:
+            f.write(FAKE_DOCKER_CLI.format(self.diff_path))
+        os.chmod(docker_path, 0o755)
+        os.environ['PATH'] = bin_path + os.pathsep + os.environ.get('PATH', '')
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    """ Engine API stand-in answering _ping and changes """
+    protocol_version = 'HTTP/1.1'
+    diff_lines = []
+
+    def log_message(self, *args):
+        pass
+
+    def address_string(self):
+        return 'unix'
+
+    def send_json(self, code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/_ping':
+            return self.send_json(200, 'OK')
+        if self.path.endswith('/changes'):
+            kinds = {'C': 0, 'A': 1, 'D': 2}
+            return self.send_json(200, [{'Path': x[2:], 'Kind': kinds[x[0]]} for x in self.diff_lines])
+        self.send_json(404, {'message': 'not supported by dfbench'})
+
+
+class FakeDockerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def start_fake_socket(fixture):
+    socket_path = os.path.join(fixture.root, 'docker.{}.sock'.format(os.getpid()))
+    handler = type('Handler', (FakeDockerHandler,), {'diff_lines': fixture.diff_lines})
+    server = FakeDockerServer(socket_path, handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, socket_path
+
+
+# name, DFbase method, diff engine ('cli' and 'api' use the docker stand-ins)
+BENCHMARKS = [
+    ('scan_writable_layer', 'scan_writable_layer', None),
+    ('search_whiteout_files', 'search_whiteout_files', None),
+    ('search_hidden_directory', 'search_hidden_directory', None),
+    ('diff_native', 'get_changed_history_using_diff_command', DIFF_ENGINE_NATIVE),
+    ('diff_docker_cli', 'get_changed_history_using_diff_command', 'cli'),
+    ('diff_docker_api', 'get_changed_history_using_diff_command', 'api'),
+    ('copy_executable', 'copy_executable', None),
+]
+
+
+def run_benchmark(fixture, workdir, name, method, engine, conn):
+    """ Child process body: time one collector on a fresh DFbase """
+    os.chdir(workdir)
+    shutil.rmtree(os.path.join(workdir, 'artifacts'), ignore_errors=True)
+    df = DFbase()
+    df.offline = engine not in ('cli', 'api')
+    df.docker_root = fixture.root
+    df.diff_engine = DIFF_ENGINE_NATIVE if engine == DIFF_ENGINE_NATIVE else DIFF_ENGINE_DOCKER
+    df.set_inspect_data(build_inspect_item(fixture.root, BENCH_CONTAINER_ID))
+    df.setup_config()
+    if engine == 'api':
+        server, df.docker_socket = start_fake_socket(fixture)
+        df.use_docker_api = True
+    elif engine == 'cli':
+        df.use_docker_api = False
+
+    args = ()
+    if method == 'copy_executable':
+        args = ([{'PID': str(i), 'EXE': x} for i, x in enumerate(fixture.exe_paths)],)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    result = getattr(df, method)(*args)
+    elapsed = time.perf_counter() - start
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    scanner = df.layer_scanners.get(fixture.upper)
+    conn.send({'name': name, 'result': result, 'elapsed': elapsed,
+               'entries': scanner.visited if scanner else 0,
+               'bytes': df.store.engine.get_stats()['bytes'],
+               'peak_rss_kb': rss, 'rss_growth_kb': rss - rss_before})
+    conn.close()
+
+
+def run_benchmarks(fixture, repeat=3, names=None, scan_workers=None):
+    """ Run every benchmark repeat times, each in its own process
+
+    Returns:
+        list: per benchmark best elapsed time, throughput and peak RSS
+    """
+    fixture.install_fake_cli()
+    workdir = tempfile.mkdtemp(prefix='dfbench_work_')
+    config = dict(BENCH_CONFIG)
+    if scan_workers is not None:
+        config['SCAN'] = {'WORKERS': scan_workers}
+    with open(os.path.join(workdir, 'config.json'), 'w') as f:
+        json.dump(config, f)
+
+    ctx = multiprocessing.get_context('fork')
+    report = []
+    try:
+        for name, method, engine in BENCHMARKS:
+            if names and name not in names:
+                continue
+            runs = []
+            for i in range(repeat):
+                parent_conn, child_conn = ctx.Pipe(duplex=False)
+                p = ctx.Process(target=run_benchmark,
+                                args=(fixture, workdir, name, method, engine, child_conn))
+                p.start()
+                child_conn.close()
+                try:
+                    runs.append(parent_conn.recv())
+                except EOFError:
+                    runs.append({'name': name, 'result': 'CRASHED', 'elapsed': 0})
+                p.join()
+
+            best = min(runs, key=lambda x: x['elapsed'])
+            entry = {'name': name, 'result': best['result'], 'runs': [round(x['elapsed'], 4) for x in runs],
+                     'best_seconds': round(best['elapsed'], 4)}
+            if best['elapsed']:
+                entry['entries_per_sec'] = round(best.get('entries', 0) / best['elapsed'], 1)
+                entry['mb_per_sec'] = round(best.get('bytes', 0) / best['elapsed'] / 1024 / 1024, 3)
+            entry['peak_rss_kb'] = max(x.get('peak_rss_kb', 0) for x in runs)
+            entry['rss_growth_kb'] = max(x.get('rss_growth_kb', 0) for x in runs)
+            report.append(entry)
+            print('{:<26} {:>10.4f}s {:>14} entries/s {:>10} MB/s {:>10} KB peak RSS  {}'.format(
+                    name, entry['best_seconds'], entry.get('entries_per_sec', '-'),
+                    entry.get('mb_per_sec', '-'), entry['peak_rss_kb'], entry['result']))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def main():
+    """ Benchmark the layer collectors on synthetic layers, no daemon needed """
+    parser = argparse.ArgumentParser(description='Benchmark docker-forensics collectors')
+    parser.add_argument('--files', type=int, default=10000, help='files on the writable layer')
+    parser.add_argument('--depth', type=int, default=3, help='directory levels')
+    parser.add_argument('--width', type=int, default=10, help='subdirectories per level')
+    parser.add_argument('--whiteouts', type=int, default=100, help='whiteout entries')
+    parser.add_argument('--hidden', type=int, default=10, help='hidden directories')
+    parser.add_argument('--executables', type=int, default=20, help='executables')
+    parser.add_argument('--exec-size', dest='exec_size', type=int, default=64 * 1024,
+                            help='size of every executable in bytes')
+    parser.add_argument('--aufs', action='store_true', help='AUFS layout instead of overlay2')
+    parser.add_argument('--scan-workers', dest='scan_workers', type=int,
+                            help='threads walking the writable layer (default: SCAN.WORKERS)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the best is kept')
+    parser.add_argument('--only', action='append', default=[], metavar='NAME',
+                            help='run only the named benchmark, can be repeated')
+    parser.add_argument('--keep', action='store_true', help='keep the generated layers')
+    parser.add_argument('-o', '--output', help='write the report as json')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='dfbench_root_')
+    try:
+        start = time.perf_counter()
+        fixture = LayerFixture(root, args.files, args.depth, args.width, args.whiteouts,
+                                args.hidden, args.executables, args.exec_size, args.aufs).create()
+        print('[*] {} layers in {}: {} ({:.2f}s)'.format(fixture.driver, root, fixture.created,
+                time.perf_counter() - start))
+        report = run_benchmarks(fixture, args.repeat, args.only, args.scan_workers)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({'driver': fixture.driver, 'fixture': fixture.created,
+                           'depth': args.depth, 'width': args.width, 'repeat': args.repeat,
+                           'benchmarks': report}, f, indent=4)
+    finally:
+        if args.keep:
+            print('[*] layers kept in {}'.format(root))
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import hashlib
+from dflogging import *
+
+
+COPY_BUFFER_SIZE = 1024 * 1024
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+# permission bits kept on copies, setuid/setgid/sticky are never carried over
+EVIDENCE_MODE_MASK = 0o777
+
+
+def copy_stat(st, dst):
+    """ Preserve permission bits (see EVIDENCE_MODE_MASK) and timestamps of the source on dst """
+    os.chmod(dst, st.st_mode & EVIDENCE_MODE_MASK)
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def _copy_range(fsrc, fdst, size):
+    """ Kernel side copy, returns the number of bytes copied """
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copied < size:
+                n = os.copy_file_range(fsrc, fdst, min(COPY_CHUNK_SIZE, size - copied))
+                if n == 0:
+                    break
+                copied += n
+            return copied
+        except OSError:
+            if copied:
+                raise
+
+    while copied < size:
+        n = os.sendfile(fdst, fsrc, copied, min(COPY_CHUNK_SIZE, size - copied))
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def copy_file(src, dst, preserve=True):
+    """ Copy a file without passing its data through user space
+
+    Uses copy_file_range, then sendfile, and finally plain read/write for
+    files reporting size 0 such as those in /proc.
+    Args:
+        src (str): source file
+        dst (str): destination file, overwritten if it exists
+        preserve (bool): keep mode and timestamps of src
+    Returns:
+        int: bytes copied
+    """
+    with open(src, 'rb') as fsrc:
+        st = os.fstat(fsrc.fileno())
+        with open(dst, 'wb') as fdst:
+            copied = 0
+            if st.st_size:
+                try:
+                    copied = _copy_range(fsrc.fileno(), fdst.fileno(), st.st_size)
+                except OSError:
+                    fsrc.seek(0)
+                    fdst.seek(0)
+                    fdst.truncate()
+                    copied = 0
+            if copied < st.st_size or not st.st_size:
+                fsrc.seek(copied)
+                while True:
+                    data = fsrc.read(COPY_BUFFER_SIZE)
+                    if not data:
+                        break
+                    fdst.write(data)
+                    copied += len(data)
+    if preserve:
+        copy_stat(st, dst)
+    return copied
+
+
+def copy_and_hash(src, dst, algorithms, buffer_size=COPY_BUFFER_SIZE, preserve=True):
+    """ Copy a file and compute its digests from the same read
+
+    Args:
+        src (str): source file
+        dst (str): destination file, overwritten if it exists
+        algorithms (list): hashlib algorithm names
+        buffer_size (int): bytes read at once
+        preserve (bool): keep mode and timestamps of src
+    Returns:
+        dict: algorithm -> hex digest, plus 'size' of bytes copied
+    """
+    hashers = [hashlib.new(x) for x in algorithms]
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    size = 0
+
+    with open(src, 'rb', buffering=0) as fsrc:
+        st = os.fstat(fsrc.fileno())
+        with open(dst, 'wb', buffering=0) as fdst:
+            while True:
+                n = fsrc.readinto(buf)
+                if not n:
+                    break
+                chunk = view[:n]
+                for hasher in hashers:
+                    hasher.update(chunk)
+                written = 0
+                while written < n:
+                    written += fdst.write(chunk[written:])
+                size += n
+    view.release()
+
+    if preserve:
+        copy_stat(st, dst)
+
+    digests = {name: hasher.hexdigest() for name, hasher in zip(algorithms, hashers)}
+    digests['size'] = size
+    return digests
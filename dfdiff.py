@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import stat
+from dfscan import AUFS_WHITEOUT_PREFIX, AUFS_OPAQUE_MARKER, OVERLAY_OPAQUE_XATTR
+from dflogging import *
+
+
+DIFF_ENGINE_NATIVE = "native"
+DIFF_ENGINE_DOCKER = "docker"
+
+DIFF_ADDED = "A"
+DIFF_CHANGED = "C"
+DIFF_DELETED = "D"
+
+# .wh..wh.aufs, .wh..wh.orph, .wh..wh.plnk are AUFS housekeeping entries
+AUFS_META_PREFIX = AUFS_WHITEOUT_PREFIX + AUFS_WHITEOUT_PREFIX
+
+
+def is_overlay_whiteout(st):
+    return stat.S_ISCHR(st.st_mode) and st.st_rdev == 0
+
+
+class LowerLayers():
+    """ Read-only layers below the writable layer, topmost first
+
+    lookup() resolves a container path the way the union mount does:
+    a whiteout or an opaque directory in a layer hides the path in every
+    layer below it.
+
+    Args:
+        paths (list): overlay LowerDir entries or AUFS diff branches
+        aufs (bool): AUFS whiteout naming instead of overlay's
+    """
+
+    def __init__(self, paths, aufs=False):
+        self.paths = [x.rstrip('/') for x in paths if x]
+        self.aufs = aufs
+        self.dir_states = {}
+
+    def _is_whiteout(self, layer, relpath):
+        if self.aufs:
+            dirname, name = relpath.rsplit('/', 1)
+            return os.path.lexists('{}{}/{}{}'.format(layer, dirname, AUFS_WHITEOUT_PREFIX, name))
+        try:
+            return is_overlay_whiteout(os.lstat(layer + relpath))
+        except OSError:
+            return False
+
+    def _is_opaque(self, layer, relpath):
+        if self.aufs:
+            return os.path.lexists('{}{}/{}'.format(layer, relpath, AUFS_OPAQUE_MARKER))
+        try:
+            return os.getxattr(layer + relpath, OVERLAY_OPAQUE_XATTR, follow_symlinks=False) == b'y'
+        except OSError:
+            return False
+
+    def _dir_state(self, index, relpath):
+        """ 'whiteout', 'opaque' or None for a directory in layer index """
+        key = (index, relpath)
+        if key not in self.dir_states:
+            layer = self.paths[index]
+            if self._is_whiteout(layer, relpath):
+                self.dir_states[key] = 'whiteout'
+            elif self._is_opaque(layer, relpath):
+                self.dir_states[key] = 'opaque'
+            else:
+                self.dir_states[key] = None
+        return self.dir_states[key]
+
+    def lookup(self, relpath):
+        """ Returns:
+                os.stat_result: of relpath in the topmost layer having it,
+                                None if no layer shows it
+        """
+        found = self.resolve(relpath)
+        return found[1] if found else None
+
+    def resolve(self, relpath):
+        """ Returns:
+                tuple: (host path, os.stat_result) of relpath in the topmost
+                       layer having it, None if no layer shows it
+        """
+        ancestors = []
+        parent = relpath.rsplit('/', 1)[0]
+        while parent:
+            ancestors.append(parent)
+            parent = parent.rsplit('/', 1)[0]
+
+        for index, layer in enumerate(self.paths):
+            states = [self._dir_state(index, x) for x in ancestors]
+            if 'whiteout' in states or self._is_whiteout(layer, relpath):
+                return None
+            try:
+                return layer + relpath, os.lstat(layer + relpath)
+            except OSError:
+                pass
+            if 'opaque' in states:
+                return None
+        return None
+
+
+class LayerDiff():
+    """ A/C/D changes of a writable layer like `docker diff` reports them
+
+    Built from the entries LayerScanner already collected: whiteouts become
+    D entries of the path they hide, an opaque directory present in a lower
+    layer is D as well, any other entry is C if a lower layer shows the
+    same path and A otherwise.
+
+    Args:
+        scanner (LayerScanner): scanned writable layer
+        lower (LowerLayers): read-only layers of the container
+        aufs (bool): AUFS whiteout naming instead of overlay's
+    """
+
+    def __init__(self, scanner, lower, aufs=False):
+        self.scanner = scanner
+        self.lower = lower
+        self.aufs = aufs
+        self.opaque = set()
+        for entry in scanner.get('opaque').results:
+            self.opaque.add(entry.relpath.rsplit('/', 1)[0] if aufs else entry.relpath)
+
+    def is_under_opaque(self, dirname):
+        while dirname:
+            if dirname in self.opaque:
+                return True
+            dirname = dirname.rsplit('/', 1)[0]
+        return False
+
+    def get_change(self, relpath, st):
+        """ Returns:
+                tuple: (kind, container path), None for layer metadata
+        """
+        dirname, name = relpath.rsplit('/', 1)
+        if self.aufs:
+            if relpath.startswith('/' + AUFS_META_PREFIX) or name == AUFS_OPAQUE_MARKER:
+                return None
+            if name.startswith(AUFS_WHITEOUT_PREFIX):
+                return DIFF_DELETED, '{}/{}'.format(dirname, name[len(AUFS_WHITEOUT_PREFIX):])
+        elif is_overlay_whiteout(st):
+            return DIFF_DELETED, relpath
+
+        if self.is_under_opaque(dirname) or self.lower.lookup(relpath) is None:
+            return DIFF_ADDED, relpath
+        if relpath in self.opaque:
+            return DIFF_DELETED, relpath
+        return DIFF_CHANGED, relpath
+
+    def changes(self):
+        """ Yields:
+                str: 'A /path' lines in path order, as docker diff prints them
+        """
+        for relpath, st in self.scanner.get('changed').items():
+            change = self.get_change(relpath, st)
+            if change is not None:
+                yield '{} {}'.format(*change)
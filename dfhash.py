@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dfcopy import copy_and_hash
+from dflogging import *
+
+
+HASH_ALGORITHMS = ["md5", "sha1", "sha256"]
+HASH_BUFFER_SIZE = 1024 * 1024
+HASH_WORKERS = 4
+
+
+def hash_file(filepath, algorithms=HASH_ALGORITHMS, buffer_size=HASH_BUFFER_SIZE):
+    """ Compute every digest of a file in a single read pass
+
+    The file is read into one reused buffer of buffer_size bytes, which is
+    handed to the hashers without copying; hashlib releases the GIL while
+    hashing it. Files are not mmap'ed: a live file truncated while it is
+    hashed would kill the process with SIGBUS.
+    Args:
+        filepath (str): file to hash
+        algorithms (list): hashlib algorithm names
+        buffer_size (int): bytes read and handed to the hashers at once
+    Returns:
+        dict: algorithm -> hex digest, plus 'size' of bytes hashed
+    """
+    hashers = [hashlib.new(x) for x in algorithms]
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    size = 0
+
+    with open(filepath, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            chunk = view[:n]
+            for hasher in hashers:
+                hasher.update(chunk)
+            size += n
+
+    digests = {name: hasher.hexdigest() for name, hasher in zip(algorithms, hashers)}
+    digests['size'] = size
+    return digests
+
+
+def hash_fd(fd, size, algorithms=HASH_ALGORITHMS, buffer_size=HASH_BUFFER_SIZE):
+    """ hash_file for the first size bytes of an open file
+
+    Read with pread, so the position of fd is left alone. A file
+    truncated below size hashes what is left, see 'size'.
+    """
+    hashers = [hashlib.new(x) for x in algorithms]
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    offset = 0
+
+    while offset < size:
+        n = os.preadv(fd, [view[:min(buffer_size, size - offset)]], offset)
+        if not n:
+            break
+        chunk = view[:n]
+        for hasher in hashers:
+            hasher.update(chunk)
+        offset += n
+
+    digests = {name: hasher.hexdigest() for name, hasher in zip(algorithms, hashers)}
+    digests['size'] = offset
+    return digests
+
+
+def hash_bytes(data, algorithms=HASH_ALGORITHMS):
+    """ hash_file for data already in memory """
+    digests = {name: hashlib.new(name, data).hexdigest() for name in algorithms}
+    digests['size'] = len(data)
+    return digests
+
+
+class HashEngine():
+    """ Thread pool hashing files with several digests at once
+
+    Args:
+        algorithms (list): hashlib algorithm names, md5 (reported) and
+                           sha256 (naming stored objects) are always included
+        workers (int): size of the thread pool
+        buffer_size (int): bytes handed to the hashers at once
+    """
+
+    def __init__(self, algorithms=HASH_ALGORITHMS, workers=HASH_WORKERS, buffer_size=HASH_BUFFER_SIZE):
+        self.algorithms = list(algorithms)
+        if 'md5' not in self.algorithms:
+            self.algorithms.insert(0, 'md5')
+        if 'sha256' not in self.algorithms:
+            self.algorithms.append('sha256')
+        self.buffer_size = buffer_size
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.lock = threading.Lock()
+        self.files = 0
+        self.bytes = 0
+        self.busy = 0.0
+        self.started = time.time()
+
+    def hash_file(self, filepath):
+        start = time.time()
+        digests = hash_file(filepath, self.algorithms, self.buffer_size)
+        elapsed = time.time() - start
+        with self.lock:
+            self.files += 1
+            self.bytes += digests['size']
+            self.busy += elapsed
+        return digests
+
+    def hash_fd(self, fd, size):
+        start = time.time()
+        digests = hash_fd(fd, size, self.algorithms, self.buffer_size)
+        elapsed = time.time() - start
+        with self.lock:
+            self.files += 1
+            self.bytes += digests['size']
+            self.busy += elapsed
+        return digests
+
+    def copy_file(self, src, dst):
+        """ Copy src to dst hashing it from the same read """
+        start = time.time()
+        digests = copy_and_hash(src, dst, self.algorithms, self.buffer_size)
+        elapsed = time.time() - start
+        with self.lock:
+            self.files += 1
+            self.bytes += digests['size']
+            self.busy += elapsed
+        return digests
+
+    def map(self, fn, items):
+        """ Run fn over items on the pool, results in the order of items """
+        return list(self.executor.map(fn, items))
+
+    def get_stats(self):
+        with self.lock:
+            wall = time.time() - self.started
+            return {
+                'algorithms': self.algorithms,
+                'files': self.files,
+                'bytes': self.bytes,
+                'hash_seconds': round(self.busy, 3),
+                'throughput_mb_per_sec': round(self.bytes / self.busy / 1024 / 1024, 3) if self.busy else 0,
+                'wall_seconds': round(wall, 3),
+            }
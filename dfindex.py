@@ -0,0 +1,165 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import time
+import sqlite3
+import threading
+from dflogging import *
+
+
+INDEX_PATH = "./artifacts/index/{}.db"
+
+CHANGE_ADDED = "A"
+CHANGE_MODIFIED = "M"
+CHANGE_DELETED = "D"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    inode INTEGER,
+    size INTEGER,
+    mtime_ns INTEGER,
+    ctime_ns INTEGER,
+    mode INTEGER,
+    md5 TEXT,
+    sha1 TEXT,
+    sha256 TEXT,
+    layer INTEGER
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL,
+    entries INTEGER,
+    added INTEGER,
+    modified INTEGER,
+    deleted INTEGER
+);
+"""
+
+
+class SnapshotIndex():
+    """ Per-container index of the writable layer from the previous run
+
+    Keeps path, inode, size, mtime, ctime and digests of every entry, so a
+    later run can tell unchanged entries apart without reading them and
+    reuse their digests instead of hashing and copying them again. Files
+    acquired outside the layer (process executables) are kept with layer=0
+    only for their digests.
+
+    Args:
+        db_path (str): SQLite database file
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.previous = {}
+        self.previous_run = None
+        self.current = {}
+        self.extra = {}
+        self.digests = {}
+        self.started = time.time()
+        self.delta = {CHANGE_ADDED: 0, CHANGE_MODIFIED: 0, CHANGE_DELETED: 0}
+
+        dirname = os.path.dirname(os.path.abspath(db_path))
+        if not os.path.exists(dirname):
+            os.makedirs(dirname, mode=0o700, exist_ok=True)
+
+    def load(self):
+        """ Read the snapshot of the previous run
+
+        Returns:
+            int: number of entries in the previous snapshot
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executescript(SCHEMA)
+            for row in conn.execute('SELECT path, inode, size, mtime_ns, ctime_ns, mode, '
+                                    'md5, sha1, sha256, layer FROM entries'):
+                self.previous[row[0]] = row[1:]
+            row = conn.execute('SELECT run_id, started FROM runs ORDER BY run_id DESC LIMIT 1').fetchone()
+            if row is not None:
+                self.previous_run = {'run_id': row[0], 'started': time.ctime(row[1])}
+        conn.close()
+        return len(self.previous)
+
+    @staticmethod
+    def get_signature(st):
+        return (st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns, st.st_mode)
+
+    def compare(self, entries):
+        """ Compare the entries of this run with the previous snapshot
+
+        Args:
+            entries (iterable): (full path, os.stat_result) of this run
+        Yields:
+            tuple: (change, path, os.stat_result or None) for every added,
+                   modified or deleted entry
+        """
+        for path, st in entries:
+            signature = self.get_signature(st)
+            self.current[path] = signature
+            previous = self.previous.get(path)
+            if previous is None:
+                self.delta[CHANGE_ADDED] += 1
+                yield CHANGE_ADDED, path, st
+            elif previous[:5] != signature:
+                self.delta[CHANGE_MODIFIED] += 1
+                yield CHANGE_MODIFIED, path, st
+
+        for path, previous in self.previous.items():
+            if previous[8] and path not in self.current:
+                self.delta[CHANGE_DELETED] += 1
+                yield CHANGE_DELETED, path, None
+
+    def get_unchanged_digests(self, path, st):
+        """ Digests of path from the previous run if it did not change
+
+        Returns:
+            dict: digests by algorithm name, None if unknown or changed
+        """
+        previous = self.previous.get(path)
+        if previous is None or previous[:5] != self.get_signature(st) or not previous[5]:
+            return None
+        digests = {'md5': previous[5], 'size': previous[1]}
+        if previous[6]:
+            digests['sha1'] = previous[6]
+        if previous[7]:
+            digests['sha256'] = previous[7]
+        return digests
+
+    def set_digests(self, path, st, digests):
+        with self.lock:
+            self.digests[path] = digests
+            if path not in self.current:
+                self.extra[path] = self.get_signature(st)
+
+    def save(self):
+        """ Replace the snapshot with the entries of this run """
+        rows = []
+        entries = [(x, y, 1) for x, y in self.current.items()]
+        entries += [(x, y, 0) for x, y in self.extra.items()]
+        for path, signature, layer in entries:
+            digests = self.digests.get(path)
+            if digests is None:
+                previous = self.previous.get(path)
+                digests = {}
+                if previous is not None and previous[:5] == signature and previous[5]:
+                    digests = {'md5': previous[5], 'sha1': previous[6], 'sha256': previous[7]}
+            rows.append((path,) + signature + (digests.get('md5'), digests.get('sha1'),
+                        digests.get('sha256'), layer))
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executescript(SCHEMA)
+            conn.execute('DELETE FROM entries')
+            conn.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            conn.execute('INSERT INTO runs (started, entries, added, modified, deleted) '
+                         'VALUES (?, ?, ?, ?, ?)', (self.started, len(rows),
+                         self.delta[CHANGE_ADDED], self.delta[CHANGE_MODIFIED],
+                         self.delta[CHANGE_DELETED]))
+        conn.close()
+        log.debug('[*] Snapshot saved to {}: {} entries, delta {}'.format(self.db_path,
+                    len(rows), self.delta))
+        return True
@@ -0,0 +1,270 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import re
+import gzip
+import json
+import time
+import shlex
+import fcntl
+import datetime
+import threading
+from dflogging import *
+
+
+JOURNAL_CACHE_PATH = "./artifacts/journal/"
+JOURNAL_EXPORT_NAME = "journald_docker.json.gz"
+JOURNAL_STATE_FILE = "docker.state.json"
+JOURNAL_CACHE_VERSION = 2
+JOURNAL_LOCK_FILE = "docker.lock"
+
+# journalctl -o json writes one entry per line
+LOG_JOURNALD = "journalctl -u docker -o json --no-pager {}"
+# entries between two saves of the export progress
+JOURNAL_CHECKPOINT_LINES = 10000
+
+# the cache is brought up to date at most once per JOURNAL_CACHE_TTL seconds
+JOURNAL_CACHE_TTL = 60
+# daemon messages about a container still come in after it stopped
+JOURNAL_UNTIL_SLACK = 300
+
+ZERO_TIME = "0001-01-01T00:00:00Z"
+DOCKER_TIME_REGX = r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d+))?(Z|[+-]\d\d:\d\d)$"
+
+journal_caches = {}
+journal_caches_lock = threading.Lock()
+
+
+def parse_docker_time(text):
+    """ Epoch seconds of a docker timestamp (RFC 3339 with nanoseconds)
+
+    Returns:
+        float: seconds, None for an empty or zero time
+    """
+    if not text or text == ZERO_TIME:
+        return None
+    m = re.match(DOCKER_TIME_REGX, text)
+    if m is None:
+        log.debug('[*] unknown time format: {}'.format(text))
+        return None
+    date, fraction, offset = m.groups()
+    value = datetime.datetime.strptime(date + ('+00:00' if offset == 'Z' else offset), '%Y-%m-%dT%H:%M:%S%z')
+    return value.timestamp() + (float('0.' + fraction) if fraction else 0)
+
+
+def get_container_lifetime(inspect_item):
+    """ (since, until) of the container in epoch seconds, until None while running
+
+    The lifetime starts at creation rather than State.StartedAt, so that
+    earlier runs of a restarted container are covered as well.
+    """
+    state = inspect_item.get('State', {})
+    since = parse_docker_time(inspect_item.get('Created')) or parse_docker_time(state.get('StartedAt'))
+    until = None
+    if not state.get('Running', False):
+        finished = parse_docker_time(state.get('FinishedAt'))
+        if finished is not None:
+            until = finished + JOURNAL_UNTIL_SLACK
+    return since, until
+
+
+class JournalCache():
+    """ Host-level export of the docker unit journal shared by every container
+
+    The journal is exported once into gzip compressed segment files under
+    cache_path and later brought up to date with --after-cursor, so a
+    batch run reads the journal once instead of once per container. A
+    container created before the oldest segment adds a segment for the
+    missing range only. Segments are written as the entries arrive with
+    no overall time limit; every JOURNAL_CHECKPOINT_LINES entries the
+    segment size and cursor are saved to docker.state.json, so an
+    interrupted export resumes from there. A lock file serializes
+    concurrent runs.
+
+    Args:
+        cache_path (str): directory of the cache
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.lock = threading.Lock()
+
+    def get_path(self, name):
+        return os.path.join(self.cache_path, name)
+
+    def load_state(self):
+        try:
+            with open(self.get_path(JOURNAL_STATE_FILE), 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        if state is not None and state.get('version') == JOURNAL_CACHE_VERSION:
+            return state
+        if state is not None:
+            # segments of an older layout are exported again
+            for segment in state.get('segments', []):
+                try:
+                    os.unlink(self.get_path(segment['file']))
+                except (OSError, KeyError):
+                    pass
+        return {'version': JOURNAL_CACHE_VERSION, 'segments': [], 'updated': 0}
+
+    def save_state(self, state):
+        tmp_path = self.get_path(JOURNAL_STATE_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=4)
+        os.replace(tmp_path, self.get_path(JOURNAL_STATE_FILE))
+
+    def checkpoint(self, state, segment, last):
+        """ Save the size of the segment and the cursor of its last entry """
+        if last is not None:
+            try:
+                segment['cursor'] = json.loads(last).get('__CURSOR', segment['cursor'])
+            except ValueError:
+                pass
+        segment['size'] = os.path.getsize(self.get_path(segment['file']))
+        self.save_state(state)
+
+    def export(self, stream_command, state, segment):
+        """ Append the entries after the segment's cursor to the segment
+
+        Entries are appended as complete gzip members, one per checkpoint;
+        whatever follows the last checkpoint of an interrupted export is
+        cut off before resuming from its cursor.
+        Args:
+            stream_command (callable): DFbase.stream_command
+            state (dict): state of the cache, saved at every checkpoint
+            segment (dict): entry of state['segments']
+        Returns:
+            int: number of entries exported
+        """
+        path = self.get_path(segment['file'])
+        if not os.path.exists(path):
+            segment.update({'cursor': None, 'size': 0})
+        if segment['cursor']:
+            args = '--after-cursor={}'.format(shlex.quote(segment['cursor']))
+        else:
+            args = '--since=@{}'.format(segment['since'])
+        if segment.get('until') is not None:
+            args += ' --until=@{}'.format(segment['until'] + 1)
+
+        with open(path, 'ab') as f:
+            f.truncate(segment['size'])
+        count = 0
+        last = None
+        dst = gzip.open(path, 'ab')
+        try:
+            for line in stream_command(LOG_JOURNALD.format(args)):
+                if not line:
+                    continue
+                dst.write(line.encode('utf-8') + b'\n')
+                last = line
+                count += 1
+                if count % JOURNAL_CHECKPOINT_LINES == 0:
+                    dst.close()
+                    self.checkpoint(state, segment, last)
+                    dst = gzip.open(path, 'ab')
+        finally:
+            dst.close()
+        self.checkpoint(state, segment, last)
+        return count
+
+    def update(self, since, stream_command):
+        """ Make sure the cache covers since up to now
+
+        Args:
+            since (float): epoch seconds the cache has to start at
+            stream_command (callable): DFbase.stream_command
+        Returns:
+            dict: state of the cache
+        """
+        os.makedirs(self.cache_path, mode=0o700, exist_ok=True)
+        with self.lock, open(self.get_path(JOURNAL_LOCK_FILE), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            state = self.load_state()
+            since = int(since or 0)
+            segments = state['segments']
+
+            if not segments or since < segments[0]['since']:
+                # only the range before the oldest segment
+                until = segments[0]['since'] if segments else None
+                segments.insert(0, {'file': 'docker.{}.json.gz'.format(since), 'since': since,
+                                    'until': until, 'cursor': None, 'size': 0, 'complete': False})
+                self.save_state(state)
+
+            for segment in segments:
+                if segment['complete']:
+                    if segment['until'] is not None or time.time() - state['updated'] < JOURNAL_CACHE_TTL:
+                        continue
+                count = self.export(stream_command, state, segment)
+                segment['complete'] = True
+                if segment['until'] is None:
+                    state['updated'] = time.time()
+                log.debug('[*] journal cache {}: {} entries'.format(segment['file'], count))
+
+            self.save_state(state)
+            return state
+
+    def entries(self, state, container_id, since=None, until=None):
+        """ Raw journal lines mentioning container_id within [since, until]
+
+        Lines are pre-filtered on the short id before they are parsed;
+        every segment only yields entries before the next segment starts.
+        """
+        short_id = container_id[:12]
+        needle = short_id.encode('utf-8')
+        since_us = int(since * 1000000) if since else 0
+        until_us = int(until * 1000000) if until else None
+        segments = state['segments']
+        for index, segment in enumerate(segments):
+            end_us = segments[index + 1]['since'] * 1000000 if index + 1 < len(segments) else None
+            try:
+                f = gzip.open(self.get_path(segment['file']), 'rb')
+            except FileNotFoundError:
+                continue
+            with f:
+                try:
+                    for line in f:
+                        if needle not in line:
+                            continue
+                        try:
+                            entry = json.loads(line)
+                            timestamp = int(entry.get('__REALTIME_TIMESTAMP', 0))
+                        except ValueError:
+                            continue
+                        if timestamp < since_us or (until_us is not None and timestamp > until_us):
+                            continue
+                        if end_us is not None and timestamp >= end_us:
+                            continue
+                        if (entry.get('CONTAINER_ID_FULL') == container_id or
+                                entry.get('CONTAINER_ID') == short_id or
+                                short_id in str(entry.get('MESSAGE', ''))):
+                            yield line
+                except (EOFError, gzip.BadGzipFile) as e:
+                    # an export in progress has not completed its last member yet
+                    log.debug('[*] {}: {}'.format(segment['file'], e))
+
+    def write_export(self, path, state, container_id, since=None, until=None):
+        """ gzip compressed JSON Lines of the container's entries
+
+        Returns:
+            int: number of entries written
+        """
+        count = 0
+        with gzip.open(path, 'wb') as f:
+            for line in self.entries(state, container_id, since, until):
+                f.write(line)
+                count += 1
+        return count
+
+
+def get_journal_cache(cache_path=JOURNAL_CACHE_PATH):
+    """ JournalCache shared by every DFbase of the process """
+    with journal_caches_lock:
+        cache_path = os.path.abspath(cache_path)
+        if cache_path not in journal_caches:
+            journal_caches[cache_path] = JournalCache(cache_path)
+        return journal_caches[cache_path]
@@ -0,0 +1,261 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import re
+import gzip
+import time
+import bisect
+import hashlib
+from collections import deque
+from dfjournal import parse_docker_time
+from dflogging import *
+
+
+JSON_LOG_REGX = r"^{}-json\.log(?:\.(\d+))?(\.gz)?$"
+JSON_LOG_TIME_REGX = re.compile(rb'"time": ?"([^"]+)"')
+
+# one index point per JSON_LOG_INDEX_INTERVAL bytes of log
+JSON_LOG_INDEX_INTERVAL = 1024 * 1024
+JSON_LOG_READ_SIZE = 64 * 1024
+
+CONTAINER_LOGS_DIR = "container_logs"
+CONTAINER_LOGS_MANIFEST = "container_logs.json"
+
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_time_option(text, now=None):
+    """ --since/--until value as epoch seconds, like `docker logs` takes them
+
+    Accepts unix timestamps, RFC 3339 times and durations relative to now
+    such as 90s, 10m, 2h or 7d.
+    Raises:
+        ValueError: text is none of these
+    """
+    text = str(text).strip()
+    if text[-1:] in DURATION_UNITS and text[:-1].isdigit():
+        return (now or time.time()) - int(text[:-1]) * DURATION_UNITS[text[-1]]
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    value = parse_docker_time(text)
+    if value is None:
+        raise ValueError('invalid time: {}'.format(text))
+    return value
+
+
+def parse_line_time(line):
+    """ Epoch seconds of a json-file log line, None if it has no time """
+    m = JSON_LOG_TIME_REGX.search(line)
+    if m is None:
+        return None
+    return parse_docker_time(m.group(1).decode('utf-8', 'replace'))
+
+
+def list_json_logs(container_path, container_id):
+    """ json-file log of the container and its rotations, newest first
+
+    Returns:
+        list: (path, compressed) of <id>-json.log, <id>-json.log.1[.gz] ...
+    """
+    regx = re.compile(JSON_LOG_REGX.format(re.escape(container_id)))
+    logs = []
+    try:
+        names = os.listdir(container_path)
+    except OSError as e:
+        log.debug('[*] {}'.format(e))
+        return []
+    for name in names:
+        m = regx.match(name)
+        if m is not None:
+            logs.append((int(m.group(1) or 0), os.path.join(container_path, name), bool(m.group(2))))
+    return [(x[1], x[2]) for x in sorted(logs)]
+
+
+def read_first_time(path, compressed=False):
+    """ Time of the first line of a log, None if empty or unreadable """
+    try:
+        with (gzip.open(path, 'rb') if compressed else open(path, 'rb')) as f:
+            return parse_line_time(f.readline())
+    except (OSError, EOFError):
+        return None
+
+
+class JsonLogIndex():
+    """ Sparse time -> offset index of an uncompressed json-file log
+
+    Every interval bytes the first complete line is read and its time
+    kept with its offset, so a window of a multi-GB log is found with a
+    few seeks instead of a full read. Lines are appended by the daemon in
+    time order.
+
+    Args:
+        f (file): log opened in binary mode
+        interval (int): bytes between index points
+    """
+
+    def __init__(self, f, interval=JSON_LOG_INDEX_INTERVAL):
+        self.f = f
+        self.interval = interval
+        self.size = os.fstat(f.fileno()).st_size
+        self.times = []
+        self.offsets = []
+
+    def build(self):
+        for offset in range(0, self.size, self.interval):
+            self.f.seek(offset)
+            if offset:
+                # skip the line the interval starts in
+                self.f.readline()
+            position = self.f.tell()
+            line = self.f.readline()
+            if not line:
+                break
+            line_time = parse_line_time(line)
+            if line_time is None or (self.offsets and self.offsets[-1] == position):
+                continue
+            self.times.append(line_time)
+            self.offsets.append(position)
+        return self
+
+    def find_start(self, since):
+        """ Offset of a line at or before the first line at since """
+        index = bisect.bisect_left(self.times, since) - 1
+        return self.offsets[index] if index >= 0 else 0
+
+
+def find_tail_offset(f, count, end):
+    """ Offset of the count-th line before end, read backwards in blocks """
+    position = end
+    newlines = 0
+    while position > 0:
+        size = min(JSON_LOG_READ_SIZE, position)
+        position -= size
+        f.seek(position)
+        data = f.read(size)
+        # the newline ending the line before end does not count
+        if position + size == end and data.endswith(b'\n'):
+            data = data[:-1]
+        index = len(data)
+        while True:
+            index = data.rfind(b'\n', 0, index)
+            if index < 0:
+                break
+            newlines += 1
+            if newlines == count:
+                return position + index + 1
+    return 0
+
+
+def find_line(f, start, end, match):
+    """ Offset of the first line in [start, end) whose time matches, else end """
+    f.seek(start)
+    position = start
+    while position < end:
+        line = f.readline()
+        if not line:
+            break
+        line_time = parse_line_time(line)
+        if line_time is not None and match(line_time):
+            return position
+        position += len(line)
+    return end
+
+
+class HashingWriter():
+    """ File writer computing the digests of what is written """
+
+    def __init__(self, f, algorithms):
+        self.f = f
+        self.algorithms = algorithms
+        self.hashers = [hashlib.new(x) for x in algorithms]
+        self.size = 0
+
+    def write(self, data):
+        self.f.write(data)
+        for hasher in self.hashers:
+            hasher.update(data)
+        self.size += len(data)
+
+    def get_digests(self):
+        digests = {name: hasher.hexdigest() for name, hasher in zip(self.algorithms, self.hashers)}
+        digests['size'] = self.size
+        return digests
+
+
+def in_window(line_time, since, until):
+    return ((since is None or line_time >= since) and (until is None or line_time <= until))
+
+
+def extract_json_log(src, dst, algorithms, since=None, until=None, tail=None, compressed=False,
+                        interval=JSON_LOG_INDEX_INTERVAL, original=None):
+    """ Write the lines of a json-file log within [since, until] to dst
+
+    Uncompressed logs are indexed, the exact window boundaries are found
+    by reading from the nearest index points and the window is copied as
+    a byte range; the last tail lines of the window are found by reading
+    backwards from its end. Compressed rotations cannot be seeked and are
+    decompressed as a stream.
+    The size of the source is taken when it is opened, as original_size;
+    original(fd, size) is then called with the same open file, so the
+    original is hashed as it was extracted even if the daemon appends to
+    or rotates it in the meantime.
+    Returns:
+        dict: window, byte range of the source, lines written and their digests
+    """
+    item = {'source': src, 'since': since, 'until': until, 'tail': tail}
+    lines = 0
+
+    with open(src, 'rb') as raw, open(dst, 'wb') as out:
+        item['original_size'] = os.fstat(raw.fileno()).st_size
+        writer = HashingWriter(out, algorithms)
+        if compressed:
+            selected = deque(maxlen=tail)
+            with gzip.GzipFile(fileobj=raw, mode='rb') as f:
+                for line in f:
+                    line_time = parse_line_time(line)
+                    if line_time is not None and not in_window(line_time, since, until):
+                        if until is not None and line_time > until:
+                            break
+                        continue
+                    if tail:
+                        selected.append(line)
+                    else:
+                        writer.write(line)
+                        lines += 1
+            for line in selected:
+                writer.write(line)
+                lines += 1
+        else:
+            index = JsonLogIndex(raw, interval).build()
+            start = 0
+            end = index.size
+            if since is not None:
+                start = find_line(raw, index.find_start(since), end, lambda x: x >= since)
+            if until is not None:
+                end = find_line(raw, max(start, index.find_start(until)), end, lambda x: x > until)
+            if tail:
+                start = max(start, find_tail_offset(raw, tail, end))
+            item['index_points'] = len(index.offsets)
+            item['offset'] = start
+            item['length'] = end - start
+
+            raw.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                data = raw.read(min(JSON_LOG_READ_SIZE, remaining))
+                if not data:
+                    break
+                writer.write(data)
+                lines += data.count(b'\n')
+                remaining -= len(data)
+        item.update(writer.get_digests())
+        if original is not None:
+            item['original'] = original(raw.fileno(), item['original_size'])
+
+    item['lines'] = lines
+    return item
@@ -3,19 +3,206 @@
 __author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
 
 
+import re
+import time
+import queue
+import atexit
+import socket
+import threading
 import logging
 import logging.handlers
 
 LOGFILENAME="./debug.log"
 LOGMAXSIZE = 1024 * 1024
 
+# per-file and per-line messages of hot loops, dropped unless LOG.LEVEL is TRACE
+TRACE = 5
+logging.addLevelName(TRACE, 'TRACE')
+
+LOG_LEVEL = "DEBUG"
+
+SYSLOG_PORT = 514
+SYSLOG_PROTOCOL_UDP = "udp"
+SYSLOG_PROTOCOL_TCP = "tcp"
+SYSLOG_LEVEL = "INFO"
+SYSLOG_BATCH_SIZE = 64
+SYSLOG_BATCH_INTERVAL = 1.0
+
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;]*m')
+
 log = logging.getLogger(__name__)
 syslogUDP = logging.getLogger(__name__)
 
+log_listener = None
+log_configured = False
+log_lock = threading.Lock()
+
+
+class PlainFormatter(logging.Formatter):
+    """ Formatter dropping the terminal colors of the messages """
+
+    def format(self, record):
+        return ANSI_ESCAPE.sub('', super().format(record))
+
+
+class BatchedSysLogHandler(logging.handlers.SysLogHandler):
+    """ SysLogHandler sending the messages in batches
+
+    Messages are buffered and sent once batch_size messages are pending,
+    batch_interval seconds have passed since the oldest one, a WARNING or
+    higher is logged, or the handler is flushed. Run by a
+    BatchingQueueListener, a batch is also sent when it is due while no
+    message arrives. Over TCP a batch is a
+    single write of NUL framed messages, over UDP one datagram per message.
+    A syslog server that cannot be reached drops the batch.
+    """
+
+    def __init__(self, address, socktype=socket.SOCK_DGRAM,
+                    batch_size=SYSLOG_BATCH_SIZE, batch_interval=SYSLOG_BATCH_INTERVAL):
+        super().__init__(address, socktype=socktype)
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.pending = []
+        self.pending_since = 0
+
+    def emit(self, record):
+        try:
+            msg = self.format(record)
+            if self.ident:
+                msg = self.ident + msg
+            if self.append_nul:
+                msg += '\000'
+            prio = '<%d>' % self.encodePriority(self.facility, self.mapPriority(record.levelname))
+            if not self.pending:
+                self.pending_since = time.monotonic()
+            self.pending.append((prio + msg).encode('utf-8'))
+        except Exception:
+            self.handleError(record)
+            return
+        if (len(self.pending) >= self.batch_size or record.levelno >= logging.WARNING or
+                time.monotonic() - self.pending_since >= self.batch_interval):
+            self.flush()
+
+    def flush_if_due(self):
+        """ Send the batch if its interval has passed
+
+        Returns:
+            float: seconds until the pending batch is due, None if nothing is pending
+        """
+        if not self.pending:
+            return None
+        left = self.pending_since + self.batch_interval - time.monotonic()
+        if left > 0:
+            return left
+        self.flush()
+        return None
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+            if not pending:
+                return
+            try:
+                if not self.socket:
+                    self.createSocket()
+                if self.unixsocket:
+                    for msg in pending:
+                        self.socket.send(msg)
+                elif self.socktype == socket.SOCK_DGRAM:
+                    for msg in pending:
+                        self.socket.sendto(msg, self.address)
+                else:
+                    self.socket.sendall(b''.join(pending))
+            except OSError:
+                # reconnect on the next batch
+                if self.socket:
+                    self.socket.close()
+                    self.socket = None
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """ QueueListener sending due syslog batches while the queue is idle """
+
+    def dequeue(self, block):
+        while True:
+            waits = [x.flush_if_due() for x in self.handlers if isinstance(x, BatchedSysLogHandler)]
+            waits = [x for x in waits if x is not None]
+            try:
+                return self.queue.get(block, min(waits) if waits else None)
+            except queue.Empty:
+                if not block or not waits:
+                    raise
+
 
 def df_log_initialize():
+    """ Queue based logging: callers only enqueue records, a listener
+        thread formats them and writes debug.log (and the syslog sink)
+    """
+    global log_listener
+    if log.handlers:
+        return
     log.setLevel(logging.DEBUG)
     log_Handler = logging.handlers.RotatingFileHandler(LOGFILENAME, maxBytes = LOGMAXSIZE, backupCount=1)
     log_format = logging.Formatter('[%(asctime)s|%(filename)s:%(lineno)s], %(message)s')
     log_Handler.setFormatter(log_format)
-    log.addHandler(log_Handler)
+
+    log_queue = queue.SimpleQueue()
+    log.addHandler(logging.handlers.QueueHandler(log_queue))
+    log.propagate = False
+    log_listener = BatchingQueueListener(log_queue, log_Handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(df_log_shutdown)
+
+
+def df_log_shutdown():
+    """ Drain the queue and flush every sink """
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        for handler in log_listener.handlers:
+            handler.close()
+        log_listener = None
+
+
+def get_syslog_handler(syslog_config):
+    """ BatchedSysLogHandler of the SYSLOGSERVER section, None if disabled """
+    if syslog_config.get('ENABLE', 'FALSE') != "TRUE":
+        return None
+    protocol = syslog_config.get('PROTOCOL', SYSLOG_PROTOCOL_UDP).lower()
+    socktype = socket.SOCK_STREAM if protocol == SYSLOG_PROTOCOL_TCP else socket.SOCK_DGRAM
+    address = (syslog_config['HOST'], syslog_config.get('PORT', SYSLOG_PORT))
+    handler = BatchedSysLogHandler(address, socktype,
+                syslog_config.get('BATCH_SIZE', SYSLOG_BATCH_SIZE),
+                syslog_config.get('BATCH_INTERVAL', SYSLOG_BATCH_INTERVAL))
+    handler.setLevel(syslog_config.get('LEVEL', SYSLOG_LEVEL))
+    handler.setFormatter(PlainFormatter('docker-forensics: [%(filename)s:%(lineno)s] %(message)s'))
+    return handler
+
+
+def df_log_configure(config):
+    """ Apply the LOG and SYSLOGSERVER sections of config.json once per process
+
+    Args:
+        config (dict): parsed config.json
+    Returns:
+        bool: False if the syslog sink could not be created
+    """
+    global log_configured
+    with log_lock:
+        if log_configured:
+            return True
+        log_configured = True
+        df_log_initialize()
+        log.setLevel(config.get('LOG', {}).get('LEVEL', LOG_LEVEL))
+        try:
+            handler = get_syslog_handler(config.get('SYSLOGSERVER', {}))
+        except (OSError, KeyError, ValueError) as e:
+            log.debug('[*] syslog sink is not available: {}'.format(e))
+            return False
+        if handler is not None and log_listener is not None:
+            log_listener.handlers = log_listener.handlers + (handler,)
+        return True
@@ -0,0 +1,348 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import zlib
+import array
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dfjsonlog import HashingWriter
+from dflogging import *
+
+
+PROC_PATH = "/proc"
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+ZERO_PAGE = bytes(PAGE_SIZE)
+
+MEMORY_DIR = "memory"
+MEMORY_SUMMARY = "memory_summary.json"
+
+MEMORY_WORKERS = 4
+MEMORY_CHUNK_SIZE = 1024 * 1024
+MAX_PROCESS_BYTES = 512 * 1024 * 1024
+MAX_TOTAL_BYTES = 4 * 1024 * 1024 * 1024
+COMPRESSION_LEVEL = 1
+
+# /proc/<pid>/pagemap entry bits
+PAGEMAP_PRESENT = 1 << 63
+PAGEMAP_SWAPPED = 1 << 62
+
+SKIP_NOT_READABLE = "not readable"
+SKIP_SPECIAL = "special mapping"
+SKIP_DEVICE = "device mapping"
+SKIP_FILE_BACKED = "read-only mapping of the acquired executable"
+
+TRUNCATED_PROCESS = "process size limit"
+TRUNCATED_TOTAL = "total size limit"
+
+# kernel pages which cannot (vvar) or need not be read through /proc/<pid>/mem
+SPECIAL_MAPPINGS = ['[vvar]', '[vvar_vclock]', '[vsyscall]']
+
+
+class MemoryRegion():
+    """ A line of /proc/<pid>/maps """
+    __slots__ = ('start', 'end', 'perms', 'offset', 'dev', 'inode', 'path')
+
+    def __init__(self, start, end, perms, offset, dev, inode, path):
+        self.start = start
+        self.end = end
+        self.perms = perms
+        self.offset = offset
+        self.dev = dev
+        self.inode = inode
+        self.path = path
+
+    @property
+    def size(self):
+        return self.end - self.start
+
+    @property
+    def deleted(self):
+        return self.path.endswith(' (deleted)')
+
+    @property
+    def anonymous(self):
+        """ Not backed by a file, pages never touched read as zeros """
+        return self.inode == 0 and not self.path.startswith('/')
+
+    @property
+    def fileless(self):
+        """ Backed by a file which cannot be acquired from the filesystem """
+        return self.deleted or self.path.startswith('/memfd:')
+
+    def get_priority(self):
+        # injected code first, then heap/stack, then file-backed data
+        if 'x' in self.perms and (self.anonymous or self.fileless):
+            return 0
+        if self.anonymous or self.fileless:
+            return 1
+        return 2
+
+    def to_dict(self):
+        return {
+            'start': '{:x}'.format(self.start),
+            'end': '{:x}'.format(self.end),
+            'perms': self.perms,
+            'offset': '{:x}'.format(self.offset),
+            'inode': self.inode,
+            'path': self.path,
+        }
+
+
+def parse_maps(maps_data):
+    """ MemoryRegion of every mapping of /proc/<pid>/maps """
+    regions = []
+    for line in maps_data.split('\n'):
+        x = line.split(None, 5)
+        if len(x) < 5:
+            continue
+        start, end = x[0].split('-')
+        regions.append(MemoryRegion(int(start, 16), int(end, 16), x[1], int(x[2], 16), x[3],
+                                    int(x[4]), x[5] if len(x) == 6 else ''))
+    return regions
+
+
+def select_regions(regions, skip_file_backed=True, acquired=()):
+    """ Regions worth reading, in the order they are read
+
+    Read-only mappings of the files in acquired (the executable the
+    process collector stored) are skipped; every other file-backed
+    mapping is kept, so shared libraries such as LD_PRELOAD injected ones
+    are dumped, as are deleted files and memfd mappings.
+    Args:
+        acquired (set): paths, as the process sees them, already acquired as files
+    Returns:
+        tuple: (list of selected regions, list of (region, reason) skipped)
+    """
+    selected = []
+    skipped = []
+    for region in regions:
+        if 'r' not in region.perms:
+            skipped.append((region, SKIP_NOT_READABLE))
+        elif region.path in SPECIAL_MAPPINGS:
+            skipped.append((region, SKIP_SPECIAL))
+        elif region.path.startswith('/dev/') and not region.path.startswith('/dev/shm/'):
+            skipped.append((region, SKIP_DEVICE))
+        elif (skip_file_backed and region.path in acquired and not region.fileless and
+                'w' not in region.perms):
+            skipped.append((region, SKIP_FILE_BACKED))
+        else:
+            selected.append(region)
+    selected.sort(key=lambda x: (x.get_priority(), x.start))
+    return selected, skipped
+
+
+def iter_nonzero_runs(data, address):
+    """ (address, bytes) of every run of pages of data which are not all zero """
+    view = memoryview(data)
+    run_start = None
+    for offset in range(0, len(data), PAGE_SIZE):
+        if view[offset:offset + PAGE_SIZE] == ZERO_PAGE[:min(PAGE_SIZE, len(data) - offset)]:
+            if run_start is not None:
+                yield address + run_start, view[run_start:offset]
+                run_start = None
+        elif run_start is None:
+            run_start = offset
+    if run_start is not None:
+        yield address + run_start, view[run_start:]
+
+
+class MemoryBudget():
+    """ Bytes which may still be stored, shared by concurrent dumps """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def take(self, size):
+        """ Returns:
+                int: bytes granted out of size, 0 once the budget is spent
+        """
+        with self.lock:
+            if self.limit:
+                size = max(0, min(size, self.limit - self.used))
+            self.used += size
+            return size
+
+
+class ProcessMemoryDump():
+    """ Non-zero pages of the selected regions of a process
+
+    Regions are read from /proc/<pid>/mem in chunks of chunk_size bytes.
+    For anonymous regions /proc/<pid>/pagemap is read first, pages which
+    were never touched are neither present nor swapped and are not read
+    at all; pages which read as zeros are dropped. Every remaining run of
+    pages is written as a separate gzip member, so a run can be
+    decompressed on its own from its file offset.
+
+    Args:
+        pid (int): host pid
+        max_bytes (int): bytes of pages stored for this process, 0 for no limit
+        budget (MemoryBudget): bytes of pages stored for every process
+        chunk_size (int): bytes read at once, a multiple of the page size
+        level (int): zlib compression level
+    """
+
+    def __init__(self, pid, max_bytes=MAX_PROCESS_BYTES, budget=None, chunk_size=MEMORY_CHUNK_SIZE,
+                    level=COMPRESSION_LEVEL):
+        self.pid = pid
+        self.max_bytes = max_bytes
+        self.budget = budget or MemoryBudget(0)
+        self.chunk_size = max(PAGE_SIZE, chunk_size - chunk_size % PAGE_SIZE)
+        self.level = level
+        self.stored = 0
+        self.read = 0
+        self.pagemap_fd = None
+
+    def take(self, size):
+        """ Returns:
+                tuple: (bytes granted, reason if less than size)
+        """
+        wanted = size
+        if self.max_bytes:
+            wanted = max(0, min(size, self.max_bytes - self.stored))
+        granted = self.budget.take(wanted)
+        if granted < wanted:
+            return granted, TRUNCATED_TOTAL
+        return granted, (TRUNCATED_PROCESS if wanted < size else None)
+
+    def get_present_ranges(self, address, size):
+        """ (address, size) of the pages of an anonymous range ever touched """
+        if self.pagemap_fd is None:
+            return [(address, size)]
+        pages = size // PAGE_SIZE
+        try:
+            entries = array.array('Q')
+            entries.frombytes(os.pread(self.pagemap_fd, pages * 8, address // PAGE_SIZE * 8))
+        except (OSError, ValueError):
+            return [(address, size)]
+        ranges = []
+        run_start = None
+        for index, entry in enumerate(entries):
+            if entry & (PAGEMAP_PRESENT | PAGEMAP_SWAPPED):
+                if run_start is None:
+                    run_start = index
+            elif run_start is not None:
+                ranges.append((address + run_start * PAGE_SIZE, (index - run_start) * PAGE_SIZE))
+                run_start = None
+        if run_start is not None:
+            ranges.append((address + run_start * PAGE_SIZE, (len(entries) - run_start) * PAGE_SIZE))
+        return ranges
+
+    def write_run(self, writer, run_address, data, item):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        offset = writer.size
+        writer.write(compressor.compress(data) + compressor.flush())
+        item['runs'].append(['{:x}'.format(run_address), len(data), offset, writer.size - offset])
+
+    def dump_region(self, mem_fd, region, writer):
+        item = region.to_dict()
+        item.update({'runs': [], 'stored_bytes': 0, 'zero_bytes': 0, 'untouched_bytes': 0,
+                        'unreadable_bytes': 0})
+
+        for chunk_address in range(region.start, region.end, self.chunk_size):
+            chunk_size = min(self.chunk_size, region.end - chunk_address)
+            ranges = (self.get_present_ranges(chunk_address, chunk_size) if region.anonymous
+                        else [(chunk_address, chunk_size)])
+            item['untouched_bytes'] += chunk_size - sum(x[1] for x in ranges)
+
+            for address, size in ranges:
+                try:
+                    data = os.pread(mem_fd, size, address)
+                except OSError:
+                    data = b''
+                self.read += len(data)
+                item['unreadable_bytes'] += size - len(data)
+
+                nonzero = 0
+                for run_address, run in iter_nonzero_runs(data, address):
+                    nonzero += len(run)
+                    granted, reason = self.take(len(run))
+                    if granted:
+                        self.write_run(writer, run_address, run[:granted], item)
+                        self.stored += granted
+                        item['stored_bytes'] += granted
+                    if reason is not None:
+                        item['truncated'] = reason
+                        return item
+                item['zero_bytes'] += len(data) - nonzero
+        return item
+
+    def dump(self, dst, algorithms, skip_file_backed=True, acquired=()):
+        """ Write the pages of the process to dst
+
+        acquired lists the files of the process already acquired, see select_regions.
+
+        Returns:
+            dict: regions read (with their runs) and skipped, byte counts
+                  and the digests of dst; 'error' if the process could not
+                  be read
+        """
+        result = {'pid': self.pid, 'regions': [], 'skipped': [], 'read_bytes': 0, 'stored_bytes': 0}
+        try:
+            with open('{}/{}/maps'.format(PROC_PATH, self.pid), 'r') as f:
+                regions = parse_maps(f.read())
+            mem_fd = os.open('{}/{}/mem'.format(PROC_PATH, self.pid), os.O_RDONLY)
+        except OSError as e:
+            log.debug('[*] PID:{} memory is not readable: {}'.format(self.pid, e))
+            result['error'] = str(e)
+            return result
+        try:
+            self.pagemap_fd = os.open('{}/{}/pagemap'.format(PROC_PATH, self.pid), os.O_RDONLY)
+        except OSError as e:
+            log.debug('[*] PID:{} pagemap is not readable: {}'.format(self.pid, e))
+
+        selected, skipped = select_regions(regions, skip_file_backed, acquired)
+        result['skipped'] = [dict(x.to_dict(), reason=y) for x, y in skipped]
+        try:
+            with open(dst, 'wb') as f:
+                writer = HashingWriter(f, algorithms)
+                for region in selected:
+                    item = self.dump_region(mem_fd, region, writer)
+                    result['regions'].append(item)
+                    log.log(TRACE, '[*] PID:%s %s-%s %s: %s bytes stored', self.pid, item['start'],
+                                item['end'], item['path'], item['stored_bytes'])
+                    if 'truncated' in item:
+                        result['truncated'] = item['truncated']
+                        break
+            result.update(writer.get_digests())
+        finally:
+            os.close(mem_fd)
+            if self.pagemap_fd is not None:
+                os.close(self.pagemap_fd)
+                self.pagemap_fd = None
+
+        result['read_bytes'] = self.read
+        result['stored_bytes'] = self.stored
+        return result
+
+
+def dump_processes(pids, get_path, algorithms, config=None, budget=None, acquired=None):
+    """ Dump the memory of every pid concurrently
+
+    Args:
+        pids (list): host pids
+        get_path (callable): file a pid is written to, e.g. an output's
+            get_command_path for 'memory/<pid>.mem.gz'
+        algorithms (list): digests of the written files
+        config (dict): MEMORY section of config.json
+        budget (MemoryBudget): overrides MAX_TOTAL_BYTES of config
+        acquired (dict): pid -> paths of its files already acquired
+    Returns:
+        list: ProcessMemoryDump.dump results, in the order of pids
+    """
+    config = config or {}
+    if budget is None:
+        budget = MemoryBudget(config.get('MAX_TOTAL_BYTES', MAX_TOTAL_BYTES))
+    skip_file_backed = (False if config.get('SKIP_FILE_BACKED') == "FALSE" else True)
+
+    def dump(pid):
+        dumper = ProcessMemoryDump(pid, config.get('MAX_PROCESS_BYTES', MAX_PROCESS_BYTES), budget,
+                    config.get('CHUNK_SIZE', MEMORY_CHUNK_SIZE), config.get('COMPRESSION_LEVEL', COMPRESSION_LEVEL))
+        return dumper.dump(get_path(pid), algorithms, skip_file_backed, (acquired or {}).get(pid, ()))
+
+    with ThreadPoolExecutor(max_workers=max(1, config.get('WORKERS', MEMORY_WORKERS))) as executor:
+        return list(executor.map(dump, pids))
@@ -0,0 +1,202 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import sys
+import time
+import resource
+import threading
+from contextlib import contextmanager
+from dflogging import *
+
+
+METRICS_FILE = "run_metrics.json"
+PROGRESS_INTERVAL = 5
+
+IO_FIELDS = ['rchar', 'wchar', 'read_bytes', 'write_bytes', 'syscr', 'syscw']
+
+
+def read_io(path='/proc/self/io'):
+    """ I/O counters of /proc/self/io or /proc/thread-self/io, {} if unreadable """
+    io = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                key, sep, value = line.partition(':')
+                if key in IO_FIELDS:
+                    io[key] = int(value)
+    except (OSError, ValueError):
+        pass
+    return io
+
+
+def diff_io(before, after):
+    return {x: after[x] - before.get(x, 0) for x in after}
+
+
+def round_counters(counters):
+    return {x: round(y, 4) if isinstance(y, float) else y for x, y in counters.items()}
+
+
+class RunMetrics():
+    """ Timing and resource counters of one collection run
+
+    Every collector is measured on the thread running it: wall and CPU
+    time and the thread's I/O. Counters such as subprocesses, files
+    visited or bytes acquired are added to the collector the calling
+    thread works for; work handed to pools keeps its collector through
+    wrap(), which also counts its CPU time as pool_cpu_seconds. The run
+    totals are the sums over the collectors, so they only cover this
+    run even when several containers are collected at once; rusage and
+    /proc/self/io cover the whole process and are reported apart under
+    'process'. With progress set, collector start/end and a periodic list
+    of the running collectors are printed to stderr.
+
+    Args:
+        progress (bool): live progress on stderr
+        total (int): number of collectors, for the progress lines
+        label (str): prefix of the progress lines, e.g. the container id
+    """
+
+    def __init__(self, progress=False, total=0, label=''):
+        self.progress = progress
+        self.total = total
+        self.label = label
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.collectors = {}
+        self.running = {}
+        self.counters = {}
+        self.finished = 0
+        self.started = time.time()
+        self.perf_started = time.perf_counter()
+        self.rusage = resource.getrusage(resource.RUSAGE_SELF)
+        self.children_rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.io = read_io()
+        self.ticker = None
+        self.stopped = threading.Event()
+
+    def current(self):
+        return getattr(self.local, 'collector', None)
+
+    def count(self, key, value=1):
+        """ Add value to key of the current collector and of the run """
+        name = self.current()
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            if name is not None:
+                counters = self.collectors.setdefault(name, {}).setdefault('counters', {})
+                counters[key] = counters.get(key, 0) + value
+
+    @contextmanager
+    def timed(self, key):
+        """ Count key and add the wall time spent to key_seconds """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.count(key)
+            self.count(key + '_seconds', time.perf_counter() - start)
+
+    def wrap(self, fn):
+        """ fn running on another thread on behalf of the current collector """
+        name = self.current()
+
+        def wrapper(*args, **kwargs):
+            previous = self.current()
+            self.local.collector = name
+            cpu = time.thread_time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                # on the collector's own thread the time is already measured
+                if previous != name:
+                    self.count('pool_cpu_seconds', time.thread_time() - cpu)
+                self.local.collector = previous
+        return wrapper
+
+    @contextmanager
+    def measure(self, name):
+        """ Measure the collector name run by the calling thread """
+        self.local.collector = name
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        io = read_io('/proc/thread-self/io')
+        with self.lock:
+            self.running[name] = time.time()
+        self.print_progress('start  {}'.format(name))
+        try:
+            yield
+        finally:
+            entry = {
+                'wall_seconds': round(time.perf_counter() - wall, 4),
+                'cpu_seconds': round(time.thread_time() - cpu, 4),
+                'io': diff_io(io, read_io('/proc/thread-self/io')),
+            }
+            with self.lock:
+                self.running.pop(name, None)
+                self.collectors.setdefault(name, {}).update(entry)
+                self.finished += 1
+                finished = self.finished
+            self.local.collector = None
+            self.print_progress('done   {} ({}/{}) {:.3f}s'.format(name, finished,
+                                    self.total or '?', entry['wall_seconds']))
+
+    def print_progress(self, message):
+        if self.progress:
+            sys.stderr.write('[*] {} {:8.1f}s {}\n'.format(self.label, time.perf_counter() - self.perf_started,
+                                message))
+            sys.stderr.flush()
+
+    def start_ticker(self, interval=PROGRESS_INTERVAL):
+        """ Print the running collectors every interval seconds """
+        if not self.progress or self.ticker is not None:
+            return
+
+        def tick():
+            while not self.stopped.wait(interval):
+                now = time.time()
+                with self.lock:
+                    running = ['{} {:.0f}s'.format(x, now - y) for x, y in self.running.items()]
+                if running:
+                    self.print_progress('running ' + ', '.join(running))
+
+        self.ticker = threading.Thread(target=tick, daemon=True)
+        self.ticker.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def get_report(self):
+        """ Returns:
+                dict: run totals, per collector metrics and process-wide usage
+        """
+        self.stop()
+        rusage = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        with self.lock:
+            io = {}
+            for entry in self.collectors.values():
+                for key, value in entry.get('io', {}).items():
+                    io[key] = io.get(key, 0) + value
+            cpu = sum(x.get('cpu_seconds', 0) for x in self.collectors.values())
+            return {
+                'started': time.ctime(self.started),
+                'wall_seconds': round(time.perf_counter() - self.perf_started, 4),
+                'cpu_seconds': round(cpu + self.counters.get('pool_cpu_seconds', 0), 4),
+                'io': io,
+                'counters': round_counters(self.counters),
+                'process': {
+                    'scope': 'process-wide, includes every container collected concurrently',
+                    'cpu_user_seconds': round(rusage.ru_utime - self.rusage.ru_utime, 4),
+                    'cpu_system_seconds': round(rusage.ru_stime - self.rusage.ru_stime, 4),
+                    'subprocess_cpu_seconds': round(max(0.0, children.ru_utime + children.ru_stime -
+                                                        self.children_rusage.ru_utime -
+                                                        self.children_rusage.ru_stime), 4),
+                    'max_rss_kb': rusage.ru_maxrss,
+                    'io': diff_io(self.io, read_io()),
+                },
+                'collectors': {x: dict(y, counters=round_counters(y.get('counters', {})))
+                                for x, y in self.collectors.items()},
+            }
@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import socket
+import struct
+from dfproc import PROC_PATH, read_proc_file, get_container_pids, parse_stat, get_username
+from dflogging import *
+
+
+NET_INET_TABLES = [
+    # (file, protocol, family)
+    ('tcp', 'TCP', 'IPv4'),
+    ('tcp6', 'TCP', 'IPv6'),
+    ('udp', 'UDP', 'IPv4'),
+    ('udp6', 'UDP', 'IPv6'),
+]
+
+TCP_STATES = {
+    '01': 'ESTABLISHED', '02': 'SYN_SENT', '03': 'SYN_RECV', '04': 'FIN_WAIT1',
+    '05': 'FIN_WAIT2', '06': 'TIME_WAIT', '07': 'CLOSE', '08': 'CLOSE_WAIT',
+    '09': 'LAST_ACK', '0A': 'LISTEN', '0B': 'CLOSING', '0C': 'NEW_SYN_RECV',
+}
+
+UNIX_TYPES = {'0001': 'STREAM', '0002': 'DGRAM', '0005': 'SEQPACKET'}
+UNIX_STATES = {'01': 'UNCONNECTED', '02': 'CONNECTING', '03': 'CONNECTED', '04': 'DISCONNECTING'}
+
+SOCKET_LINK_PREFIX = 'socket:['
+
+
+def decode_address(address):
+    """ 'ip:port' in /proc/net/{tcp,udp}[6] hex notation
+
+    Addresses are 32 bit words in host byte order, ports big endian.
+    Returns:
+        tuple: (ip, port)
+    """
+    ip_hex, port_hex = address.split(':')
+    raw = bytes.fromhex(ip_hex)
+    words = [raw[x:x + 4] for x in range(0, len(raw), 4)]
+    packed = b''.join(struct.pack('=I', struct.unpack('>I', x)[0]) for x in words)
+    family = socket.AF_INET if len(packed) == 4 else socket.AF_INET6
+    return socket.inet_ntop(family, packed), int(port_hex, 16)
+
+
+def parse_inet_table(data, protocol, family):
+    """ Rows of /proc/<pid>/net/{tcp,udp}[6] """
+    sockets = []
+    for line in data.split('\n')[1:]:
+        x = line.split()
+        if len(x) < 10:
+            continue
+        local_ip, local_port = decode_address(x[1])
+        remote_ip, remote_port = decode_address(x[2])
+        tx_queue, rx_queue = x[4].split(':')
+        if protocol == 'TCP':
+            state = TCP_STATES.get(x[3], x[3])
+        else:
+            state = 'UNCONN' if x[3] == '07' else TCP_STATES.get(x[3], x[3])
+        sockets.append({
+            'PROTO': protocol,
+            'TYPE': family,
+            'LOCAL_ADDRESS': local_ip,
+            'LOCAL_PORT': local_port,
+            'REMOTE_ADDRESS': remote_ip,
+            'REMOTE_PORT': remote_port,
+            'STATE': state,
+            'TX_QUEUE': int(tx_queue, 16),
+            'RX_QUEUE': int(rx_queue, 16),
+            'UID': int(x[7]),
+            'INODE': int(x[9]),
+        })
+    return sockets
+
+
+def parse_unix_table(data):
+    """ Rows of /proc/<pid>/net/unix """
+    sockets = []
+    for line in data.split('\n')[1:]:
+        x = line.split(None, 7)
+        if len(x) < 7:
+            continue
+        sockets.append({
+            'PROTO': 'UNIX',
+            'TYPE': 'unix',
+            'SOCKET_TYPE': UNIX_TYPES.get(x[4], x[4]),
+            'STATE': 'LISTEN' if int(x[3], 16) & 0x10000 else UNIX_STATES.get(x[5], x[5]),
+            'INODE': int(x[6]),
+            'PATH': x[7] if len(x) > 7 else '',
+        })
+    return sockets
+
+
+def get_socket_owners(pids):
+    """ Socket inode -> [(pid, fd, command, user)] of the given processes """
+    owners = {}
+    for pid in pids:
+        fd_path = '{}/{}/fd'.format(PROC_PATH, pid)
+        try:
+            fds = os.listdir(fd_path)
+            command = parse_stat(read_proc_file(pid, 'stat'))['comm']
+            uid = os.stat('{}/{}'.format(PROC_PATH, pid)).st_uid
+        except (OSError, IndexError, ValueError) as e:
+            log.debug('[*] PID:{} is not readable: {}'.format(pid, e))
+            continue
+        for fd in fds:
+            try:
+                link = os.readlink('{}/{}'.format(fd_path, fd))
+            except OSError:
+                continue
+            if link.startswith(SOCKET_LINK_PREFIX):
+                inode = int(link[len(SOCKET_LINK_PREFIX):-1])
+                owners.setdefault(inode, []).append((pid, fd, command, get_username(uid)))
+    return owners
+
+
+def format_endpoint(ip, port):
+    if ':' in ip:
+        ip = '[{}]'.format(ip)
+    return '{}:{}'.format('*' if ip in ('0.0.0.0', '[::]') else ip, '*' if not port else port)
+
+
+def format_name(sock):
+    """ NAME column as lsof -i prints it, with numeric hosts and ports """
+    name = format_endpoint(sock['LOCAL_ADDRESS'], sock['LOCAL_PORT'])
+    if sock['REMOTE_PORT']:
+        name += '->' + format_endpoint(sock['REMOTE_ADDRESS'], sock['REMOTE_PORT'])
+    if sock['PROTO'] == 'TCP':
+        name += ' ({})'.format(sock['STATE'])
+    return name
+
+
+def collect_network_sessions(pid, unix=True):
+    """ Sockets of the container's network namespace with their owners
+
+    /proc/<pid>/net shows the tables of the namespace pid lives in; sockets
+    are mapped to processes through the socket:[inode] links in
+    /proc/<pid>/fd of every process of the container. Every record keeps the
+    nsenter+lsof columns (COMMAND, PID, USER, FD, TYPE, DEVICE, SIZEOFF,
+    NODE, NAME) and adds the parsed table fields. Sockets without an owner
+    (e.g. TIME_WAIT) are kept with an empty PID.
+
+    Args:
+        pid (int): host pid of the container init process
+        unix (bool): include unix domain sockets
+    Returns:
+        list: socket records, None when the tables are not readable
+    """
+    sockets = []
+    try:
+        for name, protocol, family in NET_INET_TABLES:
+            try:
+                sockets += parse_inet_table(read_proc_file(pid, 'net/' + name), protocol, family)
+            except FileNotFoundError:
+                # no IPv6 in the namespace
+                continue
+        if unix:
+            sockets += parse_unix_table(read_proc_file(pid, 'net/unix'))
+    except OSError as e:
+        log.debug('[*] network tables of {} are not readable: {}'.format(pid, e))
+        return None
+
+    owners = get_socket_owners(get_container_pids(pid) or [pid])
+
+    records = []
+    for sock in sockets:
+        if sock['PROTO'] == 'UNIX':
+            name = sock['PATH'] or 'type={}'.format(sock['SOCKET_TYPE'])
+        else:
+            name = format_name(sock)
+        for owner_pid, fd, command, user in owners.get(sock['INODE']) or [('', '', '', '')]:
+            if sock['PROTO'] == 'UNIX' and not owner_pid:
+                continue
+            record = {
+                'COMMAND': command,
+                'PID': str(owner_pid),
+                'USER': user,
+                'FD': fd + 'u' if fd else '',
+                'TYPE': sock['TYPE'],
+                'DEVICE': '',
+                'SIZEOFF': '0t0',
+                'NODE': sock['PROTO'] if sock['PROTO'] != 'UNIX' else str(sock['INODE']),
+                'NAME': name,
+            }
+            record.update(sock)
+            records.append(record)
+    return records
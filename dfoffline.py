@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import json
+from dflogging import *
+
+
+DOCKER_ROOT = "/var/lib/docker"
+
+CONTAINER_CONFIG = "config.v2.json"
+CONTAINER_HOSTCONFIG = "hostconfig.json"
+
+
+def list_offline_containers(docker_root=DOCKER_ROOT):
+    """ Ids of every container stored under docker_root/containers """
+    containers_path = os.path.join(docker_root, 'containers')
+    try:
+        names = os.listdir(containers_path)
+    except OSError as e:
+        log.debug('[*] {}'.format(e))
+        return []
+    return sorted(x for x in names
+                    if os.path.isfile(os.path.join(containers_path, x, CONTAINER_CONFIG)))
+
+
+def read_mount_id(docker_root, driver, container_id):
+    mountid_file = os.path.join(docker_root, 'image', driver, 'layerdb', 'mounts',
+                                container_id, 'mount-id')
+    with open(mountid_file, 'r') as fd:
+        return fd.readline().strip()
+
+
+def get_graph_driver_data(docker_root, driver, container_id):
+    """ GraphDriver.Data of docker inspect rebuilt from the storage directories
+
+    Args:
+        docker_root (str): docker data root, e.g. a mounted image's /var/lib/docker
+        driver (str): storage driver of the container
+        container_id (str): full container id
+    Returns:
+        dict: UpperDir, MergedDir, LowerDir ... as the daemon reports them
+    """
+    if driver == 'aufs':
+        return {}
+
+    mount_id = read_mount_id(docker_root, driver, container_id)
+    layer_path = os.path.join(docker_root, driver, mount_id)
+
+    if driver == 'overlay2':
+        data = {'UpperDir': os.path.join(layer_path, 'diff'),
+                'MergedDir': os.path.join(layer_path, 'merged'),
+                'WorkDir': os.path.join(layer_path, 'work')}
+        try:
+            with open(os.path.join(layer_path, 'lower'), 'r') as fd:
+                lower = fd.read().strip()
+        except FileNotFoundError:
+            lower = ''
+        # l/<short id> symlinks point to ../<layer>/diff
+        lowerdirs = [os.path.realpath(os.path.join(docker_root, driver, x))
+                        for x in lower.split(':') if x]
+        if lowerdirs:
+            data['LowerDir'] = ':'.join(lowerdirs)
+        return data
+
+    if driver == 'overlay':
+        data = {'UpperDir': os.path.join(layer_path, 'upper'),
+                'MergedDir': os.path.join(layer_path, 'merged'),
+                'WorkDir': os.path.join(layer_path, 'work')}
+        try:
+            with open(os.path.join(layer_path, 'lower-id'), 'r') as fd:
+                data['LowerDir'] = os.path.join(docker_root, driver, fd.readline().strip(), 'root')
+        except FileNotFoundError:
+            pass
+        return data
+
+    raise ValueError('Unsupported storage driver: {}'.format(driver))
+
+
+def build_inspect_item(docker_root, container_id):
+    """ docker inspect item of a container read from docker_root alone
+
+    Built from config.v2.json, hostconfig.json and the layerdb, with
+    State.Pid set to 0 as no process of the container is reachable.
+    """
+    container_path = os.path.join(docker_root, 'containers', container_id)
+    with open(os.path.join(container_path, CONTAINER_CONFIG), 'r') as fd:
+        config = json.load(fd)
+    try:
+        with open(os.path.join(container_path, CONTAINER_HOSTCONFIG), 'r') as fd:
+            hostconfig = json.load(fd)
+    except (OSError, ValueError):
+        hostconfig = {}
+
+    driver = config.get('Driver', '')
+    state = dict(config.get('State', {}))
+    state['Pid'] = 0
+
+    return {
+        'Id': config.get('ID', container_id),
+        'Created': config.get('Created'),
+        'Path': config.get('Path'),
+        'Args': config.get('Args'),
+        'State': state,
+        'Image': config.get('Image'),
+        'Name': config.get('Name'),
+        'Driver': driver,
+        'Mounts': list(config.get('MountPoints', {}).values()),
+        'Config': config.get('Config'),
+        'HostConfig': hostconfig,
+        'NetworkSettings': config.get('NetworkSettings'),
+        'GraphDriver': {'Name': driver,
+                        'Data': get_graph_driver_data(docker_root, driver, config.get('ID', container_id))},
+    }
+
+
+def inspect_offline_containers(docker_root, container_ids):
+    """ inspect_containers of dfbatch reading docker_root instead of the daemon
+
+    Args:
+        docker_root (str): docker data root
+        container_ids (list): ids or unique id prefixes, every container if empty
+    Returns:
+        tuple: (dict of requested id -> inspect item, list of unknown ids)
+    """
+    available = list_offline_containers(docker_root)
+    inspected = {}
+    unknown = []
+    for container_id in container_ids or available:
+        matches = [x for x in available if x.startswith(container_id)]
+        if len(matches) != 1:
+            unknown.append(container_id)
+            continue
+        try:
+            inspected[container_id] = build_inspect_item(docker_root, matches[0])
+        except Exception as e:
+            log.debug('[*] {}: {}'.format(container_id, e))
+            unknown.append(container_id)
+    return inspected, unknown
@@ -0,0 +1,466 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import io
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import threading
+from dfcopy import copy_and_hash, EVIDENCE_MODE_MASK
+from dflogging import *
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+OUTPUT_DIRECTORY = "directory"
+OUTPUT_ARCHIVE = "archive"
+
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+
+# the extension follows the compression, see get_archive_extension
+ARCHIVE_PATH = "./artifacts/{}"
+ARCHIVE_EXTENSIONS = {COMPRESSION_GZIP: ".tar.gz", COMPRESSION_ZSTD: ".tar.zst"}
+ARCHIVE_MANIFEST = "manifest.json"
+ARCHIVE_STDOUT = "-"
+
+MANIFEST_ALGORITHMS = ["sha256"]
+
+RECORDS_JSON = "json"
+RECORDS_NDJSON = "ndjson"
+RECORDS_FLUSH_EVERY = 256
+# records spooled for the archive are compressed this much, speed over size
+SPOOL_COMPRESSLEVEL = 1
+
+
+class DirectoryOutput():
+    """ Artifacts written as loose files under the artifacts path """
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+
+    def get_path(self, name):
+        return '{}/{}'.format(self.base_path, name)
+
+    def makedirs(self, name):
+        dirname = os.path.dirname(self.get_path(name))
+        if not os.path.exists(dirname):
+            os.makedirs(dirname, mode=0o700, exist_ok=True)
+
+    def write_json(self, name, data):
+        self.makedirs(name)
+        with open(self.get_path(name), 'w') as f:
+            json.dump(data, f, indent=4)
+
+    def write_bytes(self, name, data):
+        self.makedirs(name)
+        with open(self.get_path(name), 'wb') as f:
+            f.write(data)
+
+    def add_file(self, src, name, algorithms=MANIFEST_ALGORITHMS):
+        """ Returns:
+                dict: digests of the copied file and its 'size'
+        """
+        self.makedirs(name)
+        return copy_and_hash(src, self.get_path(name), algorithms)
+
+    def has(self, name):
+        return os.path.exists(self.get_path(name))
+
+    def get_command_path(self, name):
+        """ Path an external command (journalctl, shell redirect) writes to """
+        self.makedirs(name)
+        return self.get_path(name)
+
+    def commit_command_file(self, name):
+        return True
+
+    def open_record_file(self, name):
+        """ Text file the records of a RecordWriter are written to """
+        return open(self.get_command_path(name), 'w')
+
+    def commit_record_file(self, name, fd):
+        fd.close()
+        return True
+
+    def close(self):
+        return True
+
+
+def format_json_record(record, first):
+    """ A record of a list as json.dump(list, f, indent=4) writes it """
+    text = json.dumps(record, indent=4).replace('\n', '\n    ')
+    return ('[\n    ' if first else ',\n    ') + text
+
+
+class RecordWriter():
+    """ Streams the records of a list artifact as they are discovered
+
+    Records are written either as JSON Lines (<name>.ndjson, flushed every
+    RECORDS_FLUSH_EVERY records so a killed run keeps what was found) or as
+    the indented JSON array of <name>.json. Memory use does not depend on
+    the number of records. The file is only created with the first record
+    unless always is set.
+
+    Args:
+        output (DirectoryOutput or ArchiveOutput): destination
+        name (str): artifact name without extension, e.g. 'diff'
+        ndjson (bool): JSON Lines instead of a JSON array
+        always (bool): write an empty list when there is no record
+    """
+
+    def __init__(self, output, name, ndjson=False, always=False):
+        self.output = output
+        self.ndjson = ndjson
+        self.always = always
+        self.filename = name + ('.ndjson' if ndjson else '.json')
+        self.fd = None
+        self.count = 0
+
+    def write(self, record):
+        if self.fd is None:
+            self.fd = self.output.open_record_file(self.filename)
+        if self.ndjson:
+            self.fd.write(json.dumps(record))
+            self.fd.write('\n')
+        else:
+            self.fd.write(format_json_record(record, self.count == 0))
+        self.count += 1
+        if self.count % RECORDS_FLUSH_EVERY == 0:
+            self.fd.flush()
+
+    def close(self):
+        """ Returns:
+                int: number of records written
+        """
+        if self.fd is None:
+            if not self.always:
+                return 0
+            self.fd = self.output.open_record_file(self.filename)
+            if not self.ndjson:
+                self.fd.write('[]')
+        elif not self.ndjson:
+            self.fd.write('\n]')
+        self.output.commit_record_file(self.filename, self.fd)
+        return self.count
+
+
+def convert_ndjson_to_json(src, dst=None):
+    """ Convert a JSON Lines artifact back to the JSON array format
+
+    Args:
+        src (str): <name>.ndjson
+        dst (str): destination, <name>.json next to src by default
+    Returns:
+        int: number of records converted
+    """
+    if dst is None:
+        dst = (src[:-len('.ndjson')] if src.endswith('.ndjson') else src) + '.json'
+    count = 0
+    with open(src, 'r') as fsrc, open(dst, 'w') as fdst:
+        for line in fsrc:
+            line = line.strip()
+            if not line:
+                continue
+            fdst.write(format_json_record(json.loads(line), count == 0))
+            count += 1
+        fdst.write('\n]' if count else '[]')
+    return count
+
+
+class _HashingReader():
+    """ File object wrapper hashing the data tarfile reads from it
+
+    With pad, reads past the end of the file return zeros: tarfile reads
+    exactly the size of the member header, and a live file shrinking
+    while it is read would otherwise leave the rest of the archive
+    misaligned. The zeros added are counted in padded.
+    """
+
+    def __init__(self, fileobj, algorithms, pad=False):
+        self.fileobj = fileobj
+        self.names = algorithms
+        self.hashers = [hashlib.new(x) for x in algorithms]
+        self.size = 0
+        self.pad = pad
+        self.padded = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        if self.pad and 0 < size and len(data) < size:
+            self.padded += size - len(data)
+            data += bytes(size - len(data))
+        for hasher in self.hashers:
+            hasher.update(data)
+        self.size += len(data)
+        return data
+
+    def digests(self):
+        digests = {name: hasher.hexdigest() for name, hasher in zip(self.names, self.hashers)}
+        digests['size'] = self.size
+        if self.padded:
+            digests['padded'] = self.padded
+        return digests
+
+
+class _SpoolWriter():
+    """ Text file written gzip compressed, counting its uncompressed size """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = gzip.open(path, 'wb', compresslevel=SPOOL_COMPRESSLEVEL)
+        self.size = 0
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.fd.write(data)
+        self.size += len(data)
+
+    def flush(self):
+        self.fd.flush()
+
+    def close(self):
+        self.fd.close()
+
+
+def get_archive_compression(compression):
+    """ Compression an archive is actually written with, gzip without zstandard """
+    if compression == COMPRESSION_ZSTD and zstandard is None:
+        log.debug('[*] zstandard module is not installed, falling back to gzip')
+        return COMPRESSION_GZIP
+    return compression
+
+
+def get_archive_extension(compression):
+    return ARCHIVE_EXTENSIONS.get(compression, ARCHIVE_EXTENSIONS[COMPRESSION_GZIP])
+
+
+class ArchiveOutput():
+    """ Artifacts streamed into a single compressed tar as they are collected
+
+    Members are appended in stream mode, so no uncompressed copy of the
+    evidence is written. A manifest with the offset of every member in the
+    uncompressed tar stream and its digests is appended as the last member
+    and, unless streaming to stdout, also written next to the archive.
+
+    Args:
+        archive_path (str): archive file, '-' for stdout
+        compression (str): 'gzip' or 'zstd' (needs the zstandard module)
+        prefix (str): directory of the members inside the archive
+    """
+
+    def __init__(self, archive_path, compression=COMPRESSION_GZIP, prefix=''):
+        self.archive_path = archive_path
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.names = set()
+        self.name_locks = {}
+        self.manifest = []
+        self.closed = False
+        self.spool_dir = None
+        self.compressor = None
+
+        if archive_path == ARCHIVE_STDOUT:
+            # the real stdout, sys.stdout may be redirected to stderr for messages
+            self.fileobj = sys.__stdout__.buffer
+            self.own_fileobj = False
+        else:
+            dirname = os.path.dirname(os.path.abspath(archive_path))
+            if not os.path.exists(dirname):
+                os.makedirs(dirname, mode=0o700, exist_ok=True)
+            self.fileobj = open(archive_path, 'wb')
+            self.own_fileobj = True
+
+        compression = self.compression = get_archive_compression(compression)
+
+        if compression == COMPRESSION_ZSTD:
+            self.compressor = zstandard.ZstdCompressor().stream_writer(self.fileobj, closefd=False)
+            self.tar = tarfile.open(fileobj=self.compressor, mode='w|', format=tarfile.PAX_FORMAT)
+        else:
+            self.tar = tarfile.open(fileobj=self.fileobj, mode='w|gz', format=tarfile.PAX_FORMAT)
+
+    def _member_name(self, name):
+        return os.path.join(self.prefix, name) if self.prefix else name
+
+    def _add(self, name, tarinfo, fileobj=None, digests=None):
+        """ Append a member and record it in the manifest, lock held """
+        if self.closed:
+            log.debug('[*] archive is closed, dropping {}'.format(name))
+            return None
+        offset = self.tar.offset
+        if fileobj is not None and not isinstance(fileobj, _HashingReader):
+            fileobj = _HashingReader(fileobj, MANIFEST_ALGORITHMS)
+        self.tar.addfile(tarinfo, fileobj)
+        if fileobj is not None:
+            digests = dict(fileobj.digests(), **(digests or {}))
+        blocks, remainder = divmod(tarinfo.size, tarfile.BLOCKSIZE)
+        data_size = (blocks + (1 if remainder else 0)) * tarfile.BLOCKSIZE
+        entry = {'name': tarinfo.name, 'offset': offset,
+                 'data_offset': self.tar.offset - data_size, 'size': tarinfo.size}
+        if tarinfo.islnk():
+            entry['link'] = tarinfo.linkname
+        entry.update(digests or {})
+        self.manifest.append(entry)
+        self.names.add(name)
+        return digests
+
+    def write_bytes(self, name, data):
+        tarinfo = tarfile.TarInfo(self._member_name(name))
+        tarinfo.size = len(data)
+        tarinfo.mtime = time.time()
+        tarinfo.mode = 0o600
+        with self.lock:
+            return self._add(name, tarinfo, io.BytesIO(data))
+
+    def write_json(self, name, data):
+        self.write_bytes(name, json.dumps(data, indent=4).encode('utf-8'))
+
+    def add_file(self, src, name, algorithms=MANIFEST_ALGORITHMS):
+        """ Stream a file into the archive, hashing it while it is read
+
+        Returns:
+            dict: digests of the file and its 'size'
+        """
+        with open(src, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if st.st_size == 0:
+                # files such as those in /proc report size 0, read them first
+                data = f.read()
+                tarinfo = tarfile.TarInfo(self._member_name(name))
+                tarinfo.size = len(data)
+                tarinfo.mtime = st.st_mtime
+                tarinfo.mode = st.st_mode & EVIDENCE_MODE_MASK
+                reader = _HashingReader(io.BytesIO(data), algorithms)
+                with self.lock:
+                    self._add(name, tarinfo, reader)
+                return reader.digests()
+
+            tarinfo = tarfile.TarInfo(self._member_name(name))
+            tarinfo.size = st.st_size
+            tarinfo.mtime = st.st_mtime
+            tarinfo.mode = st.st_mode & EVIDENCE_MODE_MASK
+            tarinfo.uid = st.st_uid
+            tarinfo.gid = st.st_gid
+            reader = _HashingReader(f, algorithms, pad=True)
+            with self.lock:
+                # the member keeps the size of its header whatever happens to the file
+                if self._add(name, tarinfo, reader) is not None:
+                    size = os.fstat(f.fileno()).st_size
+                    if reader.padded or size != st.st_size:
+                        self.manifest[-1].update({'size_changed': True, 'source_size': size})
+                        log.debug('[*] {} changed size while archived: {} -> {}'.format(src,
+                                    st.st_size, size))
+            return reader.digests()
+
+    def add_file_once(self, src, name, algorithms=MANIFEST_ALGORITHMS):
+        """ add_file unless name was already added, None in that case
+
+        Concurrent callers for the same name wait until the member is
+        complete, so links to it may be appended right after.
+        """
+        with self.lock:
+            name_lock = self.name_locks.setdefault(name, threading.Lock())
+        with name_lock:
+            if self.has(name):
+                return None
+            return self.add_file(src, name, algorithms)
+
+    def add_link(self, target, name):
+        """ Hard link member name to the already added member target """
+        tarinfo = tarfile.TarInfo(self._member_name(name))
+        tarinfo.type = tarfile.LNKTYPE
+        tarinfo.linkname = self._member_name(target)
+        tarinfo.mtime = time.time()
+        with self.lock:
+            if name not in self.names:
+                self._add(name, tarinfo)
+
+    def has(self, name):
+        with self.lock:
+            return name in self.names
+
+    def get_spool_dir(self):
+        """ Spool directory next to the archive, the default temporary
+        directory when streaming to stdout
+        """
+        with self.lock:
+            if self.spool_dir is None:
+                dirname = None
+                if self.archive_path != ARCHIVE_STDOUT:
+                    dirname = os.path.dirname(os.path.abspath(self.archive_path))
+                self.spool_dir = tempfile.mkdtemp(prefix='.df_spool_', dir=dirname)
+            return self.spool_dir
+
+    def get_command_path(self, name):
+        """ Spool path for output of external commands (journalctl, shell
+        redirect), added to the archive and removed by commit_command_file
+        """
+        path = os.path.join(self.get_spool_dir(), name)
+        dirname = os.path.dirname(path)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname, mode=0o700, exist_ok=True)
+        return path
+
+    def commit_command_file(self, name):
+        path = self.get_command_path(name)
+        if not os.path.isfile(path):
+            return False
+        try:
+            self.add_file(path, name)
+        finally:
+            os.unlink(path)
+        return True
+
+    def open_record_file(self, name):
+        """ Records are spooled compressed until the member is appended """
+        return _SpoolWriter(self.get_command_path(name + '.gz'))
+
+    def commit_record_file(self, name, fd):
+        fd.close()
+        tarinfo = tarfile.TarInfo(self._member_name(name))
+        tarinfo.size = fd.size
+        tarinfo.mtime = time.time()
+        tarinfo.mode = 0o600
+        try:
+            with gzip.open(fd.path, 'rb') as f, self.lock:
+                self._add(name, tarinfo, f)
+        finally:
+            os.unlink(fd.path)
+        return True
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return True
+            manifest = json.dumps(self.manifest, indent=4).encode('utf-8')
+            tarinfo = tarfile.TarInfo(self._member_name(ARCHIVE_MANIFEST))
+            tarinfo.size = len(manifest)
+            tarinfo.mtime = time.time()
+            tarinfo.mode = 0o600
+            self.tar.addfile(tarinfo, io.BytesIO(manifest))
+            self.tar.close()
+            self.closed = True
+
+        if self.compressor is not None:
+            self.compressor.flush(zstandard.FLUSH_FRAME)
+            self.compressor.close()
+        if self.own_fileobj:
+            self.fileobj.close()
+            with open(self.archive_path + '.' + ARCHIVE_MANIFEST, 'w') as f:
+                f.write(manifest.decode('utf-8'))
+        else:
+            self.fileobj.flush()
+        if self.spool_dir is not None:
+            shutil.rmtree(self.spool_dir, ignore_errors=True)
+        return True
@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import stat
+import fnmatch
+from dflogging import *
+
+
+TYPE_ELF = "elf"
+TYPE_SCRIPT = "script"
+TYPE_EXECUTABLE = "executable"
+
+# leading bytes of every type detected by content
+FILE_MAGIC = [
+    (TYPE_ELF, b'\x7fELF'),
+    (TYPE_SCRIPT, b'#!'),
+]
+MAGIC_SIZE = 4
+
+ORDER_MTIME = "mtime"
+ORDER_PATH = "path"
+
+ACQUIRE_TYPES = [TYPE_ELF, TYPE_SCRIPT, TYPE_EXECUTABLE]
+MAX_FILE_SIZE = 100 * 1024 * 1024
+MAX_TOTAL_BYTES = 2 * 1024 * 1024 * 1024
+MAX_FILES = 0
+
+SKIP_FILE_SIZE = "file size limit"
+SKIP_TOTAL_BYTES = "total bytes limit"
+SKIP_FILES = "file count limit"
+
+
+def read_magic(path):
+    """ File type of path by its leading bytes, None if unknown or unreadable """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(MAGIC_SIZE)
+    except OSError as e:
+        log.debug('[*] {}: {}'.format(path, e))
+        return None
+    for file_type, magic in FILE_MAGIC:
+        if head.startswith(magic):
+            return file_type
+    return None
+
+
+class AcquisitionPolicy():
+    """ Which changed files are read and copied, and in which order
+
+    A regular file is a candidate when it matches one of INCLUDE (every
+    file if empty), none of EXCLUDE, and one of TYPES: "elf" and "script"
+    are detected by magic bytes, "executable" is any file with an execute
+    bit. Cheap checks (globs, type bits) come first, so only the leading
+    bytes of the remaining files are read. Candidates are then taken
+    newest first (ORDER "mtime") or by path, and skipped once they exceed
+    MAX_FILE_SIZE or would exceed MAX_TOTAL_BYTES or MAX_FILES (0 means
+    no limit).
+
+    Args:
+        config (dict): ACQUISITION section of config.json
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.include = config.get('INCLUDE', [])
+        self.exclude = config.get('EXCLUDE', [])
+        self.types = config.get('TYPES', ACQUIRE_TYPES)
+        self.max_file_size = config.get('MAX_FILE_SIZE', MAX_FILE_SIZE)
+        self.max_total_bytes = config.get('MAX_TOTAL_BYTES', MAX_TOTAL_BYTES)
+        self.max_files = config.get('MAX_FILES', MAX_FILES)
+        self.order = config.get('ORDER', ORDER_MTIME)
+        self.magic = any(x in self.types for x, y in FILE_MAGIC)
+
+    def match_path(self, relpath):
+        if self.include and not any(fnmatch.fnmatchcase(relpath, x) for x in self.include):
+            return False
+        return not any(fnmatch.fnmatchcase(relpath, x) for x in self.exclude)
+
+    def get_type(self, path, st):
+        """ Acquired type of a regular file, None if it is not acquired """
+        if self.magic and st.st_size >= 2:
+            file_type = read_magic(path)
+            if file_type in self.types:
+                return file_type
+        if TYPE_EXECUTABLE in self.types and st.st_mode & 0o111:
+            return TYPE_EXECUTABLE
+        return None
+
+    def select(self, root, entries):
+        """ Apply the policy to the entries of a layer scan
+
+        Args:
+            root (str): host path of the layer
+            entries (iterable): (container path, stat result) pairs
+        Returns:
+            tuple: (dict of selected path -> type, dict of skipped path -> reason)
+        """
+        candidates = []
+        for relpath, st in entries:
+            if not stat.S_ISREG(st.st_mode) or not self.match_path(relpath):
+                continue
+            file_type = self.get_type(root + relpath, st)
+            if file_type is not None:
+                candidates.append((relpath, st, file_type))
+
+        if self.order == ORDER_MTIME:
+            candidates.sort(key=lambda x: (-x[1].st_mtime, x[0]))
+        else:
+            candidates.sort(key=lambda x: x[0])
+
+        selected = {}
+        skipped = {}
+        total = 0
+        for relpath, st, file_type in candidates:
+            if self.max_file_size and st.st_size > self.max_file_size:
+                skipped[relpath] = SKIP_FILE_SIZE
+            elif self.max_total_bytes and total + st.st_size > self.max_total_bytes:
+                skipped[relpath] = SKIP_TOTAL_BYTES
+            elif self.max_files and len(selected) >= self.max_files:
+                skipped[relpath] = SKIP_FILES
+            else:
+                selected[relpath] = file_type
+                total += st.st_size
+        return selected, skipped
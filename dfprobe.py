@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import stat
+import time
+import uuid
+import shlex
+import struct
+import datetime
+from dfproc import PROC_PATH
+from dflogging import *
+
+try:
+    import zoneinfo
+except ImportError:
+    zoneinfo = None
+
+
+PROBE_MODE_PROC = "proc"
+PROBE_MODE_EXEC = "exec"
+
+PROBE_FILES = ["/etc/passwd", "/etc/shadow", "/etc/group", "/etc/crontab",
+               "/var/spool/cron/crontabs"]
+PROBE_MAX_FILES = 256
+
+UTMP_RECORD = struct.Struct('<hxxi32s4s32s256s')
+UTMP_RECORD_SIZE = 384
+UTMP_USER_PROCESS = 7
+
+MAX_SYMLINKS = 40
+
+# artifact names of pulled files, others go to PROBE_FILES_DIR/<path>
+PROBE_FILE_NAMES = {"/etc/passwd": "passwd"}
+PROBE_FILES_DIR = "probe_files"
+
+
+def resolve_in_root(root, path):
+    """ Host path of path inside root, following symlinks within root
+
+    Absolute symlinks of the container would be resolved against the host
+    root by the kernel when read through /proc/<pid>/root, so every
+    component is resolved here instead.
+    Returns:
+        str: host path, None if a component does not exist
+    """
+    root = root.rstrip('/')
+    parts = [x for x in path.split('/') if x]
+    resolved = []
+    links = 0
+    while parts:
+        part = parts.pop(0)
+        if part == '.':
+            continue
+        if part == '..':
+            if resolved:
+                resolved.pop()
+            continue
+        candidate = root + '/' + '/'.join(resolved + [part])
+        try:
+            st = os.lstat(candidate)
+        except OSError:
+            return None
+        if stat.S_ISLNK(st.st_mode):
+            links += 1
+            if links > MAX_SYMLINKS:
+                return None
+            target = os.readlink(candidate)
+            if target.startswith('/'):
+                resolved = []
+            parts = [x for x in target.split('/') if x] + parts
+            continue
+        resolved.append(part)
+    return root + '/' + '/'.join(resolved)
+
+
+def get_container_timezone(root):
+    """ tzinfo of the container's /etc/localtime, UTC if unknown """
+    localtime = resolve_in_root(root, '/etc/localtime')
+    if localtime is not None and zoneinfo is not None:
+        try:
+            with open(localtime, 'rb') as f:
+                return zoneinfo.ZoneInfo.from_file(f, key='localtime')
+        except Exception as e:
+            log.debug('[*] {}: {}'.format(localtime, e))
+    return datetime.timezone.utc
+
+
+def format_host_time(root, now=None):
+    """ Host clock at the time of the probe, ISO 8601 in the container's timezone
+
+    Not the container's `date`: nothing runs inside the container in proc
+    mode, so this is when the host read it.
+    """
+    tz = get_container_timezone(root)
+    return datetime.datetime.fromtimestamp(now or time.time(), tz).isoformat()
+
+
+def count_utmp_users(root):
+    utmp = resolve_in_root(root, '/var/run/utmp') or resolve_in_root(root, '/run/utmp')
+    if utmp is None:
+        return 0
+    users = 0
+    try:
+        with open(utmp, 'rb') as f:
+            while True:
+                record = f.read(UTMP_RECORD_SIZE)
+                if len(record) < UTMP_RECORD_SIZE:
+                    break
+                if UTMP_RECORD.unpack_from(record)[0] == UTMP_USER_PROCESS:
+                    users += 1
+    except OSError:
+        return 0
+    return users
+
+
+def format_uptime(root, now=None):
+    """ Output of `uptime` inside the container
+
+    Uptime and load average are not namespaced, the container reads the
+    host's /proc/uptime and /proc/loadavg as well.
+    """
+    with open(PROC_PATH + '/uptime', 'r') as f:
+        seconds = int(float(f.read().split()[0]))
+    with open(PROC_PATH + '/loadavg', 'r') as f:
+        load = f.read().split()[:3]
+
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes = seconds // 60
+    up = ''
+    if days:
+        up += '{} day{}, '.format(days, '' if days == 1 else 's')
+    up += '{:2d}:{:02d}'.format(hours, minutes) if hours else '{} min'.format(minutes)
+    users = count_utmp_users(root)
+    clock = datetime.datetime.fromtimestamp(now or time.time(), get_container_timezone(root))
+    return ' {} up {},  {} user{},  load average: {}'.format(clock.strftime('%H:%M:%S'), up,
+                users, '' if users == 1 else 's', ', '.join(load))
+
+
+def list_probe_files(root, paths):
+    """ (container path, host path) of every regular file to pull
+
+    Directories (e.g. crontabs) are expanded to the regular files below
+    them, up to PROBE_MAX_FILES files in total.
+    """
+    files = []
+    for path in paths:
+        host_path = resolve_in_root(root, path)
+        if host_path is None:
+            continue
+        st = os.lstat(host_path)
+        if stat.S_ISREG(st.st_mode):
+            files.append((path, host_path))
+        elif stat.S_ISDIR(st.st_mode):
+            for dirpath, dirs, names in os.walk(host_path):
+                for name in sorted(names):
+                    file_path = os.path.join(dirpath, name)
+                    if stat.S_ISREG(os.lstat(file_path).st_mode):
+                        files.append((path.rstrip('/') + file_path[len(host_path):], file_path))
+        if len(files) >= PROBE_MAX_FILES:
+            break
+    return files[:PROBE_MAX_FILES]
+
+
+def probe_proc(pid, paths):
+    """ Volatile facts read directly through /proc/<pid>/root, no exec
+
+    Returns:
+        dict: 'host_time', 'uptime' and 'files' as [(container path, host path)]
+    """
+    root = '{}/{}/root'.format(PROC_PATH, pid)
+    os.stat(root + '/')
+    return {'host_time': format_host_time(root), 'uptime': format_uptime(root),
+            'files': list_probe_files(root, paths)}
+
+
+def build_exec_script(paths, boundary):
+    """ Single sh script printing date, uptime and every file, separated """
+    script = ['date', 'echo', 'echo {}'.format(boundary), 'uptime']
+    for path in paths:
+        script.append("printf '\\n{} %s\\n' {}".format(boundary, shlex.quote(path)))
+        script.append('if [ -d {0} ]; then find {0} -type f -exec sh -c '
+                      '\'for f; do printf "\\n{1} %s\\n" "$f"; cat "$f"; done\' sh {{}} +; '
+                      'else cat {0}; fi 2>/dev/null'.format(shlex.quote(path), boundary))
+    return '\n'.join(script)
+
+
+def is_requested_path(path, paths):
+    """ True if path is one of paths or a file below one of them
+
+    Paths with empty, '.' or '..' components are refused, so a header
+    printed by the container can never name a file outside PROBE_FILES_DIR.
+    """
+    parts = path.split('/')
+    if parts[0] != '' or any(x in ('', '.', '..') for x in parts[1:]):
+        return False
+    for requested in paths:
+        requested = requested.rstrip('/')
+        if path == requested or path.startswith(requested + '/'):
+            return True
+    return False
+
+
+def parse_exec_output(data, boundary, paths):
+    """ Split the output of build_exec_script
+
+    The output comes from inside the container: only headers naming one of
+    paths, or a file below one of them, are kept (up to PROBE_MAX_FILES).
+    Returns:
+        dict: 'date', 'uptime' and 'files' as {container path: bytes}
+    """
+    marker = b'\n' + boundary.encode('utf-8')
+    sections = data.split(marker)
+    result = {'date': sections[0].decode('utf-8', 'replace').strip(), 'uptime': '', 'files': {}}
+    if len(sections) > 1:
+        result['uptime'] = sections[1].decode('utf-8', 'replace').strip()
+    for section in sections[2:]:
+        header, sep, content = section.partition(b'\n')
+        path = header.decode('utf-8', 'replace').strip()
+        # missing files and directory headers come without content
+        if not path or not content:
+            continue
+        if not is_requested_path(path, paths):
+            log.debug('[*] probe output names an unrequested file, dropped: {!r}'.format(path))
+            continue
+        if len(result['files']) >= PROBE_MAX_FILES:
+            break
+        result['files'][path] = content
+    return result
+
+
+def get_probe_name(path):
+    return PROBE_FILE_NAMES.get(path, PROBE_FILES_DIR + path)
+
+
+def new_boundary():
+    return 'DF-PROBE-' + uuid.uuid4().hex
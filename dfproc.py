@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import pwd
+import time
+from dflogging import *
+
+
+PROC_PATH = "/proc"
+CGROUP_BASE_PATH = "/sys/fs/cgroup"
+CGROUP_V1_CONTROLLERS = ["pids", "memory", "cpu,cpuacct", "devices"]
+
+CLK_TCK = os.sysconf(os.sysconf_names['SC_CLK_TCK'])
+
+
+def read_proc_file(pid, name, mode='r'):
+    with open('{}/{}/{}'.format(PROC_PATH, pid, name), mode) as f:
+        return f.read()
+
+
+def get_boot_time():
+    with open(PROC_PATH + '/stat', 'r') as f:
+        for line in f:
+            if line.startswith('btime'):
+                return int(line.split()[1])
+    return 0
+
+
+def get_cgroup_procs_paths(pid):
+    """ cgroup.procs files of the cgroup the container init process is in
+
+    Supports the unified hierarchy (cgroup v2) and falls back to one of the
+    v1 controllers.
+    Args:
+        pid (int): host pid of the container init process
+    Returns:
+        list: paths of cgroup.procs including nested cgroups
+    """
+    try:
+        lines = read_proc_file(pid, 'cgroup').split('\n')
+    except OSError as e:
+        log.debug('[*] cgroup of {} is not readable: {}'.format(pid, e))
+        return []
+
+    cgroups = {}
+    for line in lines:
+        x = line.split(':', 2)
+        # the root cgroup would select every process on the host
+        if len(x) != 3 or x[2] == '/':
+            continue
+        cgroups[x[1]] = x[2]
+
+    cgroup_dirs = []
+    if '' in cgroups:
+        cgroup_dirs.append(CGROUP_BASE_PATH + cgroups[''])
+    for controller in CGROUP_V1_CONTROLLERS:
+        for key, path in cgroups.items():
+            if controller in key.split(','):
+                cgroup_dirs.append('{}/{}{}'.format(CGROUP_BASE_PATH, key, path))
+
+    for cgroup_dir in cgroup_dirs:
+        procs_path = cgroup_dir + '/cgroup.procs'
+        if not os.path.isfile(procs_path):
+            continue
+        procs_paths = []
+        for dirpath, dirs, files in os.walk(cgroup_dir):
+            if 'cgroup.procs' in files:
+                procs_paths.append(os.path.join(dirpath, 'cgroup.procs'))
+        return procs_paths
+
+    return []
+
+
+def get_container_pids(pid):
+    """ Host pids of every process in the container's cgroup """
+    pids = []
+    for procs_path in get_cgroup_procs_paths(pid):
+        try:
+            with open(procs_path, 'r') as f:
+                pids += [int(x) for x in f.read().split()]
+        except (OSError, ValueError) as e:
+            log.debug('[*] {}: {}'.format(procs_path, e))
+    return sorted(set(pids))
+
+
+def parse_stat(stat_data):
+    # comm may contain spaces and parentheses, so split after the last ')'
+    rparen = stat_data.rfind(')')
+    comm = stat_data[stat_data.find('(') + 1:rparen]
+    fields = stat_data[rparen + 2:].split()
+    return {
+        'comm': comm,
+        'state': fields[0],
+        'ppid': int(fields[1]),
+        'num_threads': int(fields[17]),
+        'starttime': int(fields[19]),
+    }
+
+
+def parse_status(status_data):
+    status = {}
+    for line in status_data.split('\n'):
+        key, sep, value = line.partition(':')
+        if sep:
+            status[key] = value.strip()
+    return status
+
+
+def parse_maps_files(maps_data):
+    """ Unique file paths mapped into the process """
+    mapped_files = []
+    seen = set()
+    for line in maps_data.split('\n'):
+        x = line.split(None, 5)
+        if len(x) == 6 and x[5].startswith('/') and x[5] not in seen:
+            seen.add(x[5])
+            mapped_files.append(x[5])
+    return mapped_files
+
+
+def get_username(uid):
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return str(uid)
+
+
+def collect_process(pid, boot_time):
+    """ Read /proc/<pid>/{exe,cmdline,stat,status,environ,maps}
+
+    Returns:
+        dict: process item with the docker top fields (USER, PID, PPID,
+              STIME, CMD) and the extra fields read from /proc,
+              None when the process is gone.
+    """
+    try:
+        stat_info = parse_stat(read_proc_file(pid, 'stat'))
+        status = parse_status(read_proc_file(pid, 'status'))
+        cmdline = read_proc_file(pid, 'cmdline', 'rb')
+    except (OSError, IndexError, ValueError) as e:
+        log.debug('[*] PID:{} is not readable: {}'.format(pid, e))
+        return None
+
+    uids = status.get('Uid', '').split()
+    gids = status.get('Gid', '').split()
+    start_time = boot_time + stat_info['starttime'] / CLK_TCK
+    cmd = ' '.join(x.decode('utf-8', 'replace') for x in cmdline.split(b'\0') if x)
+
+    proc = {}
+    proc['USER'] = get_username(int(uids[0])) if uids else ''
+    proc['PID'] = str(pid)
+    proc['PPID'] = str(stat_info['ppid'])
+    proc['STIME'] = time.strftime('%H:%M', time.localtime(start_time))
+    proc['CMD'] = cmd if cmd else '[{}]'.format(stat_info['comm'])
+    proc['NAME'] = stat_info['comm']
+    proc['STATE'] = stat_info['state']
+    proc['THREADS'] = stat_info['num_threads']
+    proc['START_TIME'] = time.ctime(start_time)
+    proc['UID'] = uids
+    proc['GID'] = gids
+    proc['NSPID'] = status.get('NSpid', '').split()
+
+    try:
+        proc['EXE'] = os.readlink('{}/{}/exe'.format(PROC_PATH, pid))
+    except OSError:
+        proc['EXE'] = ''
+
+    try:
+        environ = read_proc_file(pid, 'environ', 'rb')
+        proc['ENVIRON'] = [x.decode('utf-8', 'replace') for x in environ.split(b'\0') if x]
+    except OSError:
+        proc['ENVIRON'] = []
+
+    try:
+        proc['MAPPED_FILES'] = parse_maps_files(read_proc_file(pid, 'maps'))
+    except OSError:
+        proc['MAPPED_FILES'] = []
+
+    return proc
+
+
+def collect_processes(pid):
+    """ Process items of every pid in the container's cgroup
+
+    Args:
+        pid (int): host pid of the container init process
+    Returns:
+        list: process items, empty when the cgroup could not be resolved
+    """
+    boot_time = get_boot_time()
+    procs = []
+    for container_pid in get_container_pids(pid):
+        proc = collect_process(container_pid, boot_time)
+        if proc is not None:
+            procs.append(proc)
+    return procs
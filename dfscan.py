@@ -0,0 +1,382 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import re
+import stat
+import sqlite3
+import tempfile
+import threading
+from collections import deque, namedtuple
+from dflogging import *
+
+
+AUFS_WHITEOUT_PREFIX = ".wh."
+AUFS_OPAQUE_MARKER = ".wh..wh..opq"
+OVERLAY_OPAQUE_XATTR = "trusted.overlay.opaque"
+
+HIDDEN_DIR_REGX = r"^[.\s].*$"
+
+SCAN_WORKERS = 8
+
+# entries of the changed index kept in memory before it moves to a file
+CHANGED_INDEX_MEMORY = 100000
+CHANGED_INDEX_PAGE = 1000
+
+STAT_FIELDS = ('st_mode', 'st_ino', 'st_dev', 'st_nlink', 'st_uid', 'st_gid', 'st_size',
+               'st_mtime', 'st_atime_ns', 'st_mtime_ns', 'st_ctime_ns', 'st_rdev')
+
+
+class EntryStat(namedtuple('EntryStat', STAT_FIELDS)):
+    """ The fields of os.stat_result the collectors use, in a fraction of its size """
+    __slots__ = ()
+
+    @classmethod
+    def from_stat(cls, st):
+        return cls(*(getattr(st, x) for x in STAT_FIELDS))
+
+
+class ScanEntry():
+    """ A single inode visited by LayerScanner
+
+    The stat result is taken exactly once (without following symlinks)
+    and shared by every detector as an EntryStat, so what detectors keep
+    stays small.
+    """
+    __slots__ = ('path', 'relpath', 'name', 'st', 'is_dir')
+
+    def __init__(self, path, relpath, name, st):
+        self.path = path
+        self.relpath = relpath
+        self.name = name
+        self.st = st
+        self.is_dir = stat.S_ISDIR(st.st_mode)
+
+
+class Detector():
+    """ Base class of detectors fed by LayerScanner
+
+    With several scan workers visit() is called concurrently, so detectors
+    only append to their results or set keys of a dict.
+    """
+    name = ""
+
+    def __init__(self):
+        self.results = []
+
+    def visit(self, entry):
+        raise NotImplementedError
+
+
+class CharDeviceWhiteoutDetector(Detector):
+    """ Overlay/Overlay2 whiteouts are 0:0 character devices """
+    name = "whiteout"
+
+    def visit(self, entry):
+        if not entry.is_dir and stat.S_ISCHR(entry.st.st_mode):
+            self.results.append(entry)
+
+
+class PrefixWhiteoutDetector(Detector):
+    """ AUFS whiteouts are files or directories named .wh.<name> """
+    name = "whiteout"
+
+    def visit(self, entry):
+        if entry.name.startswith(AUFS_WHITEOUT_PREFIX):
+            self.results.append(entry)
+
+
+class OpaqueDirDetector(Detector):
+    """ Directories hiding every lower layer entry below them
+
+    Overlay marks them with the trusted.overlay.opaque xattr, AUFS with
+    a .wh..wh..opq file inside the directory.
+    """
+    name = "opaque"
+
+    def __init__(self, aufs=False):
+        super().__init__()
+        self.aufs = aufs
+
+    def visit(self, entry):
+        if self.aufs:
+            if not entry.is_dir and entry.name == AUFS_OPAQUE_MARKER:
+                self.results.append(entry)
+            return
+
+        if not entry.is_dir:
+            return
+        try:
+            if os.getxattr(entry.path, OVERLAY_OPAQUE_XATTR, follow_symlinks=False) == b'y':
+                self.results.append(entry)
+        except OSError:
+            pass
+
+
+class HiddenDirDetector(Detector):
+    name = "hidden"
+
+    def __init__(self):
+        super().__init__()
+        self.regx = re.compile(HIDDEN_DIR_REGX)
+
+    def visit(self, entry):
+        if entry.is_dir and self.regx.search(entry.name) is not None:
+            self.results.append(entry)
+
+
+class RegularFileDetector(Detector):
+    """ Regular files, e.g. those to copy from the container directory """
+    name = "files"
+
+    def visit(self, entry):
+        if stat.S_ISREG(entry.st.st_mode):
+            self.results.append(entry)
+
+
+class ChangedFileDetector(Detector):
+    """ Index of every entry by its container path (e.g. /etc/passwd)
+
+    Used to resolve `docker diff` entries without stat'ing them again.
+    Entries are kept as EntryStat; once max_memory of them are in memory
+    they are moved to a temporary SQLite file, so memory does not grow
+    with the size of the layer.
+
+    Args:
+        max_memory (int): entries kept in memory at most
+        spill_dir (str): directory of the temporary file, None for the default
+    """
+    name = "changed"
+
+    def __init__(self, max_memory=CHANGED_INDEX_MEMORY, spill_dir=None):
+        super().__init__()
+        self.index = {}
+        self.max_memory = max(1, max_memory)
+        self.spill_dir = spill_dir
+        self.lock = threading.Lock()
+        self.db = None
+        self.db_path = None
+
+    def visit(self, entry):
+        with self.lock:
+            self.index[entry.relpath] = entry.st
+            if len(self.index) >= self.max_memory:
+                self.spill()
+
+    def spill(self):
+        """ Move the entries in memory to the file, lock held """
+        if self.db is None:
+            fd, self.db_path = tempfile.mkstemp(prefix='df_changed_', suffix='.db', dir=self.spill_dir)
+            os.close(fd)
+            self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.db.execute('PRAGMA journal_mode=OFF')
+            self.db.execute('PRAGMA synchronous=OFF')
+            self.db.execute('CREATE TABLE entries (path TEXT PRIMARY KEY, {})'.format(', '.join(STAT_FIELDS)))
+            log.debug('[*] changed index moved to {}'.format(self.db_path))
+        self.db.executemany('INSERT OR REPLACE INTO entries VALUES ({})'.format(
+                                ', '.join('?' * (len(STAT_FIELDS) + 1))),
+                            ((x,) + tuple(y) for x, y in self.index.items()))
+        self.db.commit()
+        self.index = {}
+
+    def lookup(self, relpath):
+        with self.lock:
+            st = self.index.get(relpath)
+            if st is None and self.db is not None:
+                row = self.db.execute('SELECT * FROM entries WHERE path = ?', (relpath,)).fetchone()
+                if row is not None:
+                    st = EntryStat(*row[1:])
+        return st
+
+    def items(self):
+        """ Yields:
+                tuple: (container path, EntryStat) in path order
+        """
+        with self.lock:
+            if self.db is None:
+                index = self.index
+            elif self.index:
+                self.spill()
+        if self.db is None:
+            for relpath in sorted(index):
+                yield relpath, index[relpath]
+            return
+
+        # pages by key, nothing is held between them
+        last = ''
+        while True:
+            with self.lock:
+                rows = self.db.execute('SELECT * FROM entries WHERE path > ? ORDER BY path LIMIT ?',
+                                        (last, CHANGED_INDEX_PAGE)).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                yield row[0], EntryStat(*row[1:])
+            last = rows[-1][0]
+
+    def __len__(self):
+        with self.lock:
+            if self.db is None:
+                return len(self.index)
+            return len(self.index) + self.db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                os.unlink(self.db_path)
+                self.db = None
+            self.index = {}
+
+
+class LayerScanner():
+    """ Single-pass os.scandir traversal of a writable layer
+
+    With more than one worker, directories are scanned concurrently: every
+    worker walks depth-first on its own deque and, once it runs dry, steals
+    the oldest (closest to the root, so largest) pending directory of
+    another worker. Pending directories stay in the order of depth times
+    width as with a single stack, and results are sorted by path, so the
+    output does not depend on the number of workers.
+
+    Args:
+        root (str): UpperDir of overlay or diff branch of AUFS
+        detectors (list): Detector instances fed with every entry
+        workers (int): scanning threads
+    """
+
+    def __init__(self, root, detectors, workers=1):
+        self.root = root.rstrip('\n')
+        self.detectors = detectors
+        self.workers = max(1, workers)
+        self.visited = 0
+        self.errors = []
+
+    def scan_dir(self, dirpath, relbase, push):
+        """ Feed the entries of one directory to the detectors
+
+        Returns:
+            int: number of entries visited
+        """
+        try:
+            it = os.scandir(dirpath)
+        except OSError as e:
+            log.debug('[*] scandir failed {}: {}'.format(dirpath, e))
+            self.errors.append(dirpath)
+            return 0
+
+        visited = 0
+        with it:
+            for dir_entry in it:
+                try:
+                    st = EntryStat.from_stat(dir_entry.stat(follow_symlinks=False))
+                except OSError as e:
+                    log.debug('[*] stat failed {}: {}'.format(dir_entry.path, e))
+                    self.errors.append(dir_entry.path)
+                    continue
+
+                relpath = relbase + '/' + dir_entry.name
+                entry = ScanEntry(dir_entry.path, relpath, dir_entry.name, st)
+                visited += 1
+                for detector in self.detectors:
+                    detector.visit(entry)
+
+                if entry.is_dir:
+                    push((dir_entry.path, relpath))
+        return visited
+
+    def scan(self):
+        root = self.root.rstrip('/')
+
+        if self.workers == 1:
+            stack = [(root, '')]
+            while stack:
+                dirpath, relbase = stack.pop()
+                self.visited += self.scan_dir(dirpath, relbase, stack.append)
+        else:
+            self.scan_parallel(root)
+
+        for detector in self.detectors:
+            detector.results.sort(key=lambda x: x.path)
+        return self
+
+    def scan_parallel(self, root):
+        queues = [deque() for i in range(self.workers)]
+        queues[0].append((root, ''))
+        cond = threading.Condition()
+        # directories queued or being scanned, the walk ends at 0
+        state = {'pending': 1}
+        visited = [0] * self.workers
+
+        def take(index):
+            try:
+                return queues[index].pop()
+            except IndexError:
+                pass
+            for i in range(1, self.workers):
+                try:
+                    return queues[(index + i) % self.workers].popleft()
+                except IndexError:
+                    continue
+            return None
+
+        def worker(index):
+            def push(item):
+                with cond:
+                    state['pending'] += 1
+                    queues[index].append(item)
+                    cond.notify()
+
+            while True:
+                with cond:
+                    item = take(index)
+                    while item is None:
+                        if state['pending'] == 0:
+                            return
+                        cond.wait()
+                        item = take(index)
+                try:
+                    visited[index] += self.scan_dir(item[0], item[1], push)
+                finally:
+                    with cond:
+                        state['pending'] -= 1
+                        if state['pending'] == 0:
+                            cond.notify_all()
+
+        threads = [threading.Thread(target=worker, args=(i,), daemon=True)
+                    for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.visited += sum(visited)
+
+    def get(self, name):
+        for detector in self.detectors:
+            if detector.name == name:
+                return detector
+        return None
+
+    def close(self):
+        """ Release what the detectors hold, e.g. the changed index file """
+        for detector in self.detectors:
+            if hasattr(detector, 'close'):
+                detector.close()
+
+
+def build_layer_scanner(path, aufs=False, workers=1, max_memory=CHANGED_INDEX_MEMORY, spill_dir=None):
+    """ LayerScanner with the detectors used by DFbase """
+    detectors = [
+        PrefixWhiteoutDetector() if aufs else CharDeviceWhiteoutDetector(),
+        OpaqueDirDetector(aufs=aufs),
+        HiddenDirDetector(),
+        ChangedFileDetector(max_memory, spill_dir),
+    ]
+    return LayerScanner(path, detectors, workers)
+
+
+def list_regular_files(path, workers=1):
+    """ ScanEntry of every regular file below path, sorted by path """
+    return LayerScanner(path, [RegularFileDetector()], workers).scan().get('files').results
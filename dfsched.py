@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dflogging import *
+
+
+STATUS_OK = "OK"
+STATUS_FAILED = "FAILED"
+STATUS_ERROR = "ERROR"
+STATUS_TIMEOUT = "TIMEOUT"
+STATUS_SKIPPED = "SKIPPED"
+
+# seconds timed out collectors are waited for before the output is closed
+JOIN_TIMEOUT = 60
+
+
+class Collector():
+    """ A DFbase method registered to the scheduler
+
+    Args:
+        name (str): name of the DFbase method to call
+        deps (tuple): collectors which have to succeed before this one
+        timeout (int): seconds to wait, None for the scheduler default
+        live (bool): needs the docker daemon or a running container
+    """
+
+    def __init__(self, name, deps=(), timeout=None, live=False):
+        self.name = name
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.live = live
+
+
+# Collectors are independent subprocess waits or filesystem scans, except
+# the writable layer consumers which share a single scan of the layer.
+COLLECTORS = [
+    Collector('save_inspect_for_container'),
+    Collector('get_processes_list_within_container', live=True),
+    Collector('dump_process_memory', deps=('get_processes_list_within_container',), live=True),
+    Collector('scan_writable_layer'),
+    Collector('search_whiteout_files', deps=('scan_writable_layer',)),
+    Collector('copy_files_relatedto_container'),
+    Collector('get_log_on_journald_service', live=True),
+    Collector('search_hidden_directory', deps=('scan_writable_layer',)),
+    Collector('get_changed_history_using_diff_command', deps=('scan_writable_layer',)),
+    Collector('get_network_session_list', live=True),
+    Collector('run_container_probes'),
+]
+
+
+class Scheduler():
+    """ Run registered collectors concurrently honoring their dependencies
+
+    A collector is submitted to the thread pool once all of its
+    dependencies finished with OK, and is skipped when one of them did not.
+    A collector which exceeds its timeout is reported as TIMEOUT and the run
+    goes on without it; its subprocesses are bounded by DFbase.run_command.
+
+    Args:
+        target (DFbase): object whose methods are the collectors
+        collectors (list): Collector instances
+        workers (int): size of the thread pool
+        timeout (int): default per-collector timeout in seconds
+        offline (bool): skip live collectors, there is no daemon
+        metrics (RunMetrics): measures every collector when set
+    """
+
+    def __init__(self, target, collectors, workers=8, timeout=600, offline=False, metrics=None):
+        self.target = target
+        self.collectors = collectors
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.offline = offline
+        self.metrics = metrics
+        self.status = {}
+        self.abandoned = {}
+
+    def _call(self, collector):
+        start = time.time()
+        if self.metrics is None:
+            result = getattr(self.target, collector.name)()
+        else:
+            with self.metrics.measure(collector.name):
+                result = getattr(self.target, collector.name)()
+        return result, time.time() - start
+
+    def _set_status(self, name, status, elapsed=0.0, error=''):
+        self.status[name] = {'status': status, 'elapsed': round(elapsed, 3), 'error': error}
+        log.debug('[*] collector {}: {} ({:.3f}s) {}'.format(name, status, elapsed, error))
+
+    def run(self):
+        """ Returns:
+                dict: collector name -> status, elapsed seconds and error
+        """
+        pending = list(self.collectors)
+        running = {}
+
+        if self.offline:
+            for collector in [x for x in pending if x.live]:
+                pending.remove(collector)
+                self._set_status(collector.name, STATUS_SKIPPED, error='offline collection')
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        try:
+            while pending or running:
+                for collector in list(pending):
+                    dep_status = [self.status.get(x, {}).get('status') for x in collector.deps]
+                    if any(x is not None and x != STATUS_OK for x in dep_status):
+                        pending.remove(collector)
+                        self._set_status(collector.name, STATUS_SKIPPED,
+                                            error='dependency did not succeed')
+                    elif all(x == STATUS_OK for x in dep_status):
+                        pending.remove(collector)
+                        timeout = collector.timeout or self.timeout
+                        future = executor.submit(self._call, collector)
+                        running[future] = (collector, time.time(), time.time() + timeout)
+
+                if not running:
+                    for collector in pending:
+                        self._set_status(collector.name, STATUS_SKIPPED,
+                                            error='unknown dependency')
+                    break
+
+                next_deadline = min(x[2] for x in running.values())
+                done, _ = wait(list(running), timeout=max(0, next_deadline - time.time()),
+                                return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    collector, started, deadline = running.pop(future)
+                    try:
+                        result, elapsed = future.result()
+                        self._set_status(collector.name,
+                                            STATUS_FAILED if result is False else STATUS_OK, elapsed)
+                    except Exception as e:
+                        self._set_status(collector.name, STATUS_ERROR,
+                                            time.time() - started, repr(e))
+
+                now = time.time()
+                for future, (collector, started, deadline) in list(running.items()):
+                    if now >= deadline:
+                        running.pop(future)
+                        self.abandoned[future] = collector
+                        self._set_status(collector.name, STATUS_TIMEOUT, now - started)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return self.status
+
+    def join(self, timeout=JOIN_TIMEOUT):
+        """ Wait for timed out collectors which are still running
+
+        Their threads cannot be killed, so the output must not be closed
+        under them while they may still write to it.
+        Returns:
+            list: names of the collectors still running after timeout
+        """
+        if not self.abandoned:
+            return []
+        done, not_done = wait(list(self.abandoned), timeout=timeout)
+        still_running = [self.abandoned[x].name for x in not_done]
+        for name in still_running:
+            self.status[name]['error'] = 'still running when the output was closed'
+            log.debug('[*] collector {} is still running'.format(name))
+        return still_running
@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import tempfile
+import threading
+from dfhash import HashEngine, HASH_ALGORITHMS, HASH_WORKERS
+from dflogging import *
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_artifact_store(path, algorithms=HASH_ALGORITHMS, workers=HASH_WORKERS):
+    """ ArtifactStore shared by every DFbase object using the same path
+
+    The hashing options of the first caller are used for the store.
+    """
+    path = os.path.abspath(path)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ArtifactStore(path, HashEngine(algorithms, workers))
+        return _stores[path]
+
+
+class ArtifactStore():
+    """ Content-addressed store of acquired files
+
+    A file is hashed once per (dev, inode, size, mtime) and stored once
+    under <path>/<sha256[:2]>/<sha256>, however many processes, diff
+    entries or containers refer to it. Objects are named by sha256 rather
+    than md5, so a file with a colliding md5 cannot take the place of
+    another one.
+
+    Args:
+        path (str): directory of the store
+        engine (HashEngine): hashing engine, always computing sha256
+    """
+
+    def __init__(self, path, engine):
+        self.path = path
+        self.engine = engine
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.digests = {}
+        self.hashed = 0
+        self.stored = 0
+
+    def get_object_path(self, digest):
+        return '{}/{}/{}'.format(self.path, digest[:2], digest)
+
+    def has_object(self, digests):
+        """ True if the object of digests is stored with the expected size """
+        try:
+            return os.stat(self.get_object_path(digests['sha256'])).st_size == digests['size']
+        except OSError:
+            return False
+
+    def get_key(self, filepath, st=None):
+        if st is None:
+            st = os.stat(filepath)
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        with self.lock:
+            return key, self.key_locks.setdefault(key, threading.Lock())
+
+    def seed(self, st, digests):
+        """ Digests known from a previous run for an unchanged inode """
+        if 'sha256' not in digests:
+            return
+        key, key_lock = self.get_key(None, st)
+        with key_lock:
+            self.digests.setdefault(key, digests)
+
+    def hash(self, filepath, st=None):
+        """ Digests of a file without storing it, computed once per inode
+
+        Returns:
+            dict: digests by algorithm name and 'size'
+        """
+        key, key_lock = self.get_key(filepath, st)
+        with key_lock:
+            digests = self.digests.get(key)
+            if digests is None:
+                digests = self.engine.hash_file(filepath)
+                self.digests[key] = digests
+                self.hashed += 1
+        return digests
+
+    def put(self, filepath, st=None):
+        """ Hash and store a file unless the same inode was already stored
+
+        Args:
+            filepath (str): file to acquire
+            st (os.stat_result): stat of filepath if already known
+        Returns:
+            tuple: (dict of digests, object path)
+        Raises:
+            OSError: filepath could not be read or stored
+        """
+        key, key_lock = self.get_key(filepath, st)
+        with key_lock:
+            digests = self.digests.get(key)
+            if digests is not None and self.has_object(digests):
+                return digests, self.get_object_path(digests['sha256'])
+
+            # hash while copying to a temporary object, then name it by sha256
+            if not os.path.exists(self.path):
+                os.makedirs(self.path, mode=0o700, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=self.path)
+            os.close(fd)
+            try:
+                digests = self.engine.copy_file(filepath, tmp_path)
+                object_path = self.get_object_path(digests['sha256'])
+                if self.has_object(digests):
+                    os.unlink(tmp_path)
+                else:
+                    os.makedirs(os.path.dirname(object_path), mode=0o700, exist_ok=True)
+                    # replaces a truncated object left by an interrupted run
+                    os.replace(tmp_path, object_path)
+                    self.stored += 1
+                    log.log(TRACE, '[*] Stored object %s from %s', object_path, filepath)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+            self.digests[key] = digests
+            self.hashed += 1
+
+        return digests, object_path
@@ -0,0 +1,302 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import time
+import errno
+import ctypes
+import select
+import struct
+import ctypes.util
+from collections import deque
+from dflogging import *
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+
+INOTIFY_EVENT = struct.Struct('iIII')
+
+FAN_CLOEXEC = 0x00000001
+FAN_NONBLOCK = 0x00000002
+FAN_CLASS_NOTIF = 0x00000000
+FAN_MARK_ADD = 0x00000001
+FAN_OPEN_EXEC = 0x00001000
+FAN_EVENT_ON_CHILD = 0x08000000
+FAN_EVENT = struct.Struct('IBBHQii')
+AT_FDCWD = -100
+
+EVENT_CREATE = "create"
+EVENT_MODIFY = "modify"
+EVENT_CLOSE_WRITE = "close_write"
+EVENT_DELETE = "delete"
+EVENT_MOVED_FROM = "moved_from"
+EVENT_MOVED_TO = "moved_to"
+EVENT_ATTRIB = "attrib"
+EVENT_EXEC = "exec"
+EVENT_OVERFLOW = "overflow"
+
+INOTIFY_EVENTS = [
+    (IN_CREATE, EVENT_CREATE),
+    (IN_MODIFY, EVENT_MODIFY),
+    (IN_CLOSE_WRITE, EVENT_CLOSE_WRITE),
+    (IN_DELETE, EVENT_DELETE),
+    (IN_MOVED_FROM, EVENT_MOVED_FROM),
+    (IN_MOVED_TO, EVENT_MOVED_TO),
+    (IN_ATTRIB, EVENT_ATTRIB),
+]
+
+WATCH_BUFFER_SIZE = 100000
+WATCH_READ_SIZE = 64 * 1024
+WATCH_POLL_INTERVAL = 1.0
+
+
+def load_libc():
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    if hasattr(libc, 'fanotify_init'):
+        libc.fanotify_init.argtypes = [ctypes.c_uint, ctypes.c_uint]
+        libc.fanotify_mark.argtypes = [ctypes.c_int, ctypes.c_uint, ctypes.c_uint64,
+                                        ctypes.c_int, ctypes.c_char_p]
+    return libc
+
+
+def check_call(result):
+    if result < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return result
+
+
+class LayerWatcher():
+    """ inotify (and fanotify exec) events of a writable layer
+
+    Every directory below root gets an inotify watch, directories created
+    later are watched as they appear. Executions are reported through
+    fanotify FAN_OPEN_EXEC marks when the kernel and privileges allow it.
+    Events are kept as (time, kind, path) tuples in a ring buffer of
+    capacity entries, the oldest are dropped once it is full; consecutive
+    modifications of a file are recorded once until it is closed.
+
+    Args:
+        root (str): UpperDir of overlay or diff branch of AUFS
+        on_file (callable): called on the event thread with (host path,
+            container path) once a regular file is written, moved in or
+            executed
+        capacity (int): size of the ring buffer
+    """
+
+    def __init__(self, root, on_file=None, capacity=WATCH_BUFFER_SIZE):
+        self.root = root.rstrip('\n').rstrip('/')
+        self.on_file = on_file
+        self.events = deque(maxlen=capacity)
+        self.dropped = 0
+        self.counts = {}
+        self.watches = {}
+        self.modified = set()
+        self.unwatched = 0
+        self.libc = load_libc()
+        self.inotify_fd = None
+        self.fanotify_fd = None
+        self.poller = None
+        self.exec_events = False
+
+    def record(self, kind, relpath):
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        self.events.append((time.time(), kind, relpath))
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def start(self):
+        self.inotify_fd = check_call(self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+        self.fanotify_fd = self.init_fanotify()
+        self.poller = select.poll()
+        self.poller.register(self.inotify_fd, select.POLLIN)
+        if self.fanotify_fd is not None:
+            self.poller.register(self.fanotify_fd, select.POLLIN)
+        self.exec_events = self.fanotify_fd is not None
+        self.watch_tree(self.root, '', initial=True)
+        log.debug('[*] watching {} directories of {}, exec events: {}'.format(len(self.watches),
+                    self.root, self.fanotify_fd is not None))
+        return self
+
+    def init_fanotify(self):
+        if not hasattr(self.libc, 'fanotify_init'):
+            return None
+        fd = self.libc.fanotify_init(FAN_CLASS_NOTIF | FAN_CLOEXEC | FAN_NONBLOCK, os.O_RDONLY)
+        if fd < 0:
+            log.debug('[*] fanotify is not available: {}'.format(os.strerror(ctypes.get_errno())))
+            return None
+        return fd
+
+    def add_watch(self, path, relpath):
+        wd = self.libc.inotify_add_watch(self.inotify_fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC and not self.unwatched:
+                log.debug('[*] inotify watch limit reached, see fs.inotify.max_user_watches')
+            self.unwatched += 1
+            return False
+        self.watches[wd] = relpath
+        if self.fanotify_fd is not None:
+            if self.libc.fanotify_mark(self.fanotify_fd, FAN_MARK_ADD, FAN_OPEN_EXEC | FAN_EVENT_ON_CHILD,
+                                        AT_FDCWD, os.fsencode(path)) < 0:
+                log.debug('[*] fanotify mark failed: {}'.format(os.strerror(ctypes.get_errno())))
+                self.stop_fanotify()
+        return True
+
+    def stop_fanotify(self):
+        """ Give up exec events, e.g. when a directory cannot be marked """
+        # a closed fd left registered would be reported as POLLNVAL forever
+        self.poller.unregister(self.fanotify_fd)
+        os.close(self.fanotify_fd)
+        self.fanotify_fd = None
+        self.exec_events = False
+
+    def watch_tree(self, path, relpath, initial=False):
+        """ Watch path and every directory below it
+
+        Entries of a directory created after the watch started may have
+        been created before its watch was added, they are recorded as
+        created and handed to on_file.
+        """
+        stack = [(path, relpath)]
+        while stack:
+            dirpath, dir_relpath = stack.pop()
+            self.add_watch(dirpath, dir_relpath)
+            try:
+                entries = list(os.scandir(dirpath))
+            except OSError:
+                continue
+            for entry in entries:
+                entry_relpath = dir_relpath + '/' + entry.name
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if is_dir:
+                    stack.append((entry.path, entry_relpath))
+                if initial:
+                    continue
+                self.record(EVENT_CREATE, entry_relpath)
+                if not is_dir:
+                    self.notify_file(entry.path, entry_relpath)
+
+    def notify_file(self, path, relpath):
+        if self.on_file is not None:
+            self.on_file(path, relpath)
+
+    def read_inotify(self):
+        try:
+            data = os.read(self.inotify_fd, WATCH_READ_SIZE)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b'\0')
+            offset += INOTIFY_EVENT.size + length
+            self.handle_inotify(wd, mask, os.fsdecode(name))
+
+    def handle_inotify(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            self.record(EVENT_OVERFLOW, '')
+            return
+        if mask & IN_IGNORED:
+            self.watches.pop(wd, None)
+            return
+        dir_relpath = self.watches.get(wd)
+        if dir_relpath is None or mask & IN_DELETE_SELF:
+            return
+        relpath = dir_relpath + '/' + name
+        path = self.root + relpath
+
+        for flag, kind in INOTIFY_EVENTS:
+            if not mask & flag:
+                continue
+            if flag == IN_MODIFY:
+                if relpath in self.modified:
+                    continue
+                self.modified.add(relpath)
+            elif flag == IN_CLOSE_WRITE:
+                self.modified.discard(relpath)
+            self.record(kind, relpath)
+
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self.watch_tree(path, relpath)
+        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            self.notify_file(path, relpath)
+
+    def read_fanotify(self):
+        try:
+            data = os.read(self.fanotify_fd, WATCH_READ_SIZE)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + FAN_EVENT.size <= len(data):
+            event_len, version, reserved, metadata_len, mask, fd, pid = FAN_EVENT.unpack_from(data, offset)
+            offset += event_len or FAN_EVENT.size
+            if fd < 0:
+                continue
+            try:
+                path = os.readlink('/proc/self/fd/{}'.format(fd))
+            except OSError:
+                path = None
+            finally:
+                os.close(fd)
+            if path is None or not path.startswith(self.root + '/'):
+                continue
+            relpath = path[len(self.root):]
+            if mask & FAN_OPEN_EXEC:
+                self.record(EVENT_EXEC, relpath)
+                self.notify_file(path, relpath)
+
+    def run(self, duration=0, stop=None):
+        """ Handle events for duration seconds, until stop is set if 0 """
+        deadline = time.monotonic() + duration if duration else None
+
+        while not (stop is not None and stop.is_set()):
+            timeout = WATCH_POLL_INTERVAL
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    break
+            for fd, event in self.poller.poll(timeout * 1000):
+                # the fanotify fd may have been dropped by an earlier event of the batch
+                if fd == self.inotify_fd:
+                    self.read_inotify()
+                elif self.fanotify_fd is not None and fd == self.fanotify_fd:
+                    self.read_fanotify()
+
+    def close(self):
+        for fd in (self.inotify_fd, self.fanotify_fd):
+            if fd is not None:
+                os.close(fd)
+        self.inotify_fd = self.fanotify_fd = None
+        self.poller = None
+
+    def get_summary(self):
+        return {
+            'root': self.root,
+            'watched_directories': len(self.watches),
+            'unwatched_directories': self.unwatched,
+            'exec_events': self.exec_events,
+            'events': self.counts,
+            'buffered': len(self.events),
+            'dropped': self.dropped,
+        }
@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import sys
+import json
+import shutil
+import socketserver
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dfapi import DockerClient, DockerAPIError, demux_stream, get_docker_client, STREAM_HEADER
+
+
+def frame(stream, data):
+    return STREAM_HEADER.pack(stream, len(data)) + data
+
+
+class FakeEngineHandler(BaseHTTPRequestHandler):
+    """ Engine API stand-in over a Unix socket """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def address_string(self):
+        return 'unix'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.accepted += 1
+
+    def send_body(self, code, body, content_type='application/json'):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, code, data):
+        self.send_body(code, json.dumps(data).encode('utf-8'))
+
+    def send_chunked(self, body, size=7):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i in range(0, len(body), size):
+            chunk = body[i:i + size]
+            self.wfile.write('{:x}\r\n'.format(len(chunk)).encode('ascii') + chunk + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def do_GET(self):
+        if self.path == '/_ping':
+            return self.send_body(200, b'OK', 'text/plain')
+        if self.path.startswith('/containers/json'):
+            return self.send_json(200, [{'Id': 'aaa'}, {'Id': 'bbb'}])
+        if self.path == '/containers/aaa/changes':
+            changes = [{'Path': '/etc', 'Kind': 0}, {'Path': '/etc/x', 'Kind': 1},
+                       {'Path': '/tmp/y', 'Kind': 2}]
+            return self.send_chunked(json.dumps(changes).encode('utf-8'))
+        if self.path == '/containers/aaa/json':
+            return self.send_json(200, {'Id': 'aaa', 'State': {'Pid': 1}})
+        if self.path == '/containers/broken/json':
+            return self.send_body(500, b'daemon exploded', 'text/plain')
+        if self.path == '/containers/stale/json':
+            # answers as keep-alive, then drops the connection
+            self.send_json(200, {'Id': 'stale'})
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.send_json(404, {'message': 'No such container'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length).decode('utf-8')) if length else None
+        if self.path == '/containers/aaa/exec':
+            self.server.exec_body = body
+            return self.send_json(201, {'Id': 'e1'})
+        if self.path == '/exec/e1/start':
+            return self.send_body(200, frame(1, b'out-1 ') + frame(2, b'err') + frame(1, b'out-2'),
+                                    'application/vnd.docker.raw-stream')
+        if self.path == '/exec/drop/start':
+            # the command ran, the answer is lost
+            with self.server.lock:
+                self.server.dropped += 1
+            self.close_connection = True
+            return
+        self.send_json(404, {'message': 'No such exec instance'})
+
+
+class FakeEngineServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        super().__init__(path, FakeEngineHandler)
+        self.lock = threading.Lock()
+        self.accepted = 0
+        self.exec_body = None
+        self.dropped = 0
+
+
+class DemuxStreamTest(unittest.TestCase):
+
+    def test_frames(self):
+        data = frame(1, b'a') + frame(2, b'b') + frame(1, b'c')
+        self.assertEqual(demux_stream(data), (b'ac', b'b'))
+
+    def test_tty_stream(self):
+        self.assertEqual(demux_stream(b'plain output\n'), (b'plain output\n', b''))
+
+    def test_truncated_frame(self):
+        data = frame(1, b'abc')[:-1]
+        self.assertEqual(demux_stream(data), (data, b''))
+
+    def test_empty(self):
+        self.assertEqual(demux_stream(b''), (b'', b''))
+
+
+class DockerClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='dfapi_test_')
+        self.socket_path = os.path.join(self.tmp, 'docker.sock')
+        self.server = FakeEngineServer(self.socket_path)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.client = DockerClient(self.socket_path, timeout=5)
+
+    def tearDown(self):
+        while not self.client.pool.empty():
+            self.client.pool.get_nowait().close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_ping_and_containers(self):
+        self.assertTrue(self.client.ping())
+        self.assertEqual(self.client.containers(), ['aaa', 'bbb'])
+
+    def test_chunked_changes(self):
+        self.assertEqual(self.client.changes('aaa'), ['C /etc', 'A /etc/x', 'D /tmp/y'])
+
+    def test_exec_demux(self):
+        self.assertEqual(self.client.exec('aaa', ['cat', '/etc/passwd']), (b'out-1 out-2', b'err'))
+        self.assertEqual(self.server.exec_body['Cmd'], ['cat', '/etc/passwd'])
+        self.assertFalse(self.server.exec_body['Tty'])
+
+    def test_connection_reuse(self):
+        for i in range(5):
+            self.assertEqual(self.client.inspect('aaa')['Id'], 'aaa')
+        self.client.changes('aaa')
+        self.assertEqual(self.client.get_stats()['requests'], 6)
+        self.assertEqual(self.client.get_stats()['connections'], 1)
+        self.assertEqual(self.server.accepted, 1)
+
+    def test_not_found(self):
+        with self.assertRaises(DockerAPIError) as cm:
+            self.client.inspect('missing')
+        self.assertEqual(cm.exception.status, 404)
+        self.assertEqual(cm.exception.message, 'No such container')
+
+    def test_error_without_json(self):
+        with self.assertRaises(DockerAPIError) as cm:
+            self.client.inspect('broken')
+        self.assertEqual(cm.exception.status, 500)
+        self.assertEqual(cm.exception.message, 'daemon exploded')
+        # the connection survives an error status
+        self.assertEqual(self.client.inspect('aaa')['Id'], 'aaa')
+        self.assertEqual(self.client.get_stats()['connections'], 1)
+
+    def test_stale_connection_is_replaced(self):
+        self.assertEqual(self.client.inspect('stale')['Id'], 'stale')
+        self.assertEqual(self.client.inspect('aaa')['Id'], 'aaa')
+        self.assertEqual(self.client.get_stats()['connections'], 2)
+
+    def test_post_is_not_retried(self):
+        with self.assertRaises(OSError):
+            self.client.request('POST', '/exec/drop/start', body={'Detach': False})
+        self.assertEqual(self.server.dropped, 1)
+
+    def test_daemon_gone(self):
+        self.server.shutdown()
+        self.server.server_close()
+        os.unlink(self.socket_path)
+        client = DockerClient(self.socket_path, timeout=5)
+        with self.assertRaises(OSError):
+            client.ping()
+        self.assertIsNone(get_docker_client(self.socket_path))
+
+    def test_daemon_recovers(self):
+        socket_path = os.path.join(self.tmp, 'late.sock')
+        self.assertIsNone(get_docker_client(socket_path))
+        server = FakeEngineServer(socket_path)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            client = get_docker_client(socket_path)
+            self.assertIsNotNone(client)
+            self.assertIs(get_docker_client(socket_path), client)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
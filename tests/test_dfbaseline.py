@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dfhash import HashEngine
+from dfpolicy import AcquisitionPolicy
+from dfbaseline import BloomFilter, LayerBaseline, get_image_baseline, get_layer_id, \
+                       STATUS_IMAGE, STATUS_UNCHANGED, STATUS_KNOWN, STATUS_MODIFIED, STATUS_ABSENT, \
+                       DIGEST_SOURCE_BASELINE
+
+
+def write(path, data, mode=0o755):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    os.chmod(path, mode)
+
+
+class BloomFilterTest(unittest.TestCase):
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        keys = ['p:/usr/bin/tool{}'.format(i) for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(x in bloom for x in keys))
+        # 1% at capacity, with a wide margin
+        misses = sum('p:/missing{}'.format(i) in bloom for i in range(10000))
+        self.assertLess(misses, 500)
+
+    def test_round_trip(self):
+        bloom = BloomFilter(10)
+        bloom.add('d:abc')
+        loaded = BloomFilter.from_bytes(bloom.to_bytes())
+        self.assertIn('d:abc', loaded)
+        self.assertEqual((loaded.size, loaded.hashes), (bloom.size, bloom.hashes))
+
+    def test_layer_id(self):
+        self.assertEqual(get_layer_id('/var/lib/docker/overlay2/abc/diff/'), 'abc')
+        self.assertEqual(get_layer_id('/var/lib/docker/overlay/abc/root'), 'abc')
+        self.assertEqual(get_layer_id('/var/lib/docker/aufs/diff/abc'), 'abc')
+
+
+class BaselineTest(unittest.TestCase):
+    """ Container over two indexed layers
+
+    base:  /bin/sh, /bin/cat, /etc/motd (not executable, not indexed)
+    image: /usr/bin/app
+    upper: /bin/cat unchanged, /usr/bin/app modified, /usr/local/bin/copy
+           a copy of /bin/sh, /tmp/dropper new
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='dfbaseline_test_')
+        layers = os.path.join(self.tmp, 'overlay2')
+        self.base = os.path.join(layers, 'base', 'diff')
+        self.image = os.path.join(layers, 'image', 'diff')
+        self.upper = os.path.join(layers, 'container', 'diff')
+        self.db_path = os.path.join(self.tmp, 'baseline')
+
+        write(self.base + '/bin/sh', b'\x7fELF shell')
+        write(self.base + '/bin/cat', b'\x7fELF cat')
+        write(self.base + '/etc/motd', b'hello\n', 0o644)
+        write(self.image + '/usr/bin/app', b'#!/bin/sh\necho app\n')
+        write(self.upper + '/bin/cat', b'\x7fELF cat')
+        write(self.upper + '/usr/bin/app', b'#!/bin/sh\necho backdoor\n')
+        write(self.upper + '/usr/local/bin/copy', b'\x7fELF shell')
+        write(self.upper + '/tmp/dropper', b'\x7fELF dropper')
+
+        self.engine = HashEngine(['md5', 'sha256'], workers=2)
+        self.policy = AcquisitionPolicy()
+        self.hashed = []
+
+    def tearDown(self):
+        self.engine.executor.shutdown()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def hash_fn(self, filepath, st):
+        self.hashed.append(filepath)
+        return self.engine.hash_file(filepath)
+
+    def get_baseline(self):
+        return get_image_baseline(self.upper, [self.image, self.base], False, self.db_path,
+                                  self.policy, self.engine)
+
+    def triage(self, baseline, relpath):
+        filepath = self.upper + relpath
+        if not os.path.exists(filepath):
+            filepath = baseline.lookup_path(relpath)[0][0]
+        return baseline.triage(relpath, filepath, os.lstat(filepath), self.hash_fn)
+
+    def test_layer_index(self):
+        baseline = self.get_baseline()
+        base = baseline.layers[1]
+        self.assertEqual(base.files, 2)
+        digests, verified = base.lookup_path('/bin/sh', os.lstat(self.base + '/bin/sh'))
+        self.assertTrue(verified)
+        self.assertEqual(digests, self.engine.hash_file(self.base + '/bin/sh'))
+        # not acquired by the policy, so not indexed
+        self.assertEqual(base.lookup_path('/etc/motd', os.lstat(self.base + '/etc/motd')), (None, False))
+        self.assertTrue(base.has_digest(digests['sha256']))
+        self.assertFalse(base.has_digest('0' * 64))
+
+    def test_index_is_reused(self):
+        self.get_baseline()
+        layer = LayerBaseline(self.base, os.path.join(self.db_path, 'base.db'))
+        self.assertTrue(layer.open('sha256'))
+        self.assertEqual(layer.files, 2)
+        # another key algorithm needs another index
+        self.assertFalse(LayerBaseline(self.base, os.path.join(self.db_path, 'base.db')).open('md5'))
+
+    def test_stale_version_is_rebuilt(self):
+        self.get_baseline()
+        with sqlite3.connect(os.path.join(self.db_path, 'base.db')) as conn:
+            conn.execute("UPDATE meta SET value = '1' WHERE key = 'version'")
+        conn.close()
+        self.assertFalse(LayerBaseline(self.base, os.path.join(self.db_path, 'base.db')).open('sha256'))
+
+    def test_triage(self):
+        baseline = self.get_baseline()
+        status, digests = self.triage(baseline, '/bin/sh')
+        self.assertEqual(status, STATUS_IMAGE)
+        self.assertEqual(digests['digest_source'], DIGEST_SOURCE_BASELINE)
+        # a verified row spares reading the file
+        self.assertEqual(self.hashed, [])
+
+        self.assertEqual(self.triage(baseline, '/bin/cat')[0], STATUS_UNCHANGED)
+        self.assertEqual(self.triage(baseline, '/usr/bin/app')[0], STATUS_MODIFIED)
+        self.assertEqual(self.triage(baseline, '/usr/local/bin/copy')[0], STATUS_KNOWN)
+        self.assertEqual(self.triage(baseline, '/tmp/dropper')[0], STATUS_ABSENT)
+
+    def test_rows_are_verified_against_the_layer_file(self):
+        baseline = self.get_baseline()
+        # the lower layer was tampered with after it was indexed
+        write(self.base + '/bin/sh', b'\x7fELF trojan')
+        status, digests = self.triage(baseline, '/bin/sh')
+        self.assertEqual(status, STATUS_IMAGE)
+        self.assertNotIn('digest_source', digests)
+        self.assertEqual(digests, self.engine.hash_file(self.base + '/bin/sh'))
+        self.assertEqual(self.hashed, [self.base + '/bin/sh'])
+
+        write(self.base + '/bin/cat', b'\x7fELF dog')
+        # the upper file is compared with what the layer holds now
+        self.assertEqual(self.triage(baseline, '/bin/cat')[0], STATUS_MODIFIED)
+
+    def test_same_content_new_times_is_not_trusted(self):
+        baseline = self.get_baseline()
+        st = os.lstat(self.base + '/bin/sh')
+        os.utime(self.base + '/bin/sh', ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        digests, verified = baseline.layers[1].lookup_path('/bin/sh', os.lstat(self.base + '/bin/sh'))
+        self.assertFalse(verified)
+        status, digests = self.triage(baseline, '/bin/sh')
+        self.assertNotIn('digest_source', digests)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import sys
+import stat
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dfcopy import copy_file, copy_and_hash
+from dfoutput import ArchiveOutput
+
+
+class EvidenceModeTest(unittest.TestCase):
+    """ Copies of a setuid binary keep its permissions, not the setuid bit """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='dfcopy_test_')
+        self.src = os.path.join(self.tmp, 'suid')
+        with open(self.src, 'wb') as f:
+            f.write(b'\x7fELF' + b'\0' * 60)
+        os.chmod(self.src, 0o6755)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_copy_file(self):
+        dst = os.path.join(self.tmp, 'copy')
+        copy_file(self.src, dst)
+        self.assertEqual(stat.S_IMODE(os.stat(dst).st_mode), 0o755)
+        self.assertEqual(os.stat(dst).st_mtime_ns, os.stat(self.src).st_mtime_ns)
+
+    def test_copy_and_hash(self):
+        dst = os.path.join(self.tmp, 'copy')
+        digests = copy_and_hash(self.src, dst, ['md5'])
+        self.assertEqual(digests['size'], 64)
+        self.assertEqual(stat.S_IMODE(os.stat(dst).st_mode), 0o755)
+
+    def test_archive_member(self):
+        archive_path = os.path.join(self.tmp, 'a.tar.gz')
+        output = ArchiveOutput(archive_path)
+        output.add_file(self.src, 'executables/suid', ['md5'])
+        output.close()
+        with tarfile.open(archive_path) as tar:
+            self.assertEqual(tar.getmember('executables/suid').mode, 0o755)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import sys
+import stat
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dfscan import build_layer_scanner, AUFS_WHITEOUT_PREFIX, AUFS_OPAQUE_MARKER, OVERLAY_OPAQUE_XATTR
+from dfdiff import LowerLayers, LayerDiff
+
+
+# what docker diff prints for the fixture below, with either driver
+EXPECTED_DIFF = [
+    'C /etc',
+    'D /etc/hosts',
+    'A /etc/new',
+    'C /etc/passwd',
+    'C /opt',
+    'A /opt/y',
+    'A /tmp',
+    'A /tmp/new',
+    'C /usr',
+    'D /usr/lib',
+    'A /usr/lib/c',
+]
+
+
+def supports_overlay_markers():
+    """ mknod and trusted.* xattrs need root (CAP_MKNOD, CAP_SYS_ADMIN) """
+    tmp = tempfile.mkdtemp(prefix='dfdiff_probe_')
+    try:
+        os.mknod(tmp + '/wh', 0o600 | stat.S_IFCHR, os.makedev(0, 0))
+        os.setxattr(tmp, OVERLAY_OPAQUE_XATTR, b'y', follow_symlinks=False)
+        return True
+    except OSError:
+        return False
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+class LayerFixture():
+    """ Writable layer over two read-only layers, overlay or AUFS naming
+
+    base:  /etc/passwd /etc/hosts /usr/lib/a /opt/old/x
+    image: /opt/old whited out, /usr/lib opaque with /usr/lib/b
+    upper: /etc/passwd changed, /etc/hosts whited out, /etc/new,
+           /usr/lib opaque with /usr/lib/c, /opt/y, /tmp/new
+    """
+
+    def __init__(self, root, aufs=False):
+        self.root = root
+        self.aufs = aufs
+        self.upper = os.path.join(root, 'upper')
+        self.image = os.path.join(root, 'image')
+        self.base = os.path.join(root, 'base')
+
+    def file(self, layer, relpath, data=b''):
+        os.makedirs(os.path.dirname(layer + relpath), exist_ok=True)
+        with open(layer + relpath, 'wb') as f:
+            f.write(data)
+
+    def whiteout(self, layer, relpath):
+        dirname, name = relpath.rsplit('/', 1)
+        os.makedirs(layer + dirname, exist_ok=True)
+        if self.aufs:
+            self.file(layer, '{}/{}{}'.format(dirname, AUFS_WHITEOUT_PREFIX, name))
+        else:
+            os.mknod(layer + relpath, 0o600 | stat.S_IFCHR, os.makedev(0, 0))
+
+    def opaque(self, layer, relpath):
+        os.makedirs(layer + relpath, exist_ok=True)
+        if self.aufs:
+            self.file(layer, relpath + '/' + AUFS_OPAQUE_MARKER)
+        else:
+            os.setxattr(layer + relpath, OVERLAY_OPAQUE_XATTR, b'y', follow_symlinks=False)
+
+    def create(self):
+        for relpath in ('/etc/passwd', '/etc/hosts', '/usr/lib/a', '/opt/old/x'):
+            self.file(self.base, relpath, b'base')
+
+        self.whiteout(self.image, '/opt/old')
+        self.opaque(self.image, '/usr/lib')
+        self.file(self.image, '/usr/lib/b', b'image')
+
+        self.file(self.upper, '/etc/passwd', b'changed')
+        self.whiteout(self.upper, '/etc/hosts')
+        self.file(self.upper, '/etc/new')
+        self.opaque(self.upper, '/usr/lib')
+        self.file(self.upper, '/usr/lib/c')
+        self.file(self.upper, '/opt/y')
+        self.file(self.upper, '/tmp/new')
+        if self.aufs:
+            # AUFS housekeeping, never part of the diff
+            self.file(self.upper, '/' + AUFS_WHITEOUT_PREFIX * 2 + 'aufs')
+            self.file(self.upper, '/' + AUFS_WHITEOUT_PREFIX * 2 + 'plnk/1234.5')
+            os.makedirs(self.upper + '/' + AUFS_WHITEOUT_PREFIX * 2 + 'orph')
+        return self
+
+    def lower(self):
+        return LowerLayers([self.image, self.base], aufs=self.aufs)
+
+    def native_diff(self, workers=4):
+        scanner = build_layer_scanner(self.upper, aufs=self.aufs, workers=workers).scan()
+        try:
+            return sorted(LayerDiff(scanner, self.lower(), aufs=self.aufs).changes(), key=lambda x: x[2:])
+        finally:
+            scanner.close()
+
+
+class NativeDiffTestMixin():
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='dfdiff_test_')
+        self.fixture = LayerFixture(self.tmp, aufs=self.aufs).create()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_matches_docker_diff(self):
+        self.assertEqual(self.fixture.native_diff(), EXPECTED_DIFF)
+
+    def test_workers(self):
+        self.assertEqual(self.fixture.native_diff(workers=1), self.fixture.native_diff(workers=8))
+
+    def test_lower_layers(self):
+        lower = self.fixture.lower()
+        # the topmost layer having the path wins
+        self.assertEqual(lower.resolve('/etc/passwd')[0], self.fixture.base + '/etc/passwd')
+        self.assertEqual(lower.resolve('/usr/lib/b')[0], self.fixture.image + '/usr/lib/b')
+        # a whiteout hides the path and everything below it in lower layers
+        self.assertIsNone(lower.resolve('/opt/old'))
+        self.assertIsNone(lower.resolve('/opt/old/x'))
+        # an opaque directory hides what lower layers have below it
+        self.assertIsNone(lower.resolve('/usr/lib/a'))
+        self.assertIsNotNone(lower.lookup('/usr/lib'))
+        self.assertIsNone(lower.lookup('/missing'))
+
+
+@unittest.skipUnless(supports_overlay_markers(), 'whiteouts and opaque xattrs need root')
+class OverlayNativeDiffTest(NativeDiffTestMixin, unittest.TestCase):
+    aufs = False
+
+
+class AufsNativeDiffTest(NativeDiffTestMixin, unittest.TestCase):
+    aufs = True
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dfscan import build_layer_scanner
+from dfindex import SnapshotIndex, CHANGE_ADDED, CHANGE_MODIFIED, CHANGE_DELETED
+
+
+def make_file(root, relpath, data=b''):
+    os.makedirs(os.path.dirname(root + relpath), exist_ok=True)
+    with open(root + relpath, 'wb') as f:
+        f.write(data)
+
+
+class SnapshotIndexTest(unittest.TestCase):
+    """ Two runs over a writable layer, as scan_writable_layer does them """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='dfindex_test_')
+        self.root = os.path.join(self.tmp, 'diff')
+        self.db_path = os.path.join(self.tmp, 'index', 'container.db')
+        make_file(self.root, '/etc/passwd', b'root:x:0:0::/root:/bin/sh\n')
+        make_file(self.root, '/etc/group', b'root:x:0:\n')
+        make_file(self.root, '/bin/tool', b'\x7fELF tool')
+        make_file(self.root, '/var/log/app.log', b'started\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def run_once(self):
+        """ Returns:
+                tuple: (SnapshotIndex, {change: [path relative to the layer]})
+        """
+        snapshot = SnapshotIndex(self.db_path)
+        snapshot.load()
+        scanner = build_layer_scanner(self.root, workers=4).scan()
+        self.addCleanup(scanner.close)
+        entries = ((self.root + x, y) for x, y in scanner.get('changed').items())
+        changes = {CHANGE_ADDED: [], CHANGE_MODIFIED: [], CHANGE_DELETED: []}
+        for change, path, st in snapshot.compare(entries):
+            changes[change].append(path[len(self.root):])
+        return snapshot, changes
+
+    def test_first_run_adds_everything(self):
+        snapshot, changes = self.run_once()
+        self.assertEqual(snapshot.previous_run, None)
+        self.assertEqual(changes[CHANGE_ADDED], ['/bin', '/bin/tool', '/etc', '/etc/group',
+                         '/etc/passwd', '/var', '/var/log', '/var/log/app.log'])
+        self.assertEqual(snapshot.delta, {CHANGE_ADDED: 8, CHANGE_MODIFIED: 0, CHANGE_DELETED: 0})
+
+    def test_delta(self):
+        snapshot, changes = self.run_once()
+        snapshot.save()
+
+        # grows the file, so its size changes whatever the mtime granularity
+        make_file(self.root, '/etc/passwd', b'root:x:0:0::/root:/bin/sh\nevil:x:0:0::/:/bin/sh\n')
+        os.unlink(self.root + '/etc/group')
+        make_file(self.root, '/bin/dropper', b'\x7fELF dropper')
+
+        snapshot, changes = self.run_once()
+        self.assertEqual(snapshot.previous_run['run_id'], 1)
+        self.assertEqual(changes[CHANGE_ADDED], ['/bin/dropper'])
+        # directories change with the entries added to or removed from them
+        self.assertEqual(changes[CHANGE_MODIFIED], ['/bin', '/etc', '/etc/passwd'])
+        self.assertEqual(changes[CHANGE_DELETED], ['/etc/group'])
+        self.assertEqual(snapshot.delta, {CHANGE_ADDED: 1, CHANGE_MODIFIED: 3, CHANGE_DELETED: 1})
+
+    def test_unchanged_run(self):
+        snapshot, changes = self.run_once()
+        snapshot.save()
+        snapshot, changes = self.run_once()
+        self.assertEqual(snapshot.delta, {CHANGE_ADDED: 0, CHANGE_MODIFIED: 0, CHANGE_DELETED: 0})
+
+    def test_digests_are_reused_while_unchanged(self):
+        snapshot, changes = self.run_once()
+        tool = self.root + '/bin/tool'
+        log_path = self.root + '/var/log/app.log'
+        snapshot.set_digests(tool, os.lstat(tool), {'md5': 'a' * 32, 'sha256': 'b' * 64, 'size': 9})
+        snapshot.set_digests(log_path, os.lstat(log_path), {'md5': 'c' * 32, 'size': 8})
+        # acquired outside the layer, kept for its digests only
+        exe = os.path.join(self.tmp, 'exe')
+        make_file(self.tmp, '/exe', b'outside')
+        snapshot.set_digests(exe, os.lstat(exe), {'md5': 'd' * 32, 'size': 7})
+        snapshot.save()
+
+        make_file(self.root, '/var/log/app.log', b'started\nstopped\n')
+        os.unlink(exe)
+        snapshot, changes = self.run_once()
+        self.assertEqual(snapshot.get_unchanged_digests(tool, os.lstat(tool)),
+                         {'md5': 'a' * 32, 'sha256': 'b' * 64, 'size': 9})
+        self.assertIsNone(snapshot.get_unchanged_digests(log_path, os.lstat(log_path)))
+        self.assertEqual(changes[CHANGE_DELETED], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
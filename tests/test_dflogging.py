@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import sys
+import time
+import queue
+import socket
+import logging
+import logging.handlers
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dflogging import BatchedSysLogHandler, BatchingQueueListener, PlainFormatter
+
+
+class BatchedSysLogHandlerTest(unittest.TestCase):
+    """ Records go through a BatchingQueueListener to a local UDP listener """
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.settimeout(5)
+        self.logger = logging.getLogger('test_dflogging.{}'.format(self.id()))
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.listener = None
+
+    def tearDown(self):
+        if self.listener is not None:
+            self.listener.stop()
+        for handler in self.logger.handlers:
+            self.logger.removeHandler(handler)
+        self.handler.close()
+        self.server.close()
+
+    def start(self, batch_size=64, batch_interval=0.2):
+        self.handler = BatchedSysLogHandler(self.server.getsockname(), socket.SOCK_DGRAM,
+                                            batch_size, batch_interval)
+        self.handler.setFormatter(PlainFormatter('%(message)s'))
+        log_queue = queue.SimpleQueue()
+        self.logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        self.listener = BatchingQueueListener(log_queue, self.handler)
+        self.listener.start()
+
+    def receive(self):
+        return self.server.recv(65536).decode('utf-8')
+
+    def test_idle_batch_is_sent_on_time(self):
+        self.start(batch_interval=0.2)
+        start = time.monotonic()
+        self.logger.info('only message')
+        self.assertTrue(self.receive().endswith('only message\x00'))
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_batch_waits_for_its_interval(self):
+        self.start(batch_interval=1.0)
+        self.logger.info('first')
+        self.logger.info('second')
+        self.server.settimeout(0.3)
+        with self.assertRaises(socket.timeout):
+            self.receive()
+        self.server.settimeout(5)
+        self.assertIn('first', self.receive())
+        self.assertIn('second', self.receive())
+
+    def test_full_batch_is_sent_at_once(self):
+        self.start(batch_size=3, batch_interval=60)
+        for i in range(3):
+            self.logger.info('message {}'.format(i))
+        self.assertEqual([self.receive().rstrip('\x00')[-9:] for i in range(3)],
+                            ['message 0', 'message 1', 'message 2'])
+
+    def test_warning_is_sent_immediately(self):
+        self.start(batch_interval=60)
+        self.logger.warning('alert')
+        self.assertIn('alert', self.receive())
+
+    def test_stop_flushes(self):
+        self.start(batch_interval=60)
+        self.logger.info('pending at exit')
+        self.listener.stop()
+        self.listener = None
+        self.handler.close()
+        self.assertIn('pending at exit', self.receive())
+
+
+if __name__ == '__main__':
+    unittest.main()
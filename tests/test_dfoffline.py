@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dfoffline import list_offline_containers, inspect_offline_containers, get_graph_driver_data
+from dfscan import build_layer_scanner
+from dfdiff import LowerLayers, LayerDiff
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(data)
+
+
+class DockerRootFixture():
+    """ /var/lib/docker of a stopped host, as found on a disk image """
+
+    def __init__(self, root):
+        self.root = root
+
+    def container(self, container_id, driver, mount_id, running=True):
+        write(os.path.join(self.root, 'containers', container_id, 'config.v2.json'), json.dumps({
+            'ID': container_id, 'Name': '/' + container_id[:6], 'Driver': driver,
+            'Image': 'sha256:' + 'f' * 64, 'Path': '/bin/sh', 'Args': ['-c', 'sleep 1d'],
+            'State': {'Running': running, 'Pid': 4242}, 'Config': {'Hostname': container_id[:12]},
+            'MountPoints': {'/data': {'Source': '/srv/data', 'Destination': '/data'}}}))
+        write(os.path.join(self.root, 'containers', container_id, 'hostconfig.json'),
+              json.dumps({'Privileged': True}))
+        write(os.path.join(self.root, 'image', driver, 'layerdb', 'mounts', container_id, 'mount-id'),
+              mount_id + '\n')
+
+    def overlay2(self, container_id, mount_id, lower_ids):
+        self.container(container_id, 'overlay2', mount_id)
+        links = []
+        for layer_id in lower_ids:
+            os.makedirs(os.path.join(self.root, 'overlay2', layer_id, 'diff'), exist_ok=True)
+            link = 'L' + layer_id.upper()
+            if not os.path.lexists(os.path.join(self.root, 'overlay2', 'l', link)):
+                os.makedirs(os.path.join(self.root, 'overlay2', 'l'), exist_ok=True)
+                os.symlink('../{}/diff'.format(layer_id), os.path.join(self.root, 'overlay2', 'l', link))
+            links.append('l/' + link)
+        os.makedirs(os.path.join(self.root, 'overlay2', mount_id, 'diff'))
+        write(os.path.join(self.root, 'overlay2', mount_id, 'lower'), ':'.join(links))
+
+    def file(self, layer_path, relpath, data=''):
+        write(layer_path + relpath, data)
+
+
+class OfflineInspectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='dfoffline_test_')
+        self.fixture = DockerRootFixture(self.tmp)
+        self.fixture.overlay2('a' * 64, 'mount-a', ['image', 'base'])
+        self.fixture.overlay2('ab' + 'c' * 62, 'mount-b', ['base'])
+        self.fixture.container('d' * 64, 'overlay', 'mount-d')
+        write(os.path.join(self.tmp, 'overlay', 'mount-d', 'lower-id'), 'image-d\n')
+        self.fixture.container('e' * 64, 'aufs', 'mount-e')
+        # a directory without config.v2.json is not a container
+        os.makedirs(os.path.join(self.tmp, 'containers', 'f' * 64))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_list(self):
+        self.assertEqual(list_offline_containers(self.tmp), ['a' * 64, 'ab' + 'c' * 62, 'd' * 64, 'e' * 64])
+        self.assertEqual(list_offline_containers(os.path.join(self.tmp, 'missing')), [])
+
+    def test_prefixes(self):
+        inspected, unknown = inspect_offline_containers(self.tmp, ['aa', 'ab', 'a', 'zz'])
+        self.assertEqual(sorted(inspected), ['aa', 'ab'])
+        self.assertEqual(inspected['aa']['Id'], 'a' * 64)
+        # ambiguous or missing
+        self.assertEqual(unknown, ['a', 'zz'])
+
+    def test_every_container(self):
+        inspected, unknown = inspect_offline_containers(self.tmp, [])
+        self.assertEqual(len(inspected), 4)
+        self.assertEqual(unknown, [])
+
+    def test_inspect_item(self):
+        inspected, unknown = inspect_offline_containers(self.tmp, ['a' * 64])
+        item = inspected['a' * 64]
+        self.assertEqual(item['State']['Pid'], 0)
+        self.assertTrue(item['State']['Running'])
+        self.assertEqual(item['HostConfig'], {'Privileged': True})
+        self.assertEqual(item['Mounts'], [{'Source': '/srv/data', 'Destination': '/data'}])
+        self.assertEqual(item['GraphDriver']['Name'], 'overlay2')
+
+    def test_overlay2_graph_driver(self):
+        data = get_graph_driver_data(self.tmp, 'overlay2', 'a' * 64)
+        layer_path = os.path.join(self.tmp, 'overlay2')
+        self.assertEqual(data['UpperDir'], os.path.join(layer_path, 'mount-a', 'diff'))
+        self.assertEqual(data['MergedDir'], os.path.join(layer_path, 'mount-a', 'merged'))
+        # the l/ symlinks are resolved, topmost layer first
+        self.assertEqual(data['LowerDir'].split(':'), [os.path.realpath(os.path.join(layer_path, x, 'diff'))
+                                                       for x in ('image', 'base')])
+
+    def test_overlay_and_aufs_graph_driver(self):
+        data = get_graph_driver_data(self.tmp, 'overlay', 'd' * 64)
+        self.assertEqual(data['UpperDir'], os.path.join(self.tmp, 'overlay', 'mount-d', 'upper'))
+        self.assertEqual(data['LowerDir'], os.path.join(self.tmp, 'overlay', 'image-d', 'root'))
+        self.assertEqual(get_graph_driver_data(self.tmp, 'aufs', 'e' * 64), {})
+        write(os.path.join(self.tmp, 'image', 'btrfs', 'layerdb', 'mounts', 'e' * 64, 'mount-id'), 'mount-e')
+        with self.assertRaises(ValueError):
+            get_graph_driver_data(self.tmp, 'btrfs', 'e' * 64)
+
+    def test_native_diff_from_offline_layers(self):
+        layer_path = os.path.join(self.tmp, 'overlay2')
+        self.fixture.file(os.path.join(layer_path, 'base', 'diff'), '/etc/passwd', 'root')
+        self.fixture.file(os.path.join(layer_path, 'image', 'diff'), '/app/run.sh', 'run')
+        upper = os.path.join(layer_path, 'mount-a', 'diff')
+        self.fixture.file(upper, '/etc/passwd', 'root\nevil')
+        self.fixture.file(upper, '/app/run.sh', 'run evil')
+        self.fixture.file(upper, '/tmp/x')
+
+        inspected, unknown = inspect_offline_containers(self.tmp, ['aa'])
+        data = inspected['aa']['GraphDriver']['Data']
+        scanner = build_layer_scanner(data['UpperDir'], workers=2).scan()
+        self.addCleanup(scanner.close)
+        diff = list(LayerDiff(scanner, LowerLayers(data['LowerDir'].split(':'))).changes())
+        self.assertEqual(diff, ['C /app', 'C /app/run.sh', 'C /etc', 'C /etc/passwd', 'A /tmp', 'A /tmp/x'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dfprobe import build_exec_script, parse_exec_output, is_requested_path, get_probe_name, \
+                    PROBE_FILES_DIR
+
+
+BOUNDARY = 'DF-PROBE-test'
+PATHS = ['/etc/passwd', '/etc/shadow', '/var/spool/cron/crontabs']
+
+
+def section(path, content):
+    return '\n{} {}\n'.format(BOUNDARY, path).encode('utf-8') + content
+
+
+class ParseExecOutputTest(unittest.TestCase):
+
+    def output(self, *sections):
+        return b'Mon Jan  1 00:00:00 UTC 2024\n\n' + BOUNDARY.encode('utf-8') + \
+                b'\n 00:00:00 up 1 min\n' + b''.join(sections)
+
+    def test_requested_files(self):
+        data = self.output(section('/etc/passwd', b'root:x:0:0::/root:/bin/sh\n'),
+                           section('/etc/shadow', b''),
+                           section('/var/spool/cron/crontabs', b''),
+                           section('/var/spool/cron/crontabs/root', b'* * * * * id\n'))
+        result = parse_exec_output(data, BOUNDARY, PATHS)
+        self.assertEqual(result['date'], 'Mon Jan  1 00:00:00 UTC 2024')
+        self.assertEqual(result['uptime'], '00:00:00 up 1 min')
+        self.assertEqual(sorted(result['files']), ['/etc/passwd', '/var/spool/cron/crontabs/root'])
+
+    def test_malicious_headers_are_dropped(self):
+        data = self.output(section('/etc/passwd', b'root:x:0:0::/root:/bin/sh\n'),
+                           section('/../../../etc/cron.d/x', b'* * * * * root id\n'),
+                           section('/etc/passwd/../../etc/cron.d/x', b'evil\n'),
+                           section('/var/spool/cron/crontabs/../../../../tmp/x', b'evil\n'),
+                           section('/var/spool/cron/crontabs2', b'evil\n'),
+                           section('/var/spool/cron/crontabs//root', b'evil\n'),
+                           section('etc/passwd', b'evil\n'),
+                           section('/root/.ssh/authorized_keys', b'evil\n'))
+        result = parse_exec_output(data, BOUNDARY, PATHS)
+        self.assertEqual(list(result['files']), ['/etc/passwd'])
+        for path in result['files']:
+            name = os.path.normpath(get_probe_name(path))
+            self.assertFalse(name.startswith('..') or os.path.isabs(name))
+
+    def test_is_requested_path(self):
+        self.assertTrue(is_requested_path('/var/spool/cron/crontabs/a/b', PATHS))
+        self.assertFalse(is_requested_path('/var/spool/cron/crontabs/./b', PATHS))
+        self.assertFalse(is_requested_path('/var/spool/cron/crontabs/', PATHS))
+        self.assertFalse(is_requested_path('/etc', PATHS))
+        self.assertFalse(get_probe_name('/etc/shadow').startswith('/'))
+        self.assertTrue(get_probe_name('/etc/shadow').startswith(PROBE_FILES_DIR + '/'))
+
+
+class ExecScriptTest(unittest.TestCase):
+    """ build_exec_script run by the local sh """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='dfprobe_test_')
+        with open(os.path.join(self.tmp, 'passwd'), 'wb') as f:
+            f.write(b'root:x:0:0::/root:/bin/sh\n')
+        os.makedirs(os.path.join(self.tmp, 'crontabs'))
+        with open(os.path.join(self.tmp, 'crontabs', 'root'), 'wb') as f:
+            f.write(b'* * * * * id\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_round_trip(self):
+        paths = [os.path.join(self.tmp, x) for x in ('passwd', 'missing', 'crontabs')]
+        script = build_exec_script(paths, BOUNDARY)
+        data = subprocess.run(['sh', '-c', script], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL).stdout
+        result = parse_exec_output(data, BOUNDARY, paths)
+        self.assertEqual(result['files'], {
+            paths[0]: b'root:x:0:0::/root:/bin/sh\n',
+            os.path.join(self.tmp, 'crontabs', 'root'): b'* * * * * id\n',
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
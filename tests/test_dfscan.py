@@ -0,0 +1,182 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+__author__  = "Kim, Taehoon(kimfrancesco@gmail.com)"
+
+
+import os
+import sys
+import stat
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dfscan import build_layer_scanner, list_regular_files, ChangedFileDetector, LayerScanner, \
+                   AUFS_OPAQUE_MARKER, OVERLAY_OPAQUE_XATTR
+
+
+def make_file(root, relpath, data=b''):
+    os.makedirs(os.path.dirname(root + relpath), exist_ok=True)
+    with open(root + relpath, 'wb') as f:
+        f.write(data)
+
+
+def make_whiteout(root, relpath):
+    os.makedirs(os.path.dirname(root + relpath), exist_ok=True)
+    os.mknod(root + relpath, 0o600 | stat.S_IFCHR, os.makedev(0, 0))
+
+
+def make_opaque(root, relpath):
+    os.makedirs(root + relpath, exist_ok=True)
+    os.setxattr(root + relpath, OVERLAY_OPAQUE_XATTR, b'y', follow_symlinks=False)
+
+
+def without_atime(items):
+    """ Index entries minus st_atime_ns, which scanning a directory updates """
+    return [(x, y._replace(st_atime_ns=0)) for x, y in items]
+
+
+def supports_overlay_markers():
+    """ mknod and trusted.* xattrs need root (CAP_MKNOD, CAP_SYS_ADMIN) """
+    tmp = tempfile.mkdtemp(prefix='dfscan_probe_')
+    try:
+        make_whiteout(tmp, '/wh')
+        make_opaque(tmp, '/opq')
+        return True
+    except OSError:
+        return False
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+class LayerScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='dfscan_test_')
+        self.root = os.path.join(self.tmp, 'diff')
+        os.makedirs(self.root)
+        # wide and deep enough for workers to steal directories from each other
+        self.files = []
+        for i in range(400):
+            relpath = '/d{}/e{}/f{}'.format(i % 7, i % 11, i)
+            make_file(self.root, relpath, b'x' * (i % 5))
+            self.files.append(relpath)
+        make_file(self.root, '/d1/.hidden/payload')
+        make_file(self.root, '/d2/ spaced/payload')
+        os.symlink('/etc/passwd', self.root + '/d3/link')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def scan(self, workers, **kwargs):
+        scanner = build_layer_scanner(self.root, workers=workers, **kwargs).scan()
+        self.addCleanup(scanner.close)
+        return scanner
+
+    def test_results_do_not_depend_on_workers(self):
+        single = self.scan(1)
+        for workers in (2, 4, 16):
+            scanner = self.scan(workers)
+            self.assertEqual(scanner.visited, single.visited)
+            self.assertEqual(without_atime(scanner.get('changed').items()),
+                             without_atime(single.get('changed').items()))
+            self.assertEqual([x.relpath for x in scanner.get('hidden').results],
+                             [x.relpath for x in single.get('hidden').results])
+
+    def test_every_entry_is_visited_once(self):
+        scanner = self.scan(4)
+        dirs = {os.path.dirname(x) for x in self.files}
+        dirs |= {os.path.dirname(x) for x in dirs}
+        expected = set(self.files) | dirs | {'/d1/.hidden', '/d1/.hidden/payload',
+                    '/d2/ spaced', '/d2/ spaced/payload', '/d3/link'}
+        relpaths = [x for x, y in scanner.get('changed').items()]
+        self.assertEqual(relpaths, sorted(expected))
+        self.assertEqual(scanner.visited, len(expected))
+        self.assertTrue(stat.S_ISLNK(scanner.get('changed').lookup('/d3/link').st_mode))
+
+    def test_hidden_dirs(self):
+        scanner = self.scan(4)
+        self.assertEqual([x.relpath for x in scanner.get('hidden').results], ['/d1/.hidden', '/d2/ spaced'])
+
+    def test_regular_files(self):
+        self.assertEqual([x.relpath for x in list_regular_files(self.root, 4)],
+                         sorted(self.files + ['/d1/.hidden/payload', '/d2/ spaced/payload']))
+
+    def test_unreadable_directory(self):
+        scanner = LayerScanner(os.path.join(self.tmp, 'missing'), [ChangedFileDetector()], 4).scan()
+        self.assertEqual(scanner.visited, 0)
+        self.assertEqual(len(scanner.errors), 1)
+
+
+class ChangedFileDetectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='dfscan_test_')
+        self.root = os.path.join(self.tmp, 'diff')
+        for i in range(50):
+            make_file(self.root, '/d{}/f{}'.format(i % 3, i), b'y' * i)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_spilled_index_matches_memory(self):
+        in_memory = build_layer_scanner(self.root, workers=4).scan()
+        spilled = build_layer_scanner(self.root, workers=4, max_memory=8, spill_dir=self.tmp).scan()
+        index = spilled.get('changed')
+        self.assertIsNotNone(index.db_path)
+        self.assertEqual(without_atime(index.items()), without_atime(in_memory.get('changed').items()))
+        self.assertEqual(len(index), 53)
+        self.assertEqual(index.lookup('/d1/f10').st_size, 10)
+        self.assertIsNone(index.lookup('/d1/missing'))
+
+        db_path = index.db_path
+        spilled.close()
+        in_memory.close()
+        self.assertFalse(os.path.exists(db_path))
+
+
+@unittest.skipUnless(supports_overlay_markers(), 'whiteouts and opaque xattrs need root')
+class OverlayDetectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='dfscan_test_')
+        make_file(self.tmp, '/etc/passwd')
+        make_whiteout(self.tmp, '/etc/shadow')
+        make_whiteout(self.tmp, '/var/lib/gone')
+        make_opaque(self.tmp, '/opt/app')
+        make_file(self.tmp, '/opt/app/new')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_whiteouts_and_opaque_dirs(self):
+        scanner = build_layer_scanner(self.tmp, workers=4).scan()
+        self.addCleanup(scanner.close)
+        self.assertEqual([x.relpath for x in scanner.get('whiteout').results], ['/etc/shadow', '/var/lib/gone'])
+        self.assertEqual([x.relpath for x in scanner.get('opaque').results], ['/opt/app'])
+
+
+class AufsDetectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='dfscan_test_')
+        make_file(self.tmp, '/etc/passwd')
+        make_file(self.tmp, '/etc/.wh.shadow')
+        os.makedirs(self.tmp + '/var/.wh.cache')
+        make_file(self.tmp, '/opt/app/' + AUFS_OPAQUE_MARKER)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_whiteouts_and_opaque_dirs(self):
+        scanner = build_layer_scanner(self.tmp, aufs=True, workers=4).scan()
+        self.addCleanup(scanner.close)
+        self.assertEqual([x.relpath for x in scanner.get('whiteout').results],
+                         ['/etc/.wh.shadow', '/opt/app/' + AUFS_OPAQUE_MARKER, '/var/.wh.cache'])
+        self.assertEqual([x.relpath for x in scanner.get('opaque').results],
+                         ['/opt/app/' + AUFS_OPAQUE_MARKER])
+
+
+if __name__ == '__main__':
+    unittest.main()